@@ -0,0 +1,148 @@
+import asyncio
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+
+import asyncpg
+from fastapi import HTTPException
+from app.database.config import DATABASE_CONFIG, POOL_CONFIG
+from app.utils.request_stats import record_acquire, record_commit, record_query
+
+def _timed(method):
+    async def wrapper(self, query, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await method(self, query, *args, **kwargs)
+        finally:
+            # ``Transaction`` commits by executing this exact statement.
+            (record_commit if query == "COMMIT;" else record_query)(time.perf_counter() - started)
+    return wrapper
+
+class InstrumentedConnection(asyncpg.Connection):
+    """asyncpg connection whose statements and commits report their time to the current request's stats."""
+    execute = _timed(asyncpg.Connection.execute)
+    executemany = _timed(asyncpg.Connection.executemany)
+    fetch = _timed(asyncpg.Connection.fetch)
+    fetchrow = _timed(asyncpg.Connection.fetchrow)
+    fetchval = _timed(asyncpg.Connection.fetchval)
+
+class AsyncConnectionPool:
+    """asyncpg pool plus the same usage metrics the sync pool exposes.
+
+    Waiting on a connection here suspends the coroutine rather than parking a
+    threadpool worker, so a single event loop can keep thousands of requests
+    in flight while only ``max_size`` of them hold a connection at once.
+    """
+
+    def __init__(self, connect_kwargs, min_size=2, max_size=20, checkout_timeout=5.0, health_check_after=30.0):
+        self.connect_kwargs = dict(connect_kwargs)
+        if self.connect_kwargs.get("port"):
+            self.connect_kwargs["port"] = int(self.connect_kwargs["port"])
+        self.min_size = min_size
+        self.max_size = max_size
+        self.checkout_timeout = checkout_timeout
+        self.health_check_after = health_check_after
+        self._pool = None
+
+        self._in_use = 0
+        self._waiting = 0
+        self._checkouts = 0
+        self._timeouts = 0
+        self._checkout_seconds_total = 0.0
+        self._checkout_seconds_max = 0.0
+        self._recent_checkout_seconds = deque(maxlen=1024)
+
+    async def open(self):
+        if self._pool is None:
+            self._pool = await asyncpg.create_pool(
+                min_size=self.min_size,
+                max_size=self.max_size,
+                # asyncpg has no checkout ping; instead it closes connections idle longer than this.
+                max_inactive_connection_lifetime=self.health_check_after,
+                connection_class=InstrumentedConnection,
+                **self.connect_kwargs,
+            )
+
+    async def close(self, timeout=10.0):
+        """Waits up to ``timeout`` seconds for checked-out connections to come back, then closes the rest."""
+        if self._pool is not None:
+            pool, self._pool = self._pool, None
+            try:
+                await asyncio.wait_for(pool.close(), timeout)
+            except asyncio.TimeoutError:
+                print(f"❌ {self._in_use} connections still in use after {timeout}s, terminating them")
+                pool.terminate()
+
+    async def acquire(self, timeout=None):
+        if self._pool is None:
+            await self.open()
+        timeout = self.checkout_timeout if timeout is None else timeout
+        started = time.monotonic()
+        self._waiting += 1
+        try:
+            conn = await self._pool.acquire(timeout=timeout)
+        except asyncio.TimeoutError:
+            self._timeouts += 1
+            raise
+        finally:
+            self._waiting -= 1
+
+        elapsed = time.monotonic() - started
+        record_acquire(elapsed)
+        self._in_use += 1
+        self._checkouts += 1
+        self._checkout_seconds_total += elapsed
+        self._checkout_seconds_max = max(self._checkout_seconds_max, elapsed)
+        self._recent_checkout_seconds.append(elapsed)
+        return conn
+
+    async def release(self, conn):
+        self._in_use -= 1
+        await self._pool.release(conn)
+
+    @asynccontextmanager
+    async def connection(self, timeout=None):
+        """Context manager form of acquire/release for code outside request dependencies."""
+        conn = await self.acquire(timeout)
+        try:
+            yield conn
+        finally:
+            await self.release(conn)
+
+    def stats(self):
+        recent = sorted(self._recent_checkout_seconds)
+        p99 = recent[min(len(recent) - 1, int(len(recent) * 0.99))] if recent else 0.0
+        return {
+            "min_size": self.min_size,
+            "max_size": self.max_size,
+            "size": self._pool.get_size() if self._pool else 0,
+            "in_use": self._in_use,
+            "idle": self._pool.get_idle_size() if self._pool else 0,
+            "waiting": self._waiting,
+            "checkouts": self._checkouts,
+            "timeouts": self._timeouts,
+            "checkout_ms_avg": round(1000 * self._checkout_seconds_total / self._checkouts, 3) if self._checkouts else 0.0,
+            "checkout_ms_p99": round(1000 * p99, 3),
+            "checkout_ms_max": round(1000 * self._checkout_seconds_max, 3),
+        }
+
+async_db_pool = AsyncConnectionPool(DATABASE_CONFIG, **POOL_CONFIG)
+
+async def get_async_db():
+    """FastAPI dependency: async counterpart of ``get_db`` for ``async def`` routes."""
+    try:
+        conn = await async_db_pool.acquire()
+    except asyncio.TimeoutError:
+        print("❌ Async database pool exhausted")
+        raise HTTPException(status_code=503, detail="Database is busy, please retry")
+    except Exception as e:
+        print(f"❌ Database connection error: {e}")
+        raise HTTPException(status_code=500, detail="Database connection failed")
+
+    try:
+        yield conn
+    finally:
+        await async_db_pool.release(conn)
+
+# Same checkout and error handling as the dependency, for routes that only sometimes need a connection.
+async_db_connection = asynccontextmanager(get_async_db)
@@ -0,0 +1,314 @@
+"""Bulk import of users and riders from CSV or NDJSON.
+
+Each batch of records is validated, COPYed into a temporary staging table
+and merged into the real table with one ``INSERT ... SELECT ... ON
+CONFLICT``, then committed, so an interrupted import can simply be re-run.
+Passwords are hashed across a process pool, and in ``skip`` mode users that
+already exist are filtered out before hashing.
+
+    python -m app.database.bulk_import users users.csv
+    python -m app.database.bulk_import riders riders.ndjson --on-conflict update
+
+Users need ``name``, ``phone_number`` and either ``password`` or a bcrypt
+``password_hash`` (optional ``is_admin``). Riders need ``vehicle_type``,
+``license_plate`` and either ``user_id`` or ``user_phone_number`` (optional
+``status``, ``latitude``, ``longitude``).
+"""
+import argparse
+import csv
+import io
+import itertools
+import json
+import math
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from app.database.db import get_db_connection
+from app.services.rider_registry import RIDER_CHANGES_CHANNEL, chunked_payloads
+from app.utils.auth import hash_password
+
+IMPORT_BATCH_SIZE = int(os.getenv("BULK_IMPORT_BATCH_SIZE", "5000"))
+IMPORT_HASH_WORKERS = int(os.getenv("BULK_IMPORT_HASH_WORKERS", str(os.cpu_count() or 2)))
+MAX_REPORTED_ERRORS = 20
+PG_INT_MAX = 2**31 - 1
+
+def read_records(lines, record_format):
+    """Yields ``(line_number, record)`` pairs; ``record`` is None for an unparseable line."""
+    if record_format == "csv":
+        reader = csv.DictReader(lines)
+        for record in reader:
+            yield reader.line_num, record
+        return
+
+    for line_number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            record = None
+        yield line_number, record if isinstance(record, dict) else None
+
+def _new_report(table, on_conflict):
+    return {
+        "table": table,
+        "on_conflict": on_conflict,
+        "rows_read": 0,
+        "inserted": 0,
+        "updated": 0,
+        "skipped_existing": 0,
+        "duplicates_in_input": 0,
+        "invalid": 0,
+        "errors": [],
+        "seconds": 0.0,
+        "rows_per_second": 0.0,
+    }
+
+def _reject(report, line_number, message):
+    report["invalid"] += 1
+    if len(report["errors"]) < MAX_REPORTED_ERRORS:
+        report["errors"].append({"line": line_number, "error": message})
+
+def _text(record, field, max_length=None):
+    value = record.get(field)
+    value = "" if value is None else str(value).strip()
+    if max_length is not None and len(value) > max_length:
+        raise ValueError(f"{field} is longer than {max_length} characters")
+    return value or None
+
+def _number(record, field, cast, low=None, high=None):
+    value = _text(record, field)
+    if value is None:
+        return None
+    number = cast(value)
+    # NaN passes any range check and Postgres would store it (or inf) as is.
+    if not math.isfinite(number):
+        raise ValueError(f"{field} must be a finite number")
+    if (low is not None and number < low) or (high is not None and number > high):
+        raise ValueError(f"{field} must be between {low} and {high}")
+    return number
+
+def _clean_user(record):
+    name = _text(record, "name", 100)
+    phone_number = _text(record, "phone_number", 20)
+    password = _text(record, "password")
+    password_hash = _text(record, "password_hash")
+    if not name or not phone_number:
+        raise ValueError("name and phone_number are required")
+    if password_hash is not None and not password_hash.startswith("$2"):
+        raise ValueError("password_hash must be a bcrypt hash")
+    if password is None and password_hash is None:
+        raise ValueError("password or password_hash is required")
+    is_admin = (_text(record, "is_admin") or "false").lower() in ("1", "true", "t", "yes")
+    return name, phone_number, password, password_hash, is_admin
+
+def _clean_rider(record):
+    user_id = _number(record, "user_id", int, 1, PG_INT_MAX)
+    user_phone_number = _text(record, "user_phone_number", 20)
+    vehicle_type = _text(record, "vehicle_type", 50)
+    license_plate = _text(record, "license_plate", 20)
+    status = _text(record, "status", 20) or "Available"
+    latitude = _number(record, "latitude", float, -90, 90)
+    longitude = _number(record, "longitude", float, -180, 180)
+    if user_id is None and user_phone_number is None:
+        raise ValueError("user_id or user_phone_number is required")
+    if not vehicle_type or not license_plate:
+        raise ValueError("vehicle_type and license_plate are required")
+    if (latitude is None) != (longitude is None):
+        raise ValueError("latitude and longitude must be given together")
+    return user_id, user_phone_number, vehicle_type, license_plate, status, latitude, longitude
+
+def _copy_rows(cursor, table, columns, rows):
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    buffer.seek(0)
+    # Unquoted empty CSV fields load as NULL, which is what None is written as.
+    cursor.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", buffer)
+
+def _dedupe(chunk, clean, key_index, report):
+    """Validates a batch, keeping the last record for each key."""
+    rows = {}
+    for line_number, record in chunk:
+        if record is None:
+            _reject(report, line_number, "Malformed record")
+            continue
+        try:
+            row = clean(record)
+        except (ValueError, TypeError) as e:
+            _reject(report, line_number, str(e))
+            continue
+        if row[key_index] in rows:
+            report["duplicates_in_input"] += 1
+        rows[row[key_index]] = (line_number, row)
+    return rows
+
+def _import_user_batch(cursor, chunk, on_conflict, executor, report):
+    users = _dedupe(chunk, _clean_user, 1, report)
+
+    if on_conflict == "skip" and users:
+        # Existing users would be skipped anyway; dropping them here saves their bcrypt time.
+        cursor.execute("SELECT phone_number FROM users WHERE phone_number = ANY(%s)", (list(users),))
+        for (phone_number,) in cursor.fetchall():
+            del users[phone_number]
+            report["skipped_existing"] += 1
+    if not users:
+        return
+
+    plain = [row[2] for _, row in users.values() if row[3] is None]
+    hashed = iter(executor.map(hash_password, plain, chunksize=16) if executor else map(hash_password, plain))
+    staged = [
+        (name, phone_number, password_hash if password_hash is not None else next(hashed), is_admin)
+        for _, (name, phone_number, _password, password_hash, is_admin) in users.values()
+    ]
+
+    _copy_rows(cursor, "import_users", ("name", "phone_number", "password", "is_admin"), staged)
+    conflict = "DO NOTHING" if on_conflict == "skip" else "DO UPDATE SET name = EXCLUDED.name, password = EXCLUDED.password, is_admin = EXCLUDED.is_admin"
+    cursor.execute(f"""
+        INSERT INTO users (name, phone_number, password, is_admin)
+        SELECT name, phone_number, password, is_admin FROM import_users
+        ON CONFLICT (phone_number) {conflict}
+        RETURNING (xmax = 0) AS inserted
+    """)
+    results = [row[0] for row in cursor.fetchall()]
+    report["inserted"] += sum(results)
+    report["updated"] += len(results) - sum(results)
+    report["skipped_existing"] += len(staged) - len(results)
+
+def _import_rider_batch(cursor, chunk, on_conflict, executor, report):
+    riders = _dedupe(chunk, _clean_rider, 3, report)
+    if not riders:
+        return
+
+    _copy_rows(
+        cursor, "import_riders",
+        ("line", "user_id", "user_phone_number", "vehicle_type", "license_plate", "status", "latitude", "longitude"),
+        [(line_number, *row) for line_number, row in riders.values()],
+    )
+    cursor.execute("""
+        UPDATE import_riders AS s SET user_id = u.id
+        FROM users AS u
+        WHERE s.user_id IS NULL AND u.phone_number = s.user_phone_number
+    """)
+    cursor.execute("""
+        SELECT s.line FROM import_riders AS s
+        LEFT JOIN users AS u ON u.id = s.user_id
+        WHERE u.id IS NULL ORDER BY s.line
+    """)
+    missing = [row[0] for row in cursor.fetchall()]
+    for line_number in missing:
+        _reject(report, line_number, "Unknown user")
+
+    conflict = "DO NOTHING" if on_conflict == "skip" else """DO UPDATE SET
+        user_id = EXCLUDED.user_id,
+        vehicle_type = EXCLUDED.vehicle_type,
+        latitude = COALESCE(EXCLUDED.latitude, riders.latitude),
+        longitude = COALESCE(EXCLUDED.longitude, riders.longitude)"""
+    cursor.execute(f"""
+        INSERT INTO riders (user_id, vehicle_type, license_plate, status, latitude, longitude)
+        SELECT s.user_id, s.vehicle_type, s.license_plate, s.status, s.latitude, s.longitude
+        FROM import_riders AS s JOIN users AS u ON u.id = s.user_id
+        ON CONFLICT (license_plate) {conflict}
+        RETURNING id, status, vehicle_type, latitude, longitude, user_id, (xmax = 0) AS inserted
+    """)
+    results = cursor.fetchall()
+    inserted = sum(1 for row in results if row[6])
+    report["inserted"] += inserted
+    report["updated"] += len(results) - inserted
+    report["skipped_existing"] += len(riders) - len(missing) - len(results)
+
+    # Running app workers learn about the riders when this batch commits.
+    payloads = chunked_payloads("riders", [list(row[:6]) for row in results])
+    if payloads:
+        cursor.execute("SELECT pg_notify(%s, payload) FROM unnest(%s::text[]) AS payload", (RIDER_CHANGES_CHANNEL, payloads))
+
+STAGING_TABLES = {
+    "users": "CREATE TEMP TABLE import_users (name TEXT, phone_number TEXT, password TEXT, is_admin BOOLEAN) ON COMMIT DELETE ROWS",
+    "riders": """
+        CREATE TEMP TABLE import_riders (
+            line INTEGER, user_id INTEGER, user_phone_number TEXT, vehicle_type TEXT,
+            license_plate TEXT, status TEXT, latitude DOUBLE PRECISION, longitude DOUBLE PRECISION
+        ) ON COMMIT DELETE ROWS
+    """,
+}
+BATCH_IMPORTERS = {"users": _import_user_batch, "riders": _import_rider_batch}
+
+def import_records(conn, table, records, on_conflict="skip", batch_size=IMPORT_BATCH_SIZE, hash_workers=IMPORT_HASH_WORKERS):
+    """Imports ``(line_number, record)`` pairs into ``users`` or ``riders`` and returns a summary report."""
+    if table not in BATCH_IMPORTERS:
+        raise ValueError(f"Cannot import into {table}")
+    if on_conflict not in ("skip", "update"):
+        raise ValueError("on_conflict must be 'skip' or 'update'")
+
+    report = _new_report(table, on_conflict)
+    started = time.perf_counter()
+    executor = None
+    if table == "users" and hash_workers > 1:
+        executor = ProcessPoolExecutor(max_workers=hash_workers, mp_context=multiprocessing.get_context("spawn"))
+
+    cursor = conn.cursor()
+    try:
+        cursor.execute(STAGING_TABLES[table])
+        conn.commit()
+        records = iter(records)
+        while True:
+            chunk = list(itertools.islice(records, batch_size))
+            if not chunk:
+                break
+            report["rows_read"] += len(chunk)
+            try:
+                BATCH_IMPORTERS[table](cursor, chunk, on_conflict, executor, report)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+    finally:
+        cursor.close()
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    report["seconds"] = round(time.perf_counter() - started, 3)
+    report["rows_per_second"] = round(report["rows_read"] / report["seconds"], 1) if report["seconds"] else 0.0
+    return report
+
+def run_import(table, lines, record_format, on_conflict="skip", batch_size=IMPORT_BATCH_SIZE, hash_workers=IMPORT_HASH_WORKERS):
+    """Opens a dedicated connection (imports can run for minutes) and imports ``lines``."""
+    conn = get_db_connection()
+    if not conn:
+        raise RuntimeError("Database connection failed")
+    try:
+        return import_records(conn, table, read_records(lines, record_format), on_conflict, batch_size, hash_workers)
+    finally:
+        conn.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk import users or riders from CSV or NDJSON.")
+    parser.add_argument("table", choices=sorted(BATCH_IMPORTERS))
+    parser.add_argument("path", help="Input file, or - for stdin")
+    parser.add_argument("--format", choices=["csv", "ndjson"], help="Defaults to the file extension (csv otherwise)")
+    parser.add_argument("--on-conflict", choices=["skip", "update"], default="skip")
+    parser.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE)
+    parser.add_argument("--hash-workers", type=int, default=IMPORT_HASH_WORKERS)
+    args = parser.parse_args()
+
+    record_format = args.format or ("ndjson" if args.path.endswith((".ndjson", ".jsonl")) else "csv")
+    lines = sys.stdin if args.path == "-" else open(args.path, newline="", encoding="utf-8")
+    try:
+        report = run_import(args.table, lines, record_format, args.on_conflict, args.batch_size, args.hash_workers)
+    except Exception as e:
+        print(f"❌ Import failed: {e}")
+        sys.exit(1)
+    finally:
+        if lines is not sys.stdin:
+            lines.close()
+
+    print(f"✅ Imported {args.table}: {report['inserted']} inserted, {report['updated']} updated, "
+          f"{report['skipped_existing']} skipped, {report['invalid']} invalid in {report['seconds']}s "
+          f"({report['rows_per_second']} rows/s)")
+    for error in report["errors"]:
+        print(f"❌ line {error['line']}: {error['error']}")
+
+if __name__ == "__main__":
+    main()
@@ -10,3 +10,12 @@ DATABASE_CONFIG = {
     "password": os.getenv("DB_PASSWORD"),
     "database": os.getenv("DB_NAME"),
 }
+
+POOL_CONFIG = {
+    "min_size": int(os.getenv("DB_POOL_MIN_SIZE", "2")),
+    "max_size": int(os.getenv("DB_POOL_MAX_SIZE", "20")),
+    # Seconds a request may wait for a free connection before giving up.
+    "checkout_timeout": float(os.getenv("DB_POOL_CHECKOUT_TIMEOUT", "5")),
+    # Idle connections older than this are pinged with SELECT 1 on checkout.
+    "health_check_after": float(os.getenv("DB_POOL_HEALTH_CHECK_AFTER", "30")),
+}
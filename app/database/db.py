@@ -1,10 +1,263 @@
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
 import psycopg2
-from app.database.config import DATABASE_CONFIG
+import psycopg2.extensions
+from fastapi import HTTPException
+from app.database.config import DATABASE_CONFIG, POOL_CONFIG
+from app.utils.request_stats import record_acquire, record_commit, record_query
+
+_instrumented_cursor_classes = {}
+
+def _instrumented_cursor(cursor_class):
+    """Subclass of ``cursor_class`` (plain, RealDictCursor, ...) that times each statement."""
+    instrumented = _instrumented_cursor_classes.get(cursor_class)
+    if instrumented is None:
+        def timed(method):
+            def wrapper(self, *args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return method(self, *args, **kwargs)
+                finally:
+                    record_query(time.perf_counter() - started)
+            return wrapper
+
+        instrumented = type(f"Instrumented{cursor_class.__name__}", (cursor_class,), {
+            name: timed(getattr(cursor_class, name)) for name in ("execute", "executemany", "callproc", "copy_expert")
+        })
+        _instrumented_cursor_classes[cursor_class] = instrumented
+    return instrumented
+
+class InstrumentedConnection(psycopg2.extensions.connection):
+    """psycopg2 connection whose cursors and commits report their time to the current request's stats."""
+
+    def cursor(self, *args, **kwargs):
+        cursor_class = kwargs.get("cursor_factory") or self.cursor_factory or psycopg2.extensions.cursor
+        kwargs["cursor_factory"] = _instrumented_cursor(cursor_class)
+        return super().cursor(*args, **kwargs)
+
+    def commit(self):
+        started = time.perf_counter()
+        try:
+            super().commit()
+        finally:
+            record_commit(time.perf_counter() - started)
 
 def get_db_connection():
+    """Opens a standalone connection (for scripts and one-off maintenance, not request handlers)."""
     try:
-        conn = psycopg2.connect(**DATABASE_CONFIG)
+        started = time.perf_counter()
+        conn = psycopg2.connect(**DATABASE_CONFIG, connection_factory=InstrumentedConnection)
+        record_acquire(time.perf_counter() - started)
         return conn
     except Exception as e:
         print(f"❌ Database connection error: {e}")
         return None
+
+class PoolTimeoutError(Exception):
+    """Raised when no pooled connection became free within the checkout timeout."""
+
+class ConnectionPool:
+    """Thread-safe bounded pool of psycopg2 connections.
+
+    Callers block (up to ``checkout_timeout``) when every connection is in use
+    instead of failing immediately, idle connections are health-checked before
+    being handed out, and checkout latency is tracked for the metrics endpoint.
+    """
+
+    def __init__(self, connect_kwargs, min_size=2, max_size=20, checkout_timeout=5.0, health_check_after=30.0):
+        if min_size < 0 or max_size < 1 or min_size > max_size:
+            raise ValueError("Pool size must satisfy 0 <= min_size <= max_size and max_size >= 1")
+        self.connect_kwargs = connect_kwargs
+        self.min_size = min_size
+        self.max_size = max_size
+        self.checkout_timeout = checkout_timeout
+        self.health_check_after = health_check_after
+
+        self._cond = threading.Condition()
+        self._idle = deque()  # (conn, returned_at)
+        self._size = 0
+        self._in_use = 0
+        self._waiting = 0
+        self._closed = False
+
+        self._checkouts = 0
+        self._timeouts = 0
+        self._discarded = 0
+        self._checkout_seconds_total = 0.0
+        self._checkout_seconds_max = 0.0
+        self._recent_checkout_seconds = deque(maxlen=1024)
+
+    def _connect(self):
+        return psycopg2.connect(**self.connect_kwargs, connection_factory=InstrumentedConnection)
+
+    def open(self):
+        """Pre-opens ``min_size`` connections so the first requests skip the handshake."""
+        with self._cond:
+            self._closed = False
+            missing = self.min_size - self._size
+            self._size += max(missing, 0)
+        for _ in range(max(missing, 0)):
+            try:
+                conn = self._connect()
+            except Exception:
+                with self._cond:
+                    self._size -= 1
+                raise
+            with self._cond:
+                self._idle.append((conn, time.monotonic()))
+                self._cond.notify()
+
+    def _is_healthy(self, conn, returned_at):
+        if conn.closed:
+            return False
+        if time.monotonic() - returned_at < self.health_check_after:
+            return True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+        with self._cond:
+            self._size -= 1
+            self._discarded += 1
+            self._cond.notify()
+
+    def getconn(self, timeout=None):
+        """Checks a connection out of the pool, opening a new one if below ``max_size``."""
+        timeout = self.checkout_timeout if timeout is None else timeout
+        started = time.monotonic()
+        deadline = started + timeout
+
+        while True:
+            conn = None
+            returned_at = None
+            with self._cond:
+                if self._closed:
+                    raise PoolTimeoutError("Connection pool is closed")
+                while not self._idle and self._size >= self.max_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._timeouts += 1
+                        raise PoolTimeoutError(f"No database connection available within {timeout}s")
+                    self._waiting += 1
+                    try:
+                        self._cond.wait(remaining)
+                    finally:
+                        self._waiting -= 1
+                if self._idle:
+                    conn, returned_at = self._idle.pop()
+                else:
+                    self._size += 1
+
+            if conn is None:
+                try:
+                    conn = self._connect()
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+            elif not self._is_healthy(conn, returned_at):
+                self._discard(conn)
+                continue
+
+            elapsed = time.monotonic() - started
+            record_acquire(elapsed)
+            with self._cond:
+                self._in_use += 1
+                self._checkouts += 1
+                self._checkout_seconds_total += elapsed
+                self._checkout_seconds_max = max(self._checkout_seconds_max, elapsed)
+                self._recent_checkout_seconds.append(elapsed)
+            return conn
+
+    def putconn(self, conn):
+        """Returns a connection, rolling back any transaction the caller left open."""
+        with self._cond:
+            self._in_use -= 1
+
+        if conn.closed or self._closed:
+            self._discard(conn)
+            return
+
+        if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                self._discard(conn)
+                return
+
+        with self._cond:
+            self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self, timeout=None):
+        """Context manager form of getconn/putconn for code outside request dependencies."""
+        conn = self.getconn(timeout)
+        try:
+            yield conn
+        finally:
+            self.putconn(conn)
+
+    def closeall(self):
+        """Closes idle connections; connections still checked out are closed when returned."""
+        with self._cond:
+            self._closed = True
+            idle = list(self._idle)
+            self._idle.clear()
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for conn, _ in idle:
+            try:
+                conn.close()
+            except psycopg2.Error:
+                pass
+
+    def stats(self):
+        with self._cond:
+            recent = sorted(self._recent_checkout_seconds)
+            p99 = recent[min(len(recent) - 1, int(len(recent) * 0.99))] if recent else 0.0
+            return {
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+                "size": self._size,
+                "in_use": self._in_use,
+                "idle": len(self._idle),
+                "waiting": self._waiting,
+                "checkouts": self._checkouts,
+                "timeouts": self._timeouts,
+                "discarded": self._discarded,
+                "checkout_ms_avg": round(1000 * self._checkout_seconds_total / self._checkouts, 3) if self._checkouts else 0.0,
+                "checkout_ms_p99": round(1000 * p99, 3),
+                "checkout_ms_max": round(1000 * self._checkout_seconds_max, 3),
+            }
+
+db_pool = ConnectionPool(DATABASE_CONFIG, **POOL_CONFIG)
+
+def get_db():
+    """FastAPI dependency: lends a pooled connection to the route and returns it afterwards."""
+    try:
+        conn = db_pool.getconn()
+    except PoolTimeoutError as e:
+        print(f"❌ Database pool exhausted: {e}")
+        raise HTTPException(status_code=503, detail="Database is busy, please retry")
+    except Exception as e:
+        print(f"❌ Database connection error: {e}")
+        raise HTTPException(status_code=500, detail="Database connection failed")
+
+    try:
+        yield conn
+    finally:
+        db_pool.putconn(conn)
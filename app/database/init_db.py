@@ -1,62 +1,8 @@
-import psycopg2
-from psycopg2 import sql
+import argparse
 from app.database.db import get_db_connection
+from app.database.migrations import run_migrations
 from app.utils.auth import hash_password
 
-def create_tables():
-    conn = get_db_connection()
-    if not conn:
-        print("❌ Database connection failed!")
-        return
-
-    cursor = conn.cursor()
-    table_creation_queries = [
-        sql.SQL("""
-            CREATE TABLE IF NOT EXISTS users (
-                id SERIAL PRIMARY KEY,
-                name VARCHAR(100) NOT NULL,
-                phone_number VARCHAR(20) UNIQUE NOT NULL,
-                password TEXT NOT NULL,
-                is_admin BOOLEAN DEFAULT FALSE
-            );
-        """),
-        sql.SQL("""
-            CREATE TABLE IF NOT EXISTS riders (
-                id SERIAL PRIMARY KEY,
-                user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
-                vehicle_type VARCHAR(50) NOT NULL,
-                license_plate VARCHAR(20) UNIQUE NOT NULL,
-                status VARCHAR(20) DEFAULT 'Available'
-            );
-        """),
-        sql.SQL("""
-            CREATE TABLE IF NOT EXISTS bookings (
-                id SERIAL PRIMARY KEY,
-                user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
-                rider_id INTEGER REFERENCES riders(id) ON DELETE SET NULL,
-                status VARCHAR(20) DEFAULT 'Pending',
-                distance INTEGER NOT NULL,
-                fare INTEGER NOT NULL
-            );
-        """)
-    ]
-
-    try:
-        for query in table_creation_queries:
-            cursor.execute(query)
-
-        conn.commit()
-        print("✅ Database tables created successfully!")
-
-        seed_database(cursor, conn)
-
-    except Exception as e:
-        print(f"❌ Error creating tables: {e}")
-
-    finally:
-        cursor.close()
-        conn.close()
-
 def seed_database(cursor, conn):
     sample_users = [
         ("Nguyen Van A", "1111111111", hash_password("password123")),
@@ -67,11 +13,11 @@ def seed_database(cursor, conn):
     ]
 
     sample_riders = [
-        (1, "Swift", "59A1-12345"),
-        (2, "Mercedes", "59B1-67890"),
-        (3, "BMW", "51C-11223"),
-        (4, "Lord Alto", "51D-44556"),
-        (5, "Kawasaki Ninja", "51E-77889")
+        (1, "Swift", "59A1-12345", 10.7769, 106.7009),
+        (2, "Mercedes", "59B1-67890", 10.7626, 106.6602),
+        (3, "BMW", "51C-11223", 10.7998, 106.7176),
+        (4, "Lord Alto", "51D-44556", 10.7326, 106.7218),
+        (5, "Kawasaki Ninja", "51E-77889", 10.8231, 106.6297)
     ]
 
     try:
@@ -81,10 +27,10 @@ def seed_database(cursor, conn):
                 (name, phone_number, password),
             )
 
-        for user_id, vehicle_type, license_plate in sample_riders:
+        for user_id, vehicle_type, license_plate, latitude, longitude in sample_riders:
             cursor.execute(
-                "INSERT INTO riders (user_id, vehicle_type, license_plate) VALUES (%s, %s, %s) ON CONFLICT (license_plate) DO NOTHING",
-                (user_id, vehicle_type, license_plate),
+                "INSERT INTO riders (user_id, vehicle_type, license_plate, latitude, longitude) VALUES (%s, %s, %s, %s, %s) ON CONFLICT (license_plate) DO NOTHING",
+                (user_id, vehicle_type, license_plate, latitude, longitude),
             )
 
         conn.commit()
@@ -94,3 +40,28 @@ def seed_database(cursor, conn):
         conn.rollback()
         print(f"❌ Error seeding database: {e}")
 
+
+def initialize(seed=False):
+    """One-time setup per deployment: pending migrations, then optionally the sample data."""
+    run_migrations()
+
+    if seed:
+        conn = get_db_connection()
+        if not conn:
+            print("❌ Database connection failed!")
+            return
+        cursor = conn.cursor()
+        try:
+            seed_database(cursor, conn)
+        finally:
+            cursor.close()
+            conn.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Apply pending schema migrations and optionally load sample data.")
+    parser.add_argument("--seed", action="store_true", help="Insert the sample users and riders")
+    args = parser.parse_args()
+    initialize(seed=args.seed)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,496 @@
+import re
+from collections import namedtuple
+
+import psycopg2
+from psycopg2 import sql
+from app.database.db import get_db_connection
+
+# ``transactional=False`` migrations run in autocommit so they can use CREATE INDEX
+# CONCURRENTLY; their statements must be idempotent (IF NOT EXISTS) in case they are
+# interrupted and re-run. An interrupted concurrent build leaves an INVALID index that
+# IF NOT EXISTS would skip, so the runner drops such an index and builds it again.
+Migration = namedtuple("Migration", ["version", "name", "statements", "transactional"], defaults=[True])
+
+MIGRATIONS = [
+    Migration(1, "baseline schema", [
+        """
+        CREATE TABLE IF NOT EXISTS users (
+            id SERIAL PRIMARY KEY,
+            name VARCHAR(100) NOT NULL,
+            phone_number VARCHAR(20) UNIQUE NOT NULL,
+            password TEXT NOT NULL,
+            is_admin BOOLEAN DEFAULT FALSE
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS riders (
+            id SERIAL PRIMARY KEY,
+            user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
+            vehicle_type VARCHAR(50) NOT NULL,
+            license_plate VARCHAR(20) UNIQUE NOT NULL,
+            status VARCHAR(20) DEFAULT 'Available'
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS bookings (
+            id SERIAL PRIMARY KEY,
+            user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
+            rider_id INTEGER REFERENCES riders(id) ON DELETE SET NULL,
+            status VARCHAR(20) DEFAULT 'Pending',
+            distance INTEGER NOT NULL,
+            fare INTEGER NOT NULL
+        )
+        """,
+        # Columns added before migrations existed; IF NOT EXISTS adopts databases that already have them.
+        "ALTER TABLE riders ADD COLUMN IF NOT EXISTS latitude DOUBLE PRECISION",
+        "ALTER TABLE riders ADD COLUMN IF NOT EXISTS longitude DOUBLE PRECISION",
+        "ALTER TABLE bookings ADD COLUMN IF NOT EXISTS pickup_latitude DOUBLE PRECISION",
+        "ALTER TABLE bookings ADD COLUMN IF NOT EXISTS pickup_longitude DOUBLE PRECISION",
+    ]),
+    Migration(2, "one open booking per rider", [
+        """
+        CREATE UNIQUE INDEX IF NOT EXISTS bookings_one_open_per_rider
+        ON bookings (rider_id) WHERE status IN ('Pending', 'In Progress')
+        """,
+    ]),
+    Migration(3, "hot query indexes", [
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS riders_status_idx ON riders (status)",
+        # Matching and index rebuilds only ever look at available riders.
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS riders_available_idx ON riders (id) WHERE status = 'Available'",
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS bookings_user_id_idx ON bookings (user_id, id)",
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS bookings_rider_id_idx ON bookings (rider_id, id)",
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS bookings_status_idx ON bookings (status, id)",
+    ], transactional=False),
+    Migration(4, "rider location timestamps", [
+        # Lets batched GPS writes ignore pings older than the position already stored.
+        "ALTER TABLE riders ADD COLUMN IF NOT EXISTS location_updated_at TIMESTAMPTZ",
+    ]),
+    Migration(5, "idempotency keys", [
+        # One row per (user, Idempotency-Key); response stays NULL while the first request is running.
+        """
+        CREATE TABLE IF NOT EXISTS idempotency_keys (
+            user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+            key VARCHAR(255) NOT NULL,
+            fingerprint TEXT NOT NULL,
+            response JSONB,
+            created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+            PRIMARY KEY (user_id, key)
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idempotency_keys_created_at_idx ON idempotency_keys (created_at)",
+    ]),
+    Migration(6, "partition bookings by month", [
+        # Rebuilds bookings as a table range-partitioned on a new created_at column. Postgres
+        # cannot enforce a unique index across partitions, so "one open booking per rider"
+        # becomes a per-partition index here; migration 9 enforces it globally again.
+        # Existing rows have no creation time and all land in this month.
+        "ALTER SEQUENCE bookings_id_seq OWNED BY NONE",
+        "ALTER TABLE bookings RENAME TO bookings_unpartitioned",
+        "ALTER INDEX bookings_pkey RENAME TO bookings_unpartitioned_pkey",
+        "DROP INDEX IF EXISTS bookings_one_open_per_rider, bookings_user_id_idx, bookings_rider_id_idx, bookings_status_idx",
+        """
+        CREATE TABLE bookings (
+            id INTEGER NOT NULL DEFAULT nextval('bookings_id_seq'),
+            user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
+            rider_id INTEGER REFERENCES riders(id) ON DELETE SET NULL,
+            status VARCHAR(20) DEFAULT 'Pending',
+            distance INTEGER NOT NULL,
+            fare INTEGER NOT NULL,
+            pickup_latitude DOUBLE PRECISION,
+            pickup_longitude DOUBLE PRECISION,
+            created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+            PRIMARY KEY (id, created_at)
+        ) PARTITION BY RANGE (created_at)
+        """,
+        "ALTER SEQUENCE bookings_id_seq OWNED BY bookings.id",
+        # Finished rides past the retention window; whole monthly partitions are moved here.
+        """
+        CREATE TABLE bookings_archive (
+            id INTEGER NOT NULL,
+            user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
+            rider_id INTEGER REFERENCES riders(id) ON DELETE SET NULL,
+            status VARCHAR(20) DEFAULT 'Pending',
+            distance INTEGER NOT NULL,
+            fare INTEGER NOT NULL,
+            pickup_latitude DOUBLE PRECISION,
+            pickup_longitude DOUBLE PRECISION,
+            created_at TIMESTAMPTZ NOT NULL,
+            PRIMARY KEY (id, created_at)
+        ) PARTITION BY RANGE (created_at)
+        """,
+        # Creates the monthly partitions (bookings_YYYY_MM, UTC months) from the month of
+        # ``since`` through ``months_ahead`` months past the current one.
+        """
+        CREATE OR REPLACE FUNCTION ensure_booking_partitions(since TIMESTAMPTZ, months_ahead INTEGER) RETURNS INTEGER AS $$
+        DECLARE
+            month_start TIMESTAMP := date_trunc('month', since AT TIME ZONE 'UTC');
+            last_month TIMESTAMP := date_trunc('month', now() AT TIME ZONE 'UTC') + make_interval(months => months_ahead);
+            partition_name TEXT;
+            created INTEGER := 0;
+        BEGIN
+            PERFORM pg_advisory_xact_lock(725318002);
+            WHILE month_start <= last_month LOOP
+                partition_name := 'bookings_' || to_char(month_start, 'YYYY_MM');
+                IF to_regclass(partition_name) IS NULL THEN
+                    EXECUTE format(
+                        'CREATE TABLE %I PARTITION OF bookings FOR VALUES FROM (%L) TO (%L)',
+                        partition_name, month_start AT TIME ZONE 'UTC', (month_start + interval '1 month') AT TIME ZONE 'UTC'
+                    );
+                    EXECUTE format(
+                        'CREATE UNIQUE INDEX %I ON %I (rider_id) WHERE status IN (''Pending'', ''In Progress'')',
+                        partition_name || '_one_open_per_rider', partition_name
+                    );
+                    created := created + 1;
+                END IF;
+                month_start := month_start + interval '1 month';
+            END LOOP;
+            RETURN created;
+        END;
+        $$ LANGUAGE plpgsql
+        """,
+        # Moves monthly partitions that ended more than ``retention`` ago and hold no open
+        # rides from bookings to bookings_archive. Detach/attach moves no rows; the indexes
+        # only the hot table needs are dropped, leaving the archive with its primary key
+        # and the per-user index.
+        """
+        CREATE OR REPLACE FUNCTION archive_booking_partitions(retention INTERVAL) RETURNS INTEGER AS $$
+        DECLARE
+            partition_name TEXT;
+            month_start TIMESTAMP;
+            has_open BOOLEAN;
+            stale_index REGCLASS;
+            archived INTEGER := 0;
+        BEGIN
+            PERFORM pg_advisory_xact_lock(725318002);
+            FOR partition_name IN
+                SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+                WHERE i.inhparent = 'bookings'::regclass AND c.relname ~ '^bookings_[0-9]{4}_[0-9]{2}$'
+                ORDER BY c.relname
+            LOOP
+                month_start := make_timestamp(substr(partition_name, 10, 4)::int, substr(partition_name, 15, 2)::int, 1, 0, 0, 0);
+                EXIT WHEN (month_start + interval '1 month') AT TIME ZONE 'UTC' > now() - retention;
+
+                EXECUTE format('SELECT EXISTS (SELECT 1 FROM %I WHERE status NOT IN (''Completed'', ''Canceled''))', partition_name) INTO has_open;
+                CONTINUE WHEN has_open;
+
+                EXECUTE format('ALTER TABLE bookings DETACH PARTITION %I', partition_name);
+                EXECUTE format(
+                    'ALTER TABLE bookings_archive ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+                    partition_name, month_start AT TIME ZONE 'UTC', (month_start + interval '1 month') AT TIME ZONE 'UTC'
+                );
+                FOR stale_index IN
+                    SELECT x.indexrelid::regclass FROM pg_index x
+                    WHERE x.indrelid = partition_name::regclass
+                      AND NOT EXISTS (SELECT 1 FROM pg_inherits h WHERE h.inhrelid = x.indexrelid)
+                LOOP
+                    EXECUTE format('DROP INDEX %s', stale_index);
+                END LOOP;
+                archived := archived + 1;
+            END LOOP;
+            RETURN archived;
+        END;
+        $$ LANGUAGE plpgsql
+        """,
+        "SELECT ensure_booking_partitions(now(), 2)",
+        """
+        INSERT INTO bookings (id, user_id, rider_id, status, distance, fare, pickup_latitude, pickup_longitude, created_at)
+        SELECT id, user_id, rider_id, status, distance, fare, pickup_latitude, pickup_longitude, now()
+        FROM bookings_unpartitioned
+        """,
+        "DROP TABLE bookings_unpartitioned",
+        # Indexes on the partitioned parent cascade to every partition, current and future.
+        "CREATE INDEX bookings_user_id_idx ON bookings (user_id, id)",
+        "CREATE INDEX bookings_rider_id_idx ON bookings (rider_id, id)",
+        "CREATE INDEX bookings_status_idx ON bookings (status, id)",
+        "CREATE INDEX bookings_archive_user_id_idx ON bookings_archive (user_id, id)",
+    ]),
+    Migration(7, "rider and user statistics", [
+        # Lifetime totals per rider and per user, kept current by a trigger on bookings so
+        # reading them never aggregates the history. Every booking counts as a trip; fare and
+        # distance add up completed rides only. No foreign keys: deleting a rider nulls its
+        # bookings' rider_id, which the trigger turns into updates of a row that may already
+        # be gone. Archiving detaches whole partitions, which fires no triggers, so archived
+        # rides stay counted.
+        """
+        CREATE TABLE rider_stats (
+            rider_id INTEGER PRIMARY KEY,
+            trips INTEGER NOT NULL DEFAULT 0,
+            completed_trips INTEGER NOT NULL DEFAULT 0,
+            canceled_trips INTEGER NOT NULL DEFAULT 0,
+            total_fare BIGINT NOT NULL DEFAULT 0,
+            total_distance BIGINT NOT NULL DEFAULT 0,
+            updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        )
+        """,
+        """
+        CREATE TABLE user_stats (
+            user_id INTEGER PRIMARY KEY,
+            trips INTEGER NOT NULL DEFAULT 0,
+            completed_trips INTEGER NOT NULL DEFAULT 0,
+            canceled_trips INTEGER NOT NULL DEFAULT 0,
+            total_fare BIGINT NOT NULL DEFAULT 0,
+            total_distance BIGINT NOT NULL DEFAULT 0,
+            updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        )
+        """,
+        """
+        CREATE OR REPLACE FUNCTION bump_rider_stats(stats_key INTEGER, d_trips INTEGER, d_completed INTEGER, d_canceled INTEGER, d_fare BIGINT, d_distance BIGINT)
+        RETURNS VOID AS $$
+        BEGIN
+            IF stats_key IS NULL OR (d_trips = 0 AND d_completed = 0 AND d_canceled = 0 AND d_fare = 0 AND d_distance = 0) THEN
+                RETURN;
+            END IF;
+            INSERT INTO rider_stats AS s (rider_id, trips, completed_trips, canceled_trips, total_fare, total_distance)
+            VALUES (stats_key, d_trips, d_completed, d_canceled, d_fare, d_distance)
+            ON CONFLICT (rider_id) DO UPDATE SET
+                trips = s.trips + EXCLUDED.trips,
+                completed_trips = s.completed_trips + EXCLUDED.completed_trips,
+                canceled_trips = s.canceled_trips + EXCLUDED.canceled_trips,
+                total_fare = s.total_fare + EXCLUDED.total_fare,
+                total_distance = s.total_distance + EXCLUDED.total_distance,
+                updated_at = now();
+        END;
+        $$ LANGUAGE plpgsql
+        """,
+        """
+        CREATE OR REPLACE FUNCTION bump_user_stats(stats_key INTEGER, d_trips INTEGER, d_completed INTEGER, d_canceled INTEGER, d_fare BIGINT, d_distance BIGINT)
+        RETURNS VOID AS $$
+        BEGIN
+            IF stats_key IS NULL OR (d_trips = 0 AND d_completed = 0 AND d_canceled = 0 AND d_fare = 0 AND d_distance = 0) THEN
+                RETURN;
+            END IF;
+            INSERT INTO user_stats AS s (user_id, trips, completed_trips, canceled_trips, total_fare, total_distance)
+            VALUES (stats_key, d_trips, d_completed, d_canceled, d_fare, d_distance)
+            ON CONFLICT (user_id) DO UPDATE SET
+                trips = s.trips + EXCLUDED.trips,
+                completed_trips = s.completed_trips + EXCLUDED.completed_trips,
+                canceled_trips = s.canceled_trips + EXCLUDED.canceled_trips,
+                total_fare = s.total_fare + EXCLUDED.total_fare,
+                total_distance = s.total_distance + EXCLUDED.total_distance,
+                updated_at = now();
+        END;
+        $$ LANGUAGE plpgsql
+        """,
+        # A status change on an unchanged user and rider is one upsert per table; moving a
+        # booking to another rider (dispatch, rider deletion) takes it off one and onto the other.
+        """
+        CREATE OR REPLACE FUNCTION bookings_maintain_stats() RETURNS TRIGGER AS $$
+        DECLARE
+            old_completed INTEGER := 0;
+            old_canceled INTEGER := 0;
+            old_fare BIGINT := 0;
+            old_distance BIGINT := 0;
+            new_completed INTEGER := 0;
+            new_canceled INTEGER := 0;
+            new_fare BIGINT := 0;
+            new_distance BIGINT := 0;
+        BEGIN
+            IF TG_OP <> 'INSERT' THEN
+                old_completed := COALESCE(OLD.status = 'Completed', FALSE)::INTEGER;
+                old_canceled := COALESCE(OLD.status = 'Canceled', FALSE)::INTEGER;
+                old_fare := old_completed * OLD.fare;
+                old_distance := old_completed * OLD.distance;
+            END IF;
+            IF TG_OP <> 'DELETE' THEN
+                new_completed := COALESCE(NEW.status = 'Completed', FALSE)::INTEGER;
+                new_canceled := COALESCE(NEW.status = 'Canceled', FALSE)::INTEGER;
+                new_fare := new_completed * NEW.fare;
+                new_distance := new_completed * NEW.distance;
+            END IF;
+
+            IF TG_OP = 'UPDATE' AND OLD.user_id IS NOT DISTINCT FROM NEW.user_id THEN
+                PERFORM bump_user_stats(NEW.user_id, 0, new_completed - old_completed, new_canceled - old_canceled,
+                                        new_fare - old_fare, new_distance - old_distance);
+            ELSE
+                IF TG_OP <> 'INSERT' THEN
+                    PERFORM bump_user_stats(OLD.user_id, -1, -old_completed, -old_canceled, -old_fare, -old_distance);
+                END IF;
+                IF TG_OP <> 'DELETE' THEN
+                    PERFORM bump_user_stats(NEW.user_id, 1, new_completed, new_canceled, new_fare, new_distance);
+                END IF;
+            END IF;
+
+            IF TG_OP = 'UPDATE' AND OLD.rider_id IS NOT DISTINCT FROM NEW.rider_id THEN
+                PERFORM bump_rider_stats(NEW.rider_id, 0, new_completed - old_completed, new_canceled - old_canceled,
+                                         new_fare - old_fare, new_distance - old_distance);
+            ELSE
+                IF TG_OP <> 'INSERT' THEN
+                    PERFORM bump_rider_stats(OLD.rider_id, -1, -old_completed, -old_canceled, -old_fare, -old_distance);
+                END IF;
+                IF TG_OP <> 'DELETE' THEN
+                    PERFORM bump_rider_stats(NEW.rider_id, 1, new_completed, new_canceled, new_fare, new_distance);
+                END IF;
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+        """,
+        # Defined on the partitioned parent, so every partition, current and future, gets it.
+        """
+        CREATE TRIGGER bookings_maintain_stats
+        AFTER INSERT OR DELETE OR UPDATE OF user_id, rider_id, status, distance, fare ON bookings
+        FOR EACH ROW EXECUTE FUNCTION bookings_maintain_stats()
+        """,
+        # Recomputes both tables from the full history, live and archived; the migration
+        # backfills with it, and it repairs the totals after manual edits to the archive.
+        """
+        CREATE OR REPLACE FUNCTION refresh_booking_stats() RETURNS VOID AS $$
+        BEGIN
+            -- Holds off booking writes (not reads) until the transaction ends, so no delta is lost.
+            LOCK TABLE bookings, bookings_archive IN SHARE MODE;
+            DELETE FROM rider_stats;
+            DELETE FROM user_stats;
+            CREATE TEMP TABLE booking_stats_source AS
+                SELECT user_id, rider_id, status, distance, fare FROM bookings
+                UNION ALL
+                SELECT user_id, rider_id, status, distance, fare FROM bookings_archive;
+            INSERT INTO rider_stats (rider_id, trips, completed_trips, canceled_trips, total_fare, total_distance)
+                SELECT rider_id, count(*),
+                       count(*) FILTER (WHERE status = 'Completed'),
+                       count(*) FILTER (WHERE status = 'Canceled'),
+                       COALESCE(sum(fare) FILTER (WHERE status = 'Completed'), 0),
+                       COALESCE(sum(distance) FILTER (WHERE status = 'Completed'), 0)
+                FROM booking_stats_source WHERE rider_id IS NOT NULL GROUP BY rider_id;
+            INSERT INTO user_stats (user_id, trips, completed_trips, canceled_trips, total_fare, total_distance)
+                SELECT user_id, count(*),
+                       count(*) FILTER (WHERE status = 'Completed'),
+                       count(*) FILTER (WHERE status = 'Canceled'),
+                       COALESCE(sum(fare) FILTER (WHERE status = 'Completed'), 0),
+                       COALESCE(sum(distance) FILTER (WHERE status = 'Completed'), 0)
+                FROM booking_stats_source WHERE user_id IS NOT NULL GROUP BY user_id;
+            DROP TABLE booking_stats_source;
+        END;
+        $$ LANGUAGE plpgsql
+        """,
+        "SELECT refresh_booking_stats()",
+    ]),
+    Migration(8, "revoked tokens", [
+        # Logged-out tokens (by SHA-256 digest) until their own expiry, shared by every worker.
+        """
+        CREATE TABLE IF NOT EXISTS revoked_tokens (
+            token_hash TEXT PRIMARY KEY,
+            expires_at TIMESTAMPTZ NOT NULL
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS revoked_tokens_expires_at_idx ON revoked_tokens (expires_at)",
+    ]),
+    Migration(9, "one open booking per rider across partitions", [
+        # The per-partition indexes of migration 6 let a rider hold one open booking in each
+        # month. The rider row now records its open booking, and a trigger on bookings claims
+        # that slot under the rider's row lock, so the rule holds across partitions again.
+        "ALTER TABLE riders ADD COLUMN IF NOT EXISTS open_booking_id INTEGER",
+        """
+        UPDATE riders r SET open_booking_id = b.id
+        FROM (
+            SELECT DISTINCT ON (rider_id) rider_id, id FROM bookings
+            WHERE rider_id IS NOT NULL AND status IN ('Pending', 'In Progress')
+            ORDER BY rider_id, id DESC
+        ) b
+        WHERE r.id = b.rider_id
+        """,
+        """
+        CREATE OR REPLACE FUNCTION bookings_track_open_booking() RETURNS TRIGGER AS $$
+        BEGIN
+            IF TG_OP <> 'INSERT' AND OLD.rider_id IS NOT NULL AND OLD.status IN ('Pending', 'In Progress')
+               AND (TG_OP = 'DELETE' OR NEW.rider_id IS DISTINCT FROM OLD.rider_id OR NEW.status NOT IN ('Pending', 'In Progress')) THEN
+                UPDATE riders SET open_booking_id = NULL WHERE id = OLD.rider_id AND open_booking_id = OLD.id;
+            END IF;
+            IF TG_OP <> 'DELETE' AND NEW.rider_id IS NOT NULL AND NEW.status IN ('Pending', 'In Progress') THEN
+                -- Waits out a concurrent claim of the same rider, then sees its booking and fails.
+                UPDATE riders SET open_booking_id = NEW.id
+                WHERE id = NEW.rider_id AND (open_booking_id IS NULL OR open_booking_id = NEW.id);
+                IF NOT FOUND AND EXISTS (SELECT 1 FROM riders WHERE id = NEW.rider_id) THEN
+                    RAISE unique_violation USING
+                        MESSAGE = format('rider %s already has an open booking', NEW.rider_id),
+                        CONSTRAINT = 'riders_one_open_booking';
+                END IF;
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+        """,
+        # On the partitioned parent, so every partition, current and future, gets it.
+        """
+        CREATE TRIGGER bookings_track_open_booking
+        AFTER INSERT OR DELETE OR UPDATE OF rider_id, status ON bookings
+        FOR EACH ROW EXECUTE FUNCTION bookings_track_open_booking()
+        """,
+    ]),
+]
+
+# Arbitrary constant shared by every process, so only one of them migrates at a time.
+MIGRATION_LOCK_ID = 725_318_001
+
+CONCURRENT_INDEX = re.compile(r"CREATE\s+(?:UNIQUE\s+)?INDEX\s+CONCURRENTLY\s+IF\s+NOT\s+EXISTS\s+(\w+)", re.IGNORECASE)
+
+def run_migrations():
+    """Applies every migration not yet recorded in ``schema_migrations``.
+
+    Safe to call from several workers at once: they serialise on an advisory
+    lock and all but the first find nothing left to do.
+    """
+    conn = get_db_connection()
+    if not conn:
+        raise RuntimeError("Database connection failed")
+
+    conn.autocommit = True
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT pg_advisory_lock(%s)", (MIGRATION_LOCK_ID,))
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version INTEGER PRIMARY KEY,
+                name TEXT NOT NULL,
+                applied_at TIMESTAMPTZ NOT NULL DEFAULT now()
+            )
+        """)
+        cursor.execute("SELECT version FROM schema_migrations")
+        applied = {row[0] for row in cursor.fetchall()}
+
+        pending = [migration for migration in sorted(MIGRATIONS, key=lambda m: m.version) if migration.version not in applied]
+        for migration in pending:
+            apply_migration(conn, cursor, migration)
+            print(f"✅ Applied migration {migration.version}: {migration.name}")
+
+        if not pending:
+            print("✅ Database schema is up to date")
+
+    finally:
+        try:
+            cursor.execute("SELECT pg_advisory_unlock(%s)", (MIGRATION_LOCK_ID,))
+        except psycopg2.Error:
+            pass
+        cursor.close()
+        conn.close()
+
+def apply_migration(conn, cursor, migration):
+    record = ("INSERT INTO schema_migrations (version, name) VALUES (%s, %s)", (migration.version, migration.name))
+
+    if not migration.transactional:
+        for statement in migration.statements:
+            index = CONCURRENT_INDEX.search(statement)
+            if index and _index_is_invalid(cursor, index.group(1)):
+                print(f"❌ Index {index.group(1)} was left invalid by an interrupted build, rebuilding it")
+                cursor.execute(sql.SQL("DROP INDEX CONCURRENTLY IF EXISTS {}").format(sql.Identifier(index.group(1))))
+            cursor.execute(statement)
+            if index and _index_is_invalid(cursor, index.group(1)):
+                raise RuntimeError(f"Index {index.group(1)} is invalid after building it")
+        cursor.execute(*record)
+        return
+
+    conn.autocommit = False
+    try:
+        for statement in migration.statements:
+            cursor.execute(statement)
+        cursor.execute(*record)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.autocommit = True
+
+def _index_is_invalid(cursor, name):
+    cursor.execute("SELECT NOT indisvalid FROM pg_index WHERE indexrelid = to_regclass(%s)", (name,))
+    row = cursor.fetchone()
+    return row is not None and row[0]
@@ -0,0 +1,91 @@
+import asyncio
+
+import asyncpg
+from app.database.async_db import async_db_pool
+
+class PgListener:
+    """One dedicated LISTEN connection per worker, fanning NOTIFY payloads out to handlers.
+
+    Postgres delivers a NOTIFY to every listening session only once the
+    sending transaction commits, which makes it a cheap cross-worker bus for
+    small invalidation/state-change messages. The connection is re-established
+    in the background if it drops; notifications sent while it was down are
+    lost, so every reconnect runs the resync callbacks, which reload the
+    state those notifications would have kept current.
+    """
+
+    def __init__(self, connect_kwargs, reconnect_delay=1.0):
+        self.connect_kwargs = connect_kwargs
+        self.reconnect_delay = reconnect_delay
+        self._handlers = {}  # channel -> [callback(payload)]
+        self._resyncs = []  # async callback(conn), run after each reconnect
+        self._conn = None
+        self._task = None
+        self._lost = None
+
+    def add_handler(self, channel, callback):
+        """Registers ``callback(payload: str)``; call before ``start``."""
+        self._handlers.setdefault(channel, []).append(callback)
+
+    def add_resync(self, callback):
+        """Registers ``async callback(conn)`` to reload state after the connection comes back."""
+        self._resyncs.append(callback)
+
+    @property
+    def listening(self):
+        return self._conn is not None and not self._conn.is_closed()
+
+    async def start(self):
+        if self._task is None:
+            await self._connect()
+            self._task = asyncio.ensure_future(self._supervise())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self._conn is not None:
+            conn, self._conn = self._conn, None
+            await conn.close()
+
+    async def _connect(self):
+        self._lost = asyncio.Event()
+        self._conn = await asyncpg.connect(**self.connect_kwargs)
+        self._conn.add_termination_listener(lambda _: self._lost.set())
+        for channel in self._handlers:
+            await self._conn.add_listener(channel, self._dispatch)
+
+    async def _supervise(self):
+        while True:
+            await self._lost.wait()
+            print("❌ LISTEN connection lost, reconnecting")
+            while True:
+                try:
+                    await self._connect()
+                    break
+                except (OSError, asyncpg.PostgresError) as e:
+                    print(f"❌ LISTEN reconnect failed: {e}")
+                    await asyncio.sleep(self.reconnect_delay)
+            # LISTEN is back before the reload, so nothing committed after it is missed.
+            await self._resync()
+
+    async def _resync(self):
+        for callback in self._resyncs:
+            try:
+                async with async_db_pool.connection() as conn:
+                    await callback(conn)
+            except Exception as e:
+                print(f"❌ Error resyncing after reconnect ({callback.__qualname__}): {e}")
+
+    def _dispatch(self, connection, pid, channel, payload):
+        for callback in self._handlers.get(channel, ()):
+            try:
+                callback(payload)
+            except Exception as e:
+                print(f"❌ Error handling notification on {channel}: {e}")
+
+pg_listener = PgListener(async_db_pool.connect_kwargs)
+
+async def notify(conn, channel, payload):
+    """Queues a notification on ``conn``; it is delivered when that transaction commits."""
+    await conn.execute("SELECT pg_notify($1, $2)", channel, payload)
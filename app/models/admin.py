@@ -1,3 +1,4 @@
+from typing import Optional
 from pydantic import BaseModel
 
 class UserResponse(BaseModel):
@@ -12,11 +13,29 @@ class RiderResponse(BaseModel):
     vehicle_type: str
     license_plate: str
     status: str
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
 
 class RideResponse(BaseModel):
     id: int
     user_id: int
-    rider_id: int
+    rider_id: Optional[int] = None
     status: str
     distance: int
     fare: int
+    pickup_latitude: Optional[float] = None
+    pickup_longitude: Optional[float] = None
+
+class StatsResponse(BaseModel):
+    trips: int
+    completed_trips: int
+    canceled_trips: int
+    total_fare: int
+    total_distance: int
+    completion_rate: Optional[float] = None
+
+class RiderStatsResponse(StatsResponse):
+    rider_id: int
+
+class UserStatsResponse(StatsResponse):
+    user_id: int
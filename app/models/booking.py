@@ -1,19 +1,57 @@
-from pydantic import BaseModel
+from typing import Annotated, Optional
+from pydantic import BaseModel, Field
 
 class RideRequest(BaseModel):
     """Schema for requesting a ride."""
     user_id: int
-    distance: int  # Distance in KM
+    distance: Optional[int] = None  # Distance in KM; computed from the dropoff when one is given
+    pickup_latitude: float = Field(ge=-90, le=90)
+    pickup_longitude: float = Field(ge=-180, le=180)
+    dropoff_latitude: Optional[float] = Field(default=None, ge=-90, le=90)
+    dropoff_longitude: Optional[float] = Field(default=None, ge=-180, le=180)
 
 class RideResponse(BaseModel):
     """Schema for returning ride details."""
     id: int
     user_id: int
-    rider_id: int
+    rider_id: Optional[int] = None  # None while the ride waits in the dispatch queue
     status: str
     distance: int
     fare: int
+    pickup_latitude: Optional[float] = None
+    pickup_longitude: Optional[float] = None
 
 class RideStatusUpdate(BaseModel):
     """Schema for updating ride status."""
     status: str  # Pending, In Progress, Completed, Canceled
+
+class FareQuoteRequest(BaseModel):
+    """Schema for quoting one ride at the current surge price."""
+    distance: Optional[int] = None  # Distance in KM; computed from the dropoff when one is given
+    pickup_latitude: float = Field(ge=-90, le=90)
+    pickup_longitude: float = Field(ge=-180, le=180)
+    dropoff_latitude: Optional[float] = Field(default=None, ge=-90, le=90)
+    dropoff_longitude: Optional[float] = Field(default=None, ge=-180, le=180)
+
+class FareQuoteResponse(BaseModel):
+    """Schema for returning a fare quote."""
+    distance: int
+    duration_seconds: Optional[float] = None  # driving time, when routed on the road graph
+    base_fare: int
+    surge_multiplier: float
+    fare: int
+
+Latitude = Annotated[float, Field(ge=-90, le=90)]
+Longitude = Annotated[float, Field(ge=-180, le=180)]
+
+class QuoteRequest(BaseModel):
+    """Schema for bulk fare quotes."""
+    pairs: list[tuple[Latitude, Longitude, Latitude, Longitude]] = Field(max_length=100000)  # origin lat, origin lon, destination lat, destination lon
+    surge_multiplier: float = Field(default=1.0, gt=0)
+
+class QuoteResponse(BaseModel):
+    """Schema for returning bulk fare quotes, in request order."""
+    distances_km: list[float]
+    billed_km: list[int]
+    fares: list[int]
+    routed: list[bool]  # True where the pair was priced by road route, as single quotes and bookings are
@@ -1,10 +1,13 @@
-from pydantic import BaseModel
+from typing import Optional
+from pydantic import BaseModel, Field
 
 class RiderCreate(BaseModel):
     """Schema for creating a Rider."""
     user_id: int
     vehicle_type: str
     license_plate: str
+    latitude: Optional[float] = Field(default=None, ge=-90, le=90)
+    longitude: Optional[float] = Field(default=None, ge=-180, le=180)
 
 class RiderResponse(BaseModel):
     """Schema for returning Rider information."""
@@ -13,7 +16,24 @@ class RiderResponse(BaseModel):
     vehicle_type: str
     license_plate: str
     status: str = "Available"
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
 
 class RiderStatusUpdate(BaseModel):
     """Schema for updating Rider availability status."""
     status: str  # Available, Busy
+
+class RiderLocationUpdate(BaseModel):
+    """Schema for reporting a Rider's current position."""
+    latitude: float = Field(ge=-90, le=90)
+    longitude: float = Field(ge=-180, le=180)
+
+class LocationBatch(BaseModel):
+    """Schema for bulk GPS pings from many Riders."""
+    pings: list[tuple[int, float, float, float]] = Field(max_length=50000)  # rider id, latitude, longitude, unix timestamp
+
+class LocationBatchResponse(BaseModel):
+    """Schema for returning how many pings were taken."""
+    accepted: int
+    rejected: int
+    pending_riders: int
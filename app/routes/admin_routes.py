@@ -1,14 +1,49 @@
-from fastapi import APIRouter, HTTPException, Depends
+import csv
+import io
+import os
+import tempfile
+from typing import Literal, Optional
+import orjson
+from fastapi import APIRouter, HTTPException, Depends, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 import psycopg2
+from psycopg2 import sql
 from psycopg2.extras import RealDictCursor
-from app.database.db import get_db_connection
-from app.utils.auth import get_current_user
-from app.models.admin import UserResponse, RiderResponse, RideResponse
+from app.database.db import get_db, db_pool
+from app.database.async_db import async_db_pool
+from app.database.bulk_import import run_import
+from app.services.batch_matcher import batch_matcher
+from app.services.booking_partitions import booking_partitions
+from app.services.dispatch_queue import dispatch_queue
+from app.services.idempotency import idempotency_store
+from app.services.ride_events import ride_events
+from app.services.location_ingest import location_ingestor
+from app.services.lookup_cache import lookup_cache
+from app.services.rider_registry import rider_registry
+from app.services.road_graph import route_engine
+from app.services.surge import surge_engine
+from app.utils.auth import get_current_user, token_cache_stats, password_pool_stats
+from app.utils.fast_json import RowJSONResponse, row_dict, rows_response
+from app.utils.profiler import profiler
+from app.models.admin import UserResponse, RiderResponse, RideResponse, RiderStatsResponse, UserStatsResponse
 from app.models.user import UserCreate, UserUpdate
 
 router = APIRouter()
 
-def admin_required(current_user: dict = Depends(get_current_user)):
+PAGE_SIZE = int(os.getenv("ADMIN_PAGE_SIZE", "100"))
+MAX_PAGE_SIZE = 1000
+EXPORT_BATCH_SIZE = int(os.getenv("ADMIN_EXPORT_BATCH_SIZE", "2000"))
+
+# Explicit column lists keep password hashes out of listings and fix the export layout.
+USER_COLUMNS = ("id", "name", "phone_number", "is_admin")
+RIDER_COLUMNS = ("id", "user_id", "vehicle_type", "license_plate", "status", "latitude", "longitude")
+RIDE_COLUMNS = ("id", "user_id", "rider_id", "status", "distance", "fare", "pickup_latitude", "pickup_longitude")
+# rider_stats / user_stats columns after the key; fare and distance are totals over completed rides.
+STATS_COLUMNS = ("trips", "completed_trips", "canceled_trips", "total_fare", "total_distance")
+
+async def admin_required(current_user: dict = Depends(get_current_user)):
+    # Async like get_current_user, so the check runs inline instead of costing a threadpool hop.
     if not current_user.get("is_admin"):
         raise HTTPException(status_code=403, detail="Admin access required")
     return current_user
@@ -18,61 +53,274 @@ def admin_dashboard(current_user: dict = Depends(admin_required)):
     """Admin dashboard (Protected)"""
     return {"message": "Welcome to Admin Dashboard!"}
 
-@router.get("/users", response_model=list[UserResponse])
-def get_users(current_user: dict = Depends(admin_required)):
-    """Get all users"""
-    conn = get_db_connection()
-    if not conn:
-        raise HTTPException(status_code=500, detail="Database connection failed")
+def runtime_stats():
+    """Point-in-time stats from every subsystem, shared by this endpoint and the Prometheus one."""
+    stats = {
+        "db_pool": db_pool.stats(),
+        "async_db_pool": async_db_pool.stats(),
+        "rider_registry": rider_registry.stats(),
+        "location_ingest": location_ingestor.stats(),
+        "lookup_cache": lookup_cache.stats(),
+        "batch_matcher": batch_matcher.stats(),
+        "booking_partitions": booking_partitions.stats(),
+        "dispatch_queue": dispatch_queue.stats(),
+        "surge": surge_engine.stats(),
+        "road_graph": route_engine.stats(),
+        "idempotency": idempotency_store.stats(),
+        "ride_events": ride_events.stats(),
+        "auth_token_cache": token_cache_stats(),
+        "password_pool": password_pool_stats(),
+    }
+    if profiler is not None:
+        stats["profiler"] = profiler.stats()
+    return stats
 
-    cursor = conn.cursor(cursor_factory=RealDictCursor)
-    cursor.execute("SELECT * FROM users")
-    users = cursor.fetchall()
+@router.get("/metrics")
+def get_metrics(current_user: dict = Depends(admin_required)):
+    """Runtime metrics (connection pool usage, waiters, checkout latency)"""
+    return runtime_stats()
 
-    cursor.close()
-    conn.close()
+def _keyset_query(table, columns, filters, after_id, limit=None, key="id"):
+    """SELECT over ``table`` ordered by ``key``, resuming after ``after_id``, with equality filters."""
+    conditions = [sql.SQL("{} > %s").format(sql.Identifier(key))]
+    params = [after_id]
+    for column, value in filters.items():
+        if value is not None:
+            conditions.append(sql.SQL("{} = %s").format(sql.Identifier(column)))
+            params.append(value)
 
-    return users
+    query = sql.SQL("SELECT {columns} FROM {table} WHERE {conditions} ORDER BY {key}").format(
+        columns=sql.SQL(", ").join(map(sql.Identifier, columns)),
+        table=sql.Identifier(table),
+        conditions=sql.SQL(" AND ").join(conditions),
+        key=sql.Identifier(key),
+    )
+    if limit is not None:
+        query += sql.SQL(" LIMIT %s")
+        params.append(limit)
+    return query, params
 
-@router.get("/riders", response_model=list[RiderResponse])
-def get_riders(current_user: dict = Depends(admin_required)):
-    """Get all riders"""
-    conn = get_db_connection()
-    if not conn:
-        raise HTTPException(status_code=500, detail="Database connection failed")
+def _fetch_page(conn, table, columns, filters, after_id, limit):
+    """One page as JSON, encoded straight from plain tuples; ``columns`` must start with id."""
+    cursor = conn.cursor()
+    try:
+        cursor.execute(*_keyset_query(table, columns, filters, after_id, limit))
+        rows = cursor.fetchall()
+    finally:
+        cursor.close()
 
-    cursor = conn.cursor(cursor_factory=RealDictCursor)
-    cursor.execute("SELECT * FROM riders")
-    riders = cursor.fetchall()
+    # Pass this back as ``after_id`` to get the next page; absent on the last page.
+    headers = {"X-Next-After-Id": str(rows[-1][0])} if len(rows) == limit else None
+    return rows_response(columns, rows, headers)
+
+def _stream_rows(table, columns, filters, after_id, export_format):
+    """Yields NDJSON or CSV chunks read through a server-side cursor, so memory stays flat."""
+    with db_pool.connection() as conn:
+        # A named cursor keeps the result set in Postgres and fetches it EXPORT_BATCH_SIZE rows at a time.
+        with conn.cursor(name=f"export_{table}") as cursor:
+            cursor.itersize = EXPORT_BATCH_SIZE
+            cursor.execute(*_keyset_query(table, columns, filters, after_id))
+
+            if export_format == "csv":
+                buffer = io.StringIO()
+                writer = csv.writer(buffer)
+                writer.writerow(columns)
+                yield buffer.getvalue()
+
+            while True:
+                rows = cursor.fetchmany(EXPORT_BATCH_SIZE)
+                if not rows:
+                    break
+                if export_format == "csv":
+                    buffer = io.StringIO()
+                    csv.writer(buffer).writerows(rows)
+                    yield buffer.getvalue()
+                else:
+                    yield b"".join(orjson.dumps(dict(zip(columns, row))) + b"\n" for row in rows)
+        conn.rollback()
+
+def _export_response(table, columns, filters, after_id, export_format):
+    media_type = "text/csv" if export_format == "csv" else "application/x-ndjson"
+    return StreamingResponse(
+        _stream_rows(table, columns, filters, after_id, export_format),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{table}.{export_format}"'},
+    )
+
+@router.get("/users", response_model=list[UserResponse])
+def get_users(
+    after_id: int = 0,
+    limit: int = Query(default=PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    is_admin: Optional[bool] = None,
+    current_user: dict = Depends(admin_required),
+    conn=Depends(get_db),
+):
+    """Get users, one keyset page at a time"""
+    return _fetch_page(conn, "users", USER_COLUMNS, {"is_admin": is_admin}, after_id, limit)
+
+@router.get("/users/export")
+def export_users(
+    export_format: Literal["ndjson", "csv"] = Query(default="ndjson", alias="format"),
+    after_id: int = 0,
+    is_admin: Optional[bool] = None,
+    current_user: dict = Depends(admin_required),
+):
+    """Stream every matching user as NDJSON or CSV"""
+    return _export_response("users", USER_COLUMNS, {"is_admin": is_admin}, after_id, export_format)
+
+@router.get("/riders", response_model=list[RiderResponse])
+def get_riders(
+    after_id: int = 0,
+    limit: int = Query(default=PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    status: Optional[str] = None,
+    user_id: Optional[int] = None,
+    current_user: dict = Depends(admin_required),
+    conn=Depends(get_db),
+):
+    """Get riders, one keyset page at a time"""
+    return _fetch_page(conn, "riders", RIDER_COLUMNS, {"status": status, "user_id": user_id}, after_id, limit)
 
-    cursor.close()
-    conn.close()
+@router.get("/riders/export")
+def export_riders(
+    export_format: Literal["ndjson", "csv"] = Query(default="ndjson", alias="format"),
+    after_id: int = 0,
+    status: Optional[str] = None,
+    user_id: Optional[int] = None,
+    current_user: dict = Depends(admin_required),
+):
+    """Stream every matching rider as NDJSON or CSV"""
+    return _export_response("riders", RIDER_COLUMNS, {"status": status, "user_id": user_id}, after_id, export_format)
 
-    return riders
+def _rides_table(archived):
+    return "bookings_archive" if archived else "bookings"
 
 @router.get("/rides", response_model=list[RideResponse])
-def get_rides(current_user: dict = Depends(admin_required)):
-    """Get all rides"""
-    conn = get_db_connection()
-    if not conn:
-        raise HTTPException(status_code=500, detail="Database connection failed")
+def get_rides(
+    after_id: int = 0,
+    limit: int = Query(default=PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    status: Optional[str] = None,
+    user_id: Optional[int] = None,
+    rider_id: Optional[int] = None,
+    archived: bool = False,
+    current_user: dict = Depends(admin_required),
+    conn=Depends(get_db),
+):
+    """Get rides, one keyset page at a time; ``archived=true`` lists rides past the retention window"""
+    filters = {"status": status, "user_id": user_id, "rider_id": rider_id}
+    return _fetch_page(conn, _rides_table(archived), RIDE_COLUMNS, filters, after_id, limit)
 
-    cursor = conn.cursor(cursor_factory=RealDictCursor)
-    cursor.execute("SELECT * FROM bookings")
-    rides = cursor.fetchall()
+@router.get("/rides/export")
+def export_rides(
+    export_format: Literal["ndjson", "csv"] = Query(default="ndjson", alias="format"),
+    after_id: int = 0,
+    status: Optional[str] = None,
+    user_id: Optional[int] = None,
+    rider_id: Optional[int] = None,
+    archived: bool = False,
+    current_user: dict = Depends(admin_required),
+):
+    """Stream every matching ride as NDJSON or CSV"""
+    filters = {"status": status, "user_id": user_id, "rider_id": rider_id}
+    return _export_response(_rides_table(archived), RIDE_COLUMNS, filters, after_id, export_format)
+
+def _stats_dict(key, row):
+    stats = row_dict((key,) + STATS_COLUMNS, row)
+    finished = stats["completed_trips"] + stats["canceled_trips"]
+    stats["completion_rate"] = stats["completed_trips"] / finished if finished else None
+    return stats
+
+def _entity_stats(conn, entity_table, stats_table, key, entity_id):
+    """One entity's totals by primary key, zeros if it never had a booking; None if it does not exist."""
+    query = sql.SQL("SELECT e.id, {totals} FROM {entity} e LEFT JOIN {stats} s ON s.{key} = e.id WHERE e.id = %s").format(
+        totals=sql.SQL(", ").join(sql.SQL("COALESCE(s.{}, 0)").format(sql.Identifier(column)) for column in STATS_COLUMNS),
+        entity=sql.Identifier(entity_table),
+        stats=sql.Identifier(stats_table),
+        key=sql.Identifier(key),
+    )
+    cursor = conn.cursor()
+    try:
+        cursor.execute(query, (entity_id,))
+        row = cursor.fetchone()
+    finally:
+        cursor.close()
+    return _stats_dict(key, row) if row else None
+
+def _stats_page(conn, stats_table, key, after_id, limit):
+    cursor = conn.cursor()
+    try:
+        cursor.execute(*_keyset_query(stats_table, (key,) + STATS_COLUMNS, {}, after_id, limit, key=key))
+        rows = cursor.fetchall()
+    finally:
+        cursor.close()
+
+    headers = {"X-Next-After-Id": str(rows[-1][0])} if len(rows) == limit else None
+    return RowJSONResponse([_stats_dict(key, row) for row in rows], headers=headers)
+
+@router.get("/stats/riders", response_model=list[RiderStatsResponse])
+def get_riders_stats(
+    after_id: int = 0,
+    limit: int = Query(default=PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    current_user: dict = Depends(admin_required),
+    conn=Depends(get_db),
+):
+    """Lifetime ride totals of every rider that has had a booking, one keyset page (by rider_id) at a time"""
+    return _stats_page(conn, "rider_stats", "rider_id", after_id, limit)
+
+@router.get("/stats/riders/{rider_id}", response_model=RiderStatsResponse)
+def get_rider_stats(rider_id: int, current_user: dict = Depends(admin_required), conn=Depends(get_db)):
+    """Lifetime ride totals of one rider: trips, completions, cancellations, earnings and distance"""
+    stats = _entity_stats(conn, "riders", "rider_stats", "rider_id", rider_id)
+    if stats is None:
+        raise HTTPException(status_code=404, detail="Rider not found")
+    return RowJSONResponse(stats)
 
-    cursor.close()
-    conn.close()
+@router.get("/stats/users", response_model=list[UserStatsResponse])
+def get_users_stats(
+    after_id: int = 0,
+    limit: int = Query(default=PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    current_user: dict = Depends(admin_required),
+    conn=Depends(get_db),
+):
+    """Lifetime ride totals of every user that has booked, one keyset page (by user_id) at a time"""
+    return _stats_page(conn, "user_stats", "user_id", after_id, limit)
 
-    return rides
+@router.get("/stats/users/{user_id}", response_model=UserStatsResponse)
+def get_user_stats(user_id: int, current_user: dict = Depends(admin_required), conn=Depends(get_db)):
+    """Lifetime ride totals of one user: trips, completions, cancellations, spend and distance"""
+    stats = _entity_stats(conn, "users", "user_stats", "user_id", user_id)
+    if stats is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    return RowJSONResponse(stats)
+
+# Uploads larger than this are spooled to disk instead of held in memory.
+IMPORT_SPOOL_BYTES = 16 * 1024 * 1024
+
+@router.post("/import/{table}")
+async def bulk_import(
+    table: Literal["users", "riders"],
+    request: Request,
+    import_format: Literal["csv", "ndjson"] = Query(default="csv", alias="format"),
+    on_conflict: Literal["skip", "update"] = Query(default="skip"),
+    current_user: dict = Depends(admin_required),
+):
+    """Bulk import users or riders from a raw CSV or NDJSON request body"""
+    with tempfile.SpooledTemporaryFile(max_size=IMPORT_SPOOL_BYTES) as spool:
+        async for chunk in request.stream():
+            spool.write(chunk)
+        spool.seek(0)
+
+        try:
+            lines = io.TextIOWrapper(spool, encoding="utf-8", newline="")
+            return await run_in_threadpool(run_import, table, lines, import_format, on_conflict)
+        except (UnicodeDecodeError, csv.Error, ValueError, psycopg2.DataError) as e:
+            # Unreadable input fails the batch it is in; batches committed before it stay imported.
+            raise HTTPException(status_code=400, detail=f"Invalid import data: {str(e)}")
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
 
 @router.patch("/users/{user_id}", response_model=UserResponse)
-def update_user(user_id: int, user: UserUpdate, current_user: dict = Depends(admin_required)):
+def update_user(user_id: int, user: UserUpdate, current_user: dict = Depends(admin_required), conn=Depends(get_db)):
     """Update user details"""
-    conn = get_db_connection()
-    if not conn:
-        raise HTTPException(status_code=500, detail="Database connection failed")
-
     cursor = conn.cursor(cursor_factory=RealDictCursor)
 
     try:
@@ -97,4 +345,3 @@ def update_user(user_id: int, user: UserUpdate, current_user: dict = Depends(adm
 
     finally:
         cursor.close()
-        conn.close()
@@ -0,0 +1,28 @@
+import hmac
+import os
+from typing import Optional
+from fastapi import APIRouter, Depends, Header, HTTPException
+from fastapi.responses import PlainTextResponse
+from app.routes.admin_routes import runtime_stats
+from app.utils.auth import get_current_user
+from app.utils.metrics import render_metrics
+
+router = APIRouter()
+
+# Static bearer token for Prometheus scrapers; without it (or alongside it) an admin JWT also works.
+METRICS_SCRAPE_TOKEN = os.getenv("METRICS_SCRAPE_TOKEN", "")
+
+async def metrics_access(authorization: Optional[str] = Header(default=None)):
+    scheme, _, token = (authorization or "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        raise HTTPException(status_code=401, detail="Not authenticated", headers={"WWW-Authenticate": "Bearer"})
+    if METRICS_SCRAPE_TOKEN and hmac.compare_digest(token.encode(), METRICS_SCRAPE_TOKEN.encode()):
+        return
+    current_user = await get_current_user(token)
+    if not current_user.get("is_admin"):
+        raise HTTPException(status_code=403, detail="Admin access required")
+
+@router.get("/metrics", response_class=PlainTextResponse, dependencies=[Depends(metrics_access)])
+def prometheus_metrics():
+    """Request, query and runtime metrics in the Prometheus text format (scrape token or admin)"""
+    return PlainTextResponse(render_metrics(runtime_stats()), media_type="text/plain; version=0.0.4")
@@ -1,155 +1,340 @@
-from fastapi import APIRouter, HTTPException, Depends
-import psycopg2
-from psycopg2.extras import RealDictCursor
-from app.database.db import get_db_connection
-from app.models.booking import RideRequest, RideResponse, RideStatusUpdate
+import asyncio
+import json
+import math
+import os
+from typing import Optional
+import asyncpg
+import numpy as np
+from fastapi import APIRouter, HTTPException, Depends, Header, Response, WebSocket, WebSocketDisconnect, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from app.database.async_db import get_async_db, async_db_connection
+from app.models.booking import RideRequest, RideResponse, RideStatusUpdate, FareQuoteRequest, FareQuoteResponse, QuoteRequest, QuoteResponse
+from app.services.ride_events import FINAL_STATUSES, publish_ride_update, ride_events
+from app.services.pricing import apply_surge, calculate_fare, quote_fares, trip_distance
+from app.services.batch_matcher import MATCHING_MODE, batch_matcher
+from app.services.dispatch_queue import dispatch_queue
+from app.services.booking_partitions import BOOKING_COLUMNS, fetch_booking, set_booking_status
+from app.services.idempotency import idempotency_store, request_fingerprint
+from app.services.lookup_cache import lookup_cache, ride_key, rider_key
+from app.services.rider_registry import rider_registry
+from app.services.road_graph import route_engine
+from app.services.spatial_index import MATCH_MAX_PICKUP_KM, rider_index
+from app.services.surge import surge_engine
 from app.utils.auth import get_current_user
+from app.utils.fast_json import RowJSONResponse, row_dict
 
 router = APIRouter()
 
-DISTANCE_MATRIX = {
-    (1, 1): 8, (1, 2): 5, (1, 3): 7, (1, 4): 4, (1, 5): 6,
-    (2, 1): 3, (2, 2): 6, (2, 3): 9, (2, 4): 2, (2, 5): 8,
-    (3, 1): 5, (3, 2): 2, (3, 3): 4, (3, 4): 7, (3, 5): 3,
-    (4, 1): 6, (4, 2): 9, (4, 3): 1, (4, 4): 5, (4, 5): 2,
-    (5, 1): 7, (5, 2): 4, (5, 3): 8, (5, 4): 3, (5, 5): 1
-}
-
-def calculate_fare(distance):
-    """Calculates ride fare based on distance-based pricing."""
-    if distance == 1:
-        return distance * 10000
-    elif 2 <= distance <= 4:
-        return distance * 15000
-    else:
-        return distance * 12000
-
-def find_nearest_available_rider(user_id):
-    """Finds the nearest available rider based on a fake distance matrix."""
-    conn = get_db_connection()
-    if not conn:
-        return None
-
-    cursor = conn.cursor(cursor_factory=RealDictCursor)
-    cursor.execute("SELECT id FROM riders WHERE status = 'Available'")
-    available_riders = cursor.fetchall()
-
-    cursor.close()
-    conn.close()
-
-    if not available_riders:
-        return None
-
-    nearest_rider = None
-    min_distance = float("inf")
-
-    for rider in available_riders:
-        rider_id = rider["id"]
-        distance = DISTANCE_MATRIX.get((user_id, rider_id), float("inf"))
-
-        if distance < min_distance:
-            min_distance = distance
-            nearest_rider = rider_id
+# How many nearby riders to shortlist from the spatial index before checking the DB.
+MATCH_CANDIDATES = int(os.getenv("MATCH_CANDIDATES", "8"))
+# With a road graph loaded, this many straight-line neighbours per wanted rider are re-ranked by driving time.
+ROAD_ETA_SHORTLIST_FACTOR = 3
+# Comment lines sent on idle event streams so proxies do not time them out.
+EVENT_KEEPALIVE_SECONDS = 15
+
+def find_nearest_available_riders(latitude, longitude, k=MATCH_CANDIDATES, exclude=()):
+    """Shortlists the ``k`` available riders closest to the pickup point from the spatial index.
+
+    Closest means shortest driving time when the road graph is loaded (riders
+    beyond its pickup horizon are dropped) and straight-line distance otherwise.
+    Riders beyond ``MATCH_MAX_PICKUP_KM`` are never shortlisted.
+    """
+    shortlist = k * ROAD_ETA_SHORTLIST_FACTOR if route_engine.loaded else k
+    candidates = rider_index.nearest(latitude, longitude, k=shortlist + len(exclude), max_radius_km=MATCH_MAX_PICKUP_KM)
+    rider_ids = [rider_id for _, rider_id in candidates if rider_id not in exclude]
+
+    positions = [rider_index.position(rider_id) for rider_id in rider_ids]
+    located = [rider_id for rider_id, position in zip(rider_ids, positions) if position is not None]
+    etas = route_engine.pickup_etas(latitude, longitude, [position for position in positions if position is not None])
+    if etas is not None and any(math.isfinite(eta) for eta in etas):
+        ranked = sorted((eta, rider_id) for eta, rider_id in zip(etas, located) if math.isfinite(eta))
+        rider_ids = [rider_id for _, rider_id in ranked]
+    return rider_ids[:k]
+
+async def claim_nearest_available_rider(conn, latitude, longitude):
+    """Marks the nearest claimable rider Busy and returns its id (call inside a transaction).
+
+    ``FOR UPDATE SKIP LOCKED`` lets concurrent bookings step past a rider another
+    transaction is claiming instead of queueing behind its row lock, and the
+    ``status = 'Available'`` recheck under the lock rules out double assignment.
+    """
+    skipped = set()
+    # The registry may lag other workers by a notification; a few rounds steps past stale entries.
+    for _ in range(3):
+        if route_engine.loaded:
+            # Ranking by driving time runs a graph search, which must not stall the event loop.
+            candidate_ids = await run_in_threadpool(find_nearest_available_riders, latitude, longitude, exclude=skipped)
+        else:
+            candidate_ids = find_nearest_available_riders(latitude, longitude, exclude=skipped)
+        if not candidate_ids:
+            return None
+
+        rider_id = await conn.fetchval(
+            """
+            UPDATE riders SET status = 'Busy'
+            WHERE id = (
+                SELECT id FROM riders
+                WHERE id = ANY($1::int[]) AND status = 'Available'
+                ORDER BY array_position($1::int[], id)
+                LIMIT 1
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING id
+            """,
+            candidate_ids,
+        )
+        if rider_id is not None:
+            await rider_registry.publish(conn, rider_id, status="Busy")
+            return rider_id
 
-    return nearest_rider
+        # None of them was claimable: correct the ones our registry had wrong, skip the locked ones.
+        taken = await conn.fetch("SELECT id, status FROM riders WHERE id = ANY($1::int[]) AND status <> 'Available'", candidate_ids)
+        for row in taken:
+            rider_registry.apply(row["id"], status=row["status"])
+        skipped.update(candidate_ids)
 
-@router.post("/book", response_model=RideResponse)
-def book_ride(ride: RideRequest, current_user: dict = Depends(get_current_user)):
-    """Books a ride and assigns the nearest available rider."""
-    conn = get_db_connection()
-    if not conn:
-        raise HTTPException(status_code=500, detail="Database connection failed")
+    return None
 
-    cursor = conn.cursor(cursor_factory=RealDictCursor)
+async def book_with_nearest_rider(conn, ride, fare):
+    """Greedy matching: claims the rider nearest to this one request and inserts its booking.
 
-    try:
-        cursor.execute("SELECT id FROM users WHERE id = %s", (ride.user_id,))
-        user = cursor.fetchone()
-        if not user:
-            raise HTTPException(status_code=400, detail="User does not exist")
+    With no rider free the booking joins the dispatch queue instead.
+    """
+    user = await conn.fetchrow("SELECT id FROM users WHERE id = $1", ride.user_id)
+    if not user:
+        raise HTTPException(status_code=400, detail="User does not exist")
 
-        rider_id = find_nearest_available_rider(ride.user_id)
+    async with conn.transaction():
+        rider_id = await claim_nearest_available_rider(conn, ride.pickup_latitude, ride.pickup_longitude)
         if not rider_id:
-            raise HTTPException(status_code=400, detail="No available riders at the moment")
+            return await dispatch_queue.enqueue(conn, ride, fare)
 
-        fare = calculate_fare(ride.distance)
-
-        cursor.execute(
+        new_booking = await conn.fetchrow(
             """
-            INSERT INTO bookings (user_id, rider_id, status, distance, fare)
-            VALUES (%s, %s, 'Pending', %s, %s) RETURNING id, user_id, rider_id, status, distance, fare
+            INSERT INTO bookings (user_id, rider_id, status, distance, fare, pickup_latitude, pickup_longitude)
+            VALUES ($1, $2, 'Pending', $3, $4, $5, $6)
+            RETURNING id, user_id, rider_id, status, distance, fare, pickup_latitude, pickup_longitude
             """,
-            (ride.user_id, rider_id, ride.distance, fare),
+            ride.user_id, rider_id, ride.distance, fare, ride.pickup_latitude, ride.pickup_longitude,
         )
+        await publish_ride_update(conn, new_booking)
+
+    rider_registry.apply(rider_id, status="Busy")
+    return new_booking
+
+async def _trip_distance(request):
+    """Billed km for a ride or quote request (routed when it has a dropoff) and the driving time if known."""
+    if request.dropoff_latitude is not None and request.dropoff_longitude is not None:
+        points = (request.pickup_latitude, request.pickup_longitude, request.dropoff_latitude, request.dropoff_longitude)
+        if route_engine.loaded:
+            return await run_in_threadpool(trip_distance, *points)
+        return trip_distance(*points)
+    if request.distance is None:
+        raise HTTPException(status_code=422, detail="Either distance or a dropoff location is required")
+    return request.distance, None
+
+async def _book(ride):
+    """Prices the ride, matches a rider and returns the new booking as a dict."""
+    distance, _ = await _trip_distance(ride)
+    ride = ride.model_copy(update={"distance": distance})
+    surge_multiplier = surge_engine.multiplier(ride.pickup_latitude, ride.pickup_longitude)
+    surge_engine.record_request(ride.pickup_latitude, ride.pickup_longitude)
+    fare = apply_surge(calculate_fare(ride.distance), surge_multiplier)
+
+    if MATCHING_MODE == "batch":
+        # No connection is held while the request waits for its batch window.
+        new_booking = await batch_matcher.submit(ride, fare)
+        if new_booking is None:
+            async with async_db_connection() as conn:
+                async with conn.transaction():
+                    new_booking = await dispatch_queue.enqueue(conn, ride, fare)
+    else:
+        async with async_db_connection() as conn:
+            new_booking = await book_with_nearest_rider(conn, ride, fare)
 
-        new_booking = cursor.fetchone()
-        conn.commit()
-
-        cursor.execute("UPDATE riders SET status = 'Busy' WHERE id = %s", (rider_id,))
-        conn.commit()
+    if new_booking["rider_id"] is not None:
+        await lookup_cache.invalidate(rider_key(new_booking["rider_id"]))
+    return RideResponse(**new_booking).model_dump()
 
+@router.post("/book", response_model=RideResponse)
+async def book_ride(
+    ride: RideRequest,
+    response: Response,
+    current_user: dict = Depends(get_current_user),
+    idempotency_key: Optional[str] = Header(default=None, max_length=255),
+):
+    """Books a ride at the current surge price and assigns the nearest available rider.
+
+    With no rider free the booking comes back Pending without one and is
+    assigned as soon as a rider frees up; watch ``/events`` for the assignment.
+    Retries carrying the same ``Idempotency-Key`` header get the original
+    booking back (marked ``Idempotent-Replayed: true``) instead of a second one.
+    """
+    try:
+        if idempotency_key is None:
+            new_booking = await _book(ride)
+        else:
+            new_booking, replayed = await idempotency_store.run(
+                current_user["user_id"], idempotency_key, request_fingerprint(ride.model_dump_json()), lambda: _book(ride),
+            )
+            if replayed:
+                response.headers["Idempotent-Replayed"] = "true"
         return RideResponse(**new_booking)
 
+    except HTTPException:
+        raise
+    except asyncpg.UniqueViolationError:
+        raise HTTPException(status_code=409, detail="Rider was assigned concurrently, please retry")
     except Exception as e:
-        conn.rollback()
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
 
-    finally:
-        cursor.close()
-        conn.close()
+@router.post("/quote", response_model=FareQuoteResponse)
+async def quote_ride(quote: FareQuoteRequest, current_user: dict = Depends(get_current_user)):
+    """Quotes one ride at the surge price currently in effect at the pickup."""
+    distance, duration_seconds = await _trip_distance(quote)
+    base_fare = calculate_fare(distance)
+    surge_multiplier = surge_engine.multiplier(quote.pickup_latitude, quote.pickup_longitude)
+    return FareQuoteResponse(
+        distance=distance,
+        duration_seconds=duration_seconds,
+        base_fare=base_fare,
+        surge_multiplier=surge_multiplier,
+        fare=apply_surge(base_fare, surge_multiplier),
+    )
+
+@router.post("/quotes", response_model=QuoteResponse)
+def quote_rides(quote: QuoteRequest, current_user: dict = Depends(get_current_user)):
+    """Quotes distance and fare for many origin/destination pairs in one call."""
+    distances_km, billed_km, fares, routed = quote_fares(quote.pairs, quote.surge_multiplier)
+    return QuoteResponse(
+        distances_km=np.round(distances_km, 3).tolist(),
+        billed_km=billed_km.tolist(),
+        fares=fares.tolist(),
+        routed=routed.tolist(),
+    )
 
 @router.patch("/{booking_id}/status", response_model=RideResponse)
-def update_booking_status(booking_id: int, status_update: RideStatusUpdate, current_user: dict = Depends(get_current_user)):
+async def update_booking_status(booking_id: int, status_update: RideStatusUpdate, current_user: dict = Depends(get_current_user), conn=Depends(get_async_db)):
     """Updates ride status (Pending, In Progress, Completed, Canceled)."""
-    conn = get_db_connection()
-    if not conn:
-        raise HTTPException(status_code=500, detail="Database connection failed")
+    try:
+        async with conn.transaction():
+            updated_booking = await set_booking_status(conn, booking_id, status_update.status)
 
-    cursor = conn.cursor(cursor_factory=RealDictCursor)
+            if not updated_booking:
+                raise HTTPException(status_code=404, detail="Booking not found")
 
-    try:
-        cursor.execute("UPDATE bookings SET status = %s WHERE id = %s RETURNING *", (status_update.status, booking_id))
-        updated_booking = cursor.fetchone()
-        conn.commit()
+            # A ride still in the dispatch queue has no rider to free.
+            freed_rider_id = updated_booking["rider_id"] if status_update.status in ["Completed", "Canceled"] else None
+            if freed_rider_id is not None:
+                await conn.execute("UPDATE riders SET status = 'Available' WHERE id = $1", freed_rider_id)
+                await rider_registry.publish(conn, freed_rider_id, status="Available")
 
-        if not updated_booking:
-            raise HTTPException(status_code=404, detail="Booking not found")
+            await publish_ride_update(conn, updated_booking)
 
-        if status_update.status in ["Completed", "Canceled"]:
-            cursor.execute("UPDATE riders SET status = 'Available' WHERE id = %s", (updated_booking["rider_id"],))
-            conn.commit()
+        if freed_rider_id is not None:
+            rider_registry.apply(freed_rider_id, status="Available")
+            await lookup_cache.invalidate(ride_key(booking_id), rider_key(freed_rider_id))
+            await dispatch_queue.offer_rider(conn, freed_rider_id)
+        else:
+            if status_update.status in ["Completed", "Canceled"]:
+                dispatch_queue.discard(booking_id)
+            await lookup_cache.invalidate(ride_key(booking_id))
 
         return RideResponse(**updated_booking)
 
+    except HTTPException:
+        raise
     except Exception as e:
-        conn.rollback()
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
 
-    finally:
-        cursor.close()
-        conn.close()
+async def _load_booking(booking_id):
+    async with async_db_connection() as conn:
+        booking = await fetch_booking(conn, booking_id)
+    return row_dict(BOOKING_COLUMNS, booking) if booking else None
 
 @router.get("/{booking_id}/status", response_model=RideResponse)
-def get_ride_status(booking_id: int, current_user: dict = Depends(get_current_user)):
+async def get_ride_status(booking_id: int, current_user: dict = Depends(get_current_user)):
     """Checks the status of a ride."""
-    conn = get_db_connection()
-    if not conn:
-        raise HTTPException(status_code=500, detail="Database connection failed")
-
-    cursor = conn.cursor(cursor_factory=RealDictCursor)
-
     try:
-        cursor.execute("SELECT * FROM bookings WHERE id = %s", (booking_id,))
-        booking = cursor.fetchone()
+        booking = await lookup_cache.get_or_load(ride_key(booking_id), lambda: _load_booking(booking_id))
 
         if not booking:
             raise HTTPException(status_code=404, detail="Booking not found")
 
-        return RideResponse(**booking)
+        return RowJSONResponse(booking)
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
 
+async def _ride_updates(booking_id):
+    """Yields the current booking row, then every change to it until the ride ends."""
+    with ride_events.subscribe(booking_id) as updates:
+        # Subscribe before reading the snapshot so no change can slip in between.
+        async with async_db_connection() as conn:
+            booking = await fetch_booking(conn, booking_id)
+        if not booking:
+            raise HTTPException(status_code=404, detail="Booking not found")
+
+        booking = RideResponse(**booking).model_dump()
+        yield booking
+        while booking["status"] not in FINAL_STATUSES:
+            booking = RideResponse(**await updates.get()).model_dump()
+            yield booking
+
+@router.get("/{booking_id}/events")
+async def stream_ride_status(booking_id: int, current_user: dict = Depends(get_current_user)):
+    """Server-Sent Events stream of a ride's status, replacing status polling."""
+    updates = _ride_updates(booking_id)
+    first = await anext(updates)  # surfaces a 404 before the stream starts
+
+    async def event_stream():
+        yield f"event: status\ndata: {json.dumps(first)}\n\n"
+        pending = asyncio.ensure_future(anext(updates))
+        try:
+            while True:
+                done, _ = await asyncio.wait({pending}, timeout=EVENT_KEEPALIVE_SECONDS)
+                if not done:
+                    yield ": keep-alive\n\n"
+                    continue
+                try:
+                    booking = pending.result()
+                except StopAsyncIteration:
+                    return
+                yield f"event: status\ndata: {json.dumps(booking)}\n\n"
+                pending = asyncio.ensure_future(anext(updates))
+        finally:
+            pending.cancel()
+            await asyncio.gather(pending, return_exceptions=True)
+            await updates.aclose()
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+@router.websocket("/{booking_id}/ws")
+async def ride_status_websocket(websocket: WebSocket, booking_id: int, token: str):
+    """WebSocket stream of a ride's status; browsers cannot set headers here, so the JWT comes as ?token=."""
+    try:
+        await get_current_user(token)
+    except HTTPException:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+
+    updates = _ride_updates(booking_id)
+    try:
+        first = await anext(updates)
+    except HTTPException:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason="Booking not found")
+        return
+
+    await websocket.accept()
+    try:
+        await websocket.send_json(first)
+        async for booking in updates:
+            await websocket.send_json(booking)
+        await websocket.close()
+    except WebSocketDisconnect:
+        pass
     finally:
-        cursor.close()
-        conn.close()
+        await updates.aclose()
@@ -1,29 +1,40 @@
 from fastapi import APIRouter, HTTPException, Depends
 import psycopg2
 from psycopg2.extras import RealDictCursor
-from app.database.db import get_db_connection
-from app.models.rider import RiderCreate, RiderResponse, RiderStatusUpdate
+from app.database.db import get_db
+from app.database.async_db import get_async_db, async_db_connection
+from app.models.rider import RiderCreate, RiderResponse, RiderStatusUpdate, RiderLocationUpdate, LocationBatch, LocationBatchResponse
+from app.services.dispatch_queue import dispatch_queue
+from app.services.location_ingest import location_ingestor
+from app.services.lookup_cache import lookup_cache, rider_key
+from app.services.rider_registry import RIDER_CHANGES_CHANNEL, rider_registry
 from app.utils.auth import get_current_user
+from app.utils.fast_json import RowJSONResponse, row_dict
 
 router = APIRouter()
 
+# RiderResponse fields, in the order lookups select them.
+RIDER_COLUMNS = ("id", "user_id", "vehicle_type", "license_plate", "status", "latitude", "longitude")
+RIDER_LOOKUP = f"SELECT {', '.join(RIDER_COLUMNS)} FROM riders WHERE id = $1"
+
 @router.post("/register", response_model=RiderResponse)
-def register_rider(rider: RiderCreate, current_user: dict = Depends(get_current_user)):
+def register_rider(rider: RiderCreate, current_user: dict = Depends(get_current_user), conn=Depends(get_db)):
     """Registers a new rider"""
-    conn = get_db_connection()
-    if not conn:
-        raise HTTPException(status_code=500, detail="Database connection failed")
-
     cursor = conn.cursor(cursor_factory=RealDictCursor)
 
     try:
         cursor.execute(
-            "INSERT INTO riders (user_id, vehicle_type, license_plate, status) VALUES (%s, %s, %s, 'Available') RETURNING id, user_id, vehicle_type, license_plate, status",
-            (rider.user_id, rider.vehicle_type, rider.license_plate),
+            "INSERT INTO riders (user_id, vehicle_type, license_plate, status, latitude, longitude) VALUES (%s, %s, %s, 'Available', %s, %s) RETURNING id, user_id, vehicle_type, license_plate, status, latitude, longitude",
+            (rider.user_id, rider.vehicle_type, rider.license_plate, rider.latitude, rider.longitude),
         )
 
         new_rider = cursor.fetchone()
+        cursor.execute(
+            "SELECT pg_notify(%s, %s)",
+            (RIDER_CHANGES_CHANNEL, rider_registry.change_payload(new_rider["id"], new_rider["status"], new_rider["vehicle_type"], new_rider["latitude"], new_rider["longitude"], new_rider["user_id"])),
+        )
         conn.commit()
+        rider_registry.apply_row(new_rider)
 
         return RiderResponse(**new_rider)
 
@@ -33,50 +44,74 @@ def register_rider(rider: RiderCreate, current_user: dict = Depends(get_current_
 
     finally:
         cursor.close()
-        conn.close()
 
-@router.get("/{rider_id}", response_model=RiderResponse)
-def get_rider(rider_id: int):
-    """Retrieves a rider's details"""
-    conn = get_db_connection()
-    if not conn:
-        raise HTTPException(status_code=500, detail="Database connection failed")
+@router.post("/locations", status_code=202, response_model=LocationBatchResponse)
+async def ingest_rider_locations(batch: LocationBatch, current_user: dict = Depends(get_current_user)):
+    """Accepts a batch of GPS pings; positions are written to the database on the next flush.
 
-    cursor = conn.cursor(cursor_factory=RealDictCursor)
-    cursor.execute("SELECT * FROM riders WHERE id = %s", (rider_id,))
-    rider = cursor.fetchone()
+    Pings count only for riders registered to the caller; admin tokens (fleet
+    gateways) may report any rider.
+    """
+    owner_id = None if current_user.get("is_admin") else current_user["user_id"]
+    accepted, rejected = location_ingestor.add(batch.pings, owner_id)
+    return LocationBatchResponse(accepted=accepted, rejected=rejected, pending_riders=location_ingestor.pending)
 
-    cursor.close()
-    conn.close()
+async def _load_rider(rider_id):
+    async with async_db_connection() as conn:
+        rider = await conn.fetchrow(RIDER_LOOKUP, rider_id)
+    return row_dict(RIDER_COLUMNS, rider) if rider else None
+
+@router.get("/{rider_id}", response_model=RiderResponse)
+async def get_rider(rider_id: int):
+    """Retrieves a rider's details"""
+    # Cache hits never check out a database connection.
+    rider = await lookup_cache.get_or_load(rider_key(rider_id), lambda: _load_rider(rider_id))
 
     if not rider:
         raise HTTPException(status_code=404, detail="Rider not found")
 
-    return RiderResponse(**rider)
+    return RowJSONResponse(rider)
 
 @router.patch("/{rider_id}/status", response_model=RiderResponse)
-def update_rider_status(rider_id: int, status_update: RiderStatusUpdate):
+async def update_rider_status(rider_id: int, status_update: RiderStatusUpdate, conn=Depends(get_async_db)):
     """Updates rider status (Available/Busy)"""
-    conn = get_db_connection()
-    if not conn:
-        raise HTTPException(status_code=500, detail="Database connection failed")
+    try:
+        updated_rider = await rider_registry.set_status(conn, rider_id, status_update.status)
 
-    cursor = conn.cursor(cursor_factory=RealDictCursor)
+        if not updated_rider:
+            raise HTTPException(status_code=404, detail="Rider not found")
 
+        await lookup_cache.invalidate(rider_key(rider_id))
+
+        if status_update.status == "Available":
+            dispatched = await dispatch_queue.offer_rider(conn, rider_id)
+            if dispatched is not None:
+                # Taken straight off the queue, so the rider is already Busy again.
+                updated_rider = await conn.fetchrow("SELECT * FROM riders WHERE id = $1", rider_id)
+
+        return RiderResponse(**updated_rider)
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+
+@router.patch("/{rider_id}/location", response_model=RiderResponse)
+async def update_rider_location(rider_id: int, location: RiderLocationUpdate, current_user: dict = Depends(get_current_user), conn=Depends(get_async_db)):
+    """Updates a rider's current position (the rider's own user, or an admin)"""
+    if not current_user.get("is_admin") and not rider_registry.is_owned_by(rider_id, current_user["user_id"]):
+        raise HTTPException(status_code=403, detail="Not allowed to update this rider")
     try:
-        cursor.execute("UPDATE riders SET status = %s WHERE id = %s RETURNING *", (status_update.status, rider_id))
-        updated_rider = cursor.fetchone()
-        conn.commit()
+        updated_rider = await rider_registry.set_location(conn, rider_id, location.latitude, location.longitude)
 
         if not updated_rider:
             raise HTTPException(status_code=404, detail="Rider not found")
 
+        await lookup_cache.invalidate(rider_key(rider_id))
+
         return RiderResponse(**updated_rider)
 
+    except HTTPException:
+        raise
     except Exception as e:
-        conn.rollback()
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
-
-    finally:
-        cursor.close()
-        conn.close()
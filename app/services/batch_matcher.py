@@ -0,0 +1,274 @@
+import asyncio
+import os
+import time
+
+import numpy as np
+from fastapi import HTTPException
+
+from app.database.async_db import async_db_pool
+from app.services.ride_events import publish_ride_update
+from app.services.rider_registry import rider_registry
+from app.services.spatial_index import MATCH_MAX_PICKUP_KM, rider_index
+from app.utils.geo import haversine_km_array
+
+MATCHING_MODE = os.getenv("MATCHING_MODE", "greedy")  # greedy | batch
+BATCH_WINDOW_MS = float(os.getenv("MATCHING_BATCH_WINDOW_MS", "200"))
+BATCH_MAX_SIZE = int(os.getenv("MATCHING_BATCH_MAX_SIZE", "100"))
+# Riders shortlisted per request; the batch is solved over the union of all shortlists.
+BATCH_CANDIDATES = int(os.getenv("MATCHING_BATCH_CANDIDATES", "8"))
+BATCH_ROUNDS = 3
+# Cost of a pairing past MATCH_MAX_PICKUP_KM: high enough that the solver only picks it when a row has nothing else.
+OUT_OF_RANGE_COST = 1e9
+
+def linear_sum_assignment(cost):
+    # scipy.optimize is about half of the app's import time and only batch mode needs it.
+    from scipy.optimize import linear_sum_assignment
+    return linear_sum_assignment(cost)
+
+class BatchMatcher:
+    """Collects bookings for a short window and assigns them together.
+
+    Each flush builds one pickup-distance matrix between the waiting requests
+    and the union of their nearby riders, solves it as a min-cost bipartite
+    matching (minimum total pickup distance instead of first-come-nearest),
+    then claims every chosen rider and inserts every booking in a single
+    transaction. Requests whose rider was taken by another worker in the
+    meantime are re-solved against the remaining riders for a few rounds.
+    """
+
+    def __init__(self, window_ms=BATCH_WINDOW_MS, max_batch=BATCH_MAX_SIZE, candidates=BATCH_CANDIDATES):
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self.candidates = candidates
+        self._pending = []  # (ride, fare, future)
+        self._timer = None
+        self._tasks = set()
+
+        self._batches = 0
+        self._requests = 0
+        self._matched = 0
+        self._pickup_km_total = 0.0
+        self._flush_seconds_total = 0.0
+        self._abandoned = 0
+
+    async def submit(self, ride, fare):
+        """Queues a ride for the next batch and waits for its booking row, or None if no rider was free."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((ride, fare, future))
+
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.ensure_future(self._run(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch):
+        started = time.monotonic()
+        # Requests whose client went away while waiting for the window are not matched at all.
+        batch = [entry for entry in batch if not entry[2].done()]
+        if not batch:
+            return
+        try:
+            async with async_db_pool.connection() as conn:
+                async with conn.transaction():
+                    bookings, failures, pickup_km = await self._assign(conn, batch)
+        except Exception as e:
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(HTTPException(status_code=500, detail=f"Database error: {str(e)}"))
+            return
+
+        # Clients can also leave while the batch is being solved and committed; their rides
+        # are canceled again rather than left Pending and holding a rider.
+        abandoned = [bookings.pop(position) for position in list(bookings) if batch[position][2].done()]
+        if abandoned:
+            try:
+                async with async_db_pool.connection() as conn:
+                    await self._abandon(conn, abandoned)
+            except Exception as e:
+                print(f"❌ Error canceling {len(abandoned)} abandoned bookings: {e}")
+
+        for booking in bookings.values():
+            rider_registry.apply(booking["rider_id"], status="Busy")
+        self._pickup_km_total += sum(pickup_km[position] for position in bookings)
+
+        for position, (_, _, future) in enumerate(batch):
+            if future.done():
+                continue
+            if position in bookings:
+                future.set_result(bookings[position])
+            elif position in failures:
+                future.set_exception(failures[position])
+            else:
+                future.set_result(None)  # no rider free; the caller queues it
+
+        self._batches += 1
+        self._requests += len(batch)
+        self._matched += len(bookings)
+        self._flush_seconds_total += time.monotonic() - started
+
+    async def _abandon(self, conn, bookings):
+        """Cancels bookings nobody is waiting for any more and frees their riders."""
+        async with conn.transaction():
+            canceled = await conn.fetch(
+                """
+                UPDATE bookings SET status = 'Canceled'
+                WHERE id = ANY($1::int[]) AND status = 'Pending'
+                RETURNING id, user_id, rider_id, status, distance, fare, pickup_latitude, pickup_longitude
+                """,
+                [booking["id"] for booking in bookings],
+            )
+            rider_ids = [booking["rider_id"] for booking in canceled]
+            await conn.execute("UPDATE riders SET status = 'Available' WHERE id = ANY($1::int[])", rider_ids)
+            for booking in canceled:
+                await rider_registry.publish(conn, booking["rider_id"], status="Available")
+                await publish_ride_update(conn, booking)
+        for rider_id in rider_ids:
+            rider_registry.apply(rider_id, status="Available")
+        self._abandoned += len(canceled)
+
+    async def _assign(self, conn, batch):
+        """Claims riders and inserts bookings for ``batch``; returns ``(bookings, failures, pickup_km)`` by batch position."""
+        rides = [ride for ride, _, _ in batch]
+        failures = {}
+
+        known_users = await conn.fetch("SELECT id FROM users WHERE id = ANY($1::int[])", list({ride.user_id for ride in rides}))
+        known_user_ids = {row["id"] for row in known_users}
+        open_requests = []
+        for position, ride in enumerate(rides):
+            if ride.user_id in known_user_ids:
+                open_requests.append(position)
+            else:
+                failures[position] = HTTPException(status_code=400, detail="User does not exist")
+
+        assigned = {}  # batch position -> rider_id
+        pickup_km = {}  # batch position -> straight-line pickup distance of its rider
+        excluded = set()
+        for _ in range(BATCH_ROUNDS):
+            if not open_requests:
+                break
+
+            # Requests from the same neighbourhood share shortlists, so widen them to at least the batch size.
+            k = max(self.candidates, len(open_requests)) + len(excluded)
+            candidate_ids = []
+            seen = set(excluded)
+            for position in open_requests:
+                ride = rides[position]
+                for _, rider_id in rider_index.nearest(ride.pickup_latitude, ride.pickup_longitude, k=k, max_radius_km=MATCH_MAX_PICKUP_KM):
+                    if rider_id not in seen:
+                        seen.add(rider_id)
+                        candidate_ids.append(rider_id)
+            positions = {rider_id: rider_index.position(rider_id) for rider_id in candidate_ids}
+            candidate_ids = [rider_id for rider_id in candidate_ids if positions[rider_id] is not None]
+            if not candidate_ids:
+                break
+
+            rider_coords = np.array([positions[rider_id] for rider_id in candidate_ids], dtype=float)
+            pickup_coords = np.array([(rides[p].pickup_latitude, rides[p].pickup_longitude) for p in open_requests], dtype=float)
+            cost = haversine_km_array(pickup_coords[:, 0:1], pickup_coords[:, 1:2], rider_coords[:, 0], rider_coords[:, 1])
+            # The solver gives every row a column when riders outnumber requests, so a request whose own
+            # shortlist is empty would be handed someone else's rider; those pairings are dropped and
+            # the request is left for the dispatch queue.
+            cost[cost > MATCH_MAX_PICKUP_KM] = OUT_OF_RANGE_COST
+            request_rows, rider_cols = linear_sum_assignment(cost)
+            in_range = cost[request_rows, rider_cols] < OUT_OF_RANGE_COST
+            request_rows, rider_cols = request_rows[in_range], rider_cols[in_range]
+            if not len(request_rows):
+                break
+
+            chosen = {open_requests[r]: candidate_ids[c] for r, c in zip(request_rows, rider_cols)}
+            claimed = await conn.fetch(
+                """
+                UPDATE riders SET status = 'Busy'
+                WHERE id IN (
+                    SELECT id FROM riders
+                    WHERE id = ANY($1::int[]) AND status = 'Available'
+                    FOR UPDATE SKIP LOCKED
+                )
+                RETURNING id
+                """,
+                list(chosen.values()),
+            )
+            claimed_ids = {row["id"] for row in claimed}
+            for rider_id in claimed_ids:
+                await rider_registry.publish(conn, rider_id, status="Busy")
+
+            for r, c in zip(request_rows, rider_cols):
+                if candidate_ids[c] in claimed_ids:
+                    pickup_km[open_requests[r]] = float(cost[r, c])
+
+            lost = [rider_id for rider_id in chosen.values() if rider_id not in claimed_ids]
+            if lost:
+                taken = await conn.fetch("SELECT id, status FROM riders WHERE id = ANY($1::int[]) AND status <> 'Available'", lost)
+                for row in taken:
+                    rider_registry.apply(row["id"], status=row["status"])
+                excluded.update(lost)
+
+            for position, rider_id in chosen.items():
+                if rider_id in claimed_ids:
+                    assigned[position] = rider_id
+            excluded.update(claimed_ids)
+            open_requests = [position for position in open_requests if position not in assigned]
+
+        # Release the riders of requests abandoned during the solve, before any booking exists.
+        released = [assigned.pop(position) for position in list(assigned) if batch[position][2].done()]
+        if released:
+            await conn.execute("UPDATE riders SET status = 'Available' WHERE id = ANY($1::int[])", released)
+            for rider_id in released:
+                await rider_registry.publish(conn, rider_id, status="Available")
+
+        if not assigned:
+            return {}, failures, pickup_km
+
+        order = list(assigned)
+        rows = await conn.fetch(
+            """
+            INSERT INTO bookings (user_id, rider_id, status, distance, fare, pickup_latitude, pickup_longitude)
+            SELECT user_id, rider_id, 'Pending', distance, fare, pickup_latitude, pickup_longitude
+            FROM unnest($1::int[], $2::int[], $3::int[], $4::int[], $5::float8[], $6::float8[])
+                AS t(user_id, rider_id, distance, fare, pickup_latitude, pickup_longitude)
+            RETURNING id, user_id, rider_id, status, distance, fare, pickup_latitude, pickup_longitude
+            """,
+            [rides[p].user_id for p in order],
+            [assigned[p] for p in order],
+            [rides[p].distance for p in order],
+            [batch[p][1] for p in order],
+            [rides[p].pickup_latitude for p in order],
+            [rides[p].pickup_longitude for p in order],
+        )
+        # Riders are unique within the batch, so they identify which request each row belongs to.
+        position_by_rider = {rider_id: position for position, rider_id in assigned.items()}
+        bookings = {position_by_rider[row["rider_id"]]: dict(row) for row in rows}
+        for booking in bookings.values():
+            await publish_ride_update(conn, booking)
+        return bookings, failures, pickup_km
+
+    def stats(self):
+        return {
+            "mode": MATCHING_MODE,
+            "window_ms": self.window * 1000,
+            "max_batch": self.max_batch,
+            "batches": self._batches,
+            "requests": self._requests,
+            "matched": self._matched,
+            "abandoned": self._abandoned,
+            "avg_batch_size": round(self._requests / self._batches, 2) if self._batches else 0.0,
+            "avg_pickup_km": round(self._pickup_km_total / self._matched, 3) if self._matched else 0.0,
+            "avg_flush_ms": round(1000 * self._flush_seconds_total / self._batches, 3) if self._batches else 0.0,
+        }
+
+batch_matcher = BatchMatcher()
+if MATCHING_MODE == "batch":
+    import scipy.optimize  # noqa: F401 -- load it up front (before the fork when the app is preloaded)
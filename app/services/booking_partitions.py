@@ -0,0 +1,107 @@
+import asyncio
+import os
+
+from app.database.async_db import async_db_pool
+
+# Monthly bookings partitions kept created ahead of the current month.
+BOOKING_PARTITIONS_AHEAD = int(os.getenv("BOOKING_PARTITIONS_AHEAD", "2"))
+# Finished rides older than this move from bookings to bookings_archive, a month at a time.
+BOOKING_RETENTION_DAYS = int(os.getenv("BOOKING_RETENTION_DAYS", "90"))
+# Status lookups and updates look only this far back first; older bookings cost a scan of every partition.
+BOOKING_HOT_DAYS = int(os.getenv("BOOKING_HOT_DAYS", "2"))
+BOOKING_MAINTENANCE_SECONDS = 3600
+
+# Lookups return these columns in this order (the RideResponse fields).
+BOOKING_COLUMNS = ("id", "user_id", "rider_id", "status", "distance", "fare", "pickup_latitude", "pickup_longitude")
+_SELECT = "SELECT " + ", ".join(BOOKING_COLUMNS)
+
+# ``now()`` is stable, so Postgres prunes to the partitions inside the window when the query starts.
+HOT_BOOKING_QUERY = f"{_SELECT} FROM bookings WHERE id = $1 AND created_at >= now() - make_interval(days => $2)"
+ANY_BOOKING_QUERY = f"{_SELECT} FROM bookings WHERE id = $1 UNION ALL {_SELECT} FROM bookings_archive WHERE id = $1 LIMIT 1"
+HOT_STATUS_UPDATE = "UPDATE bookings SET status = $1 WHERE id = $2 AND created_at >= now() - make_interval(days => $3) RETURNING *"
+ANY_STATUS_UPDATE = "UPDATE bookings SET status = $1 WHERE id = $2 RETURNING *"
+
+async def fetch_booking(conn, booking_id):
+    """The booking row, searching the recent partitions before the rest of the history and the archive."""
+    booking = await conn.fetchrow(HOT_BOOKING_QUERY, booking_id, BOOKING_HOT_DAYS)
+    if booking is None:
+        booking_partitions.cold_lookups += 1
+        booking = await conn.fetchrow(ANY_BOOKING_QUERY, booking_id)
+    return booking
+
+async def set_booking_status(conn, booking_id, status):
+    """Sets a booking's status and returns the updated row, or None if it is not in the live table.
+
+    Archived bookings are finished rides and cannot change any more.
+    """
+    booking = await conn.fetchrow(HOT_STATUS_UPDATE, status, booking_id, BOOKING_HOT_DAYS)
+    if booking is None:
+        booking_partitions.cold_lookups += 1
+        booking = await conn.fetchrow(ANY_STATUS_UPDATE, status, booking_id)
+    return booking
+
+class BookingPartitionManager:
+    """Keeps the monthly ``bookings`` partitions ahead of time and archives old ones.
+
+    Every worker runs ``maintain`` at startup and then hourly; the database
+    functions it calls (migration 6) serialise on an advisory lock and are
+    no-ops when there is nothing to do, so running it everywhere is cheap and
+    nobody has to remember to schedule it.
+    """
+
+    def __init__(self, months_ahead=BOOKING_PARTITIONS_AHEAD, retention_days=BOOKING_RETENTION_DAYS, interval=BOOKING_MAINTENANCE_SECONDS):
+        self.months_ahead = months_ahead
+        self.retention_days = retention_days
+        self.interval = interval
+        self._task = None
+
+        self.cold_lookups = 0
+        self._runs = 0
+        self._failures = 0
+        self._created = 0
+        self._archived = 0
+
+    async def maintain(self):
+        try:
+            async with async_db_pool.connection() as conn:
+                created = await conn.fetchval("SELECT ensure_booking_partitions(now(), $1)", self.months_ahead)
+                archived = await conn.fetchval("SELECT archive_booking_partitions(make_interval(days => $1))", self.retention_days)
+        except Exception as e:
+            self._failures += 1
+            print(f"❌ Error maintaining booking partitions: {e}")
+            return
+
+        self._runs += 1
+        self._created += created
+        self._archived += archived
+        if created or archived:
+            print(f"✅ Booking partitions: {created} created, {archived} archived")
+
+    async def _run(self):
+        while True:
+            await self.maintain()
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            task, self._task = self._task, None
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+    def stats(self):
+        return {
+            "months_ahead": self.months_ahead,
+            "retention_days": self.retention_days,
+            "hot_days": BOOKING_HOT_DAYS,
+            "runs": self._runs,
+            "failures": self._failures,
+            "partitions_created": self._created,
+            "partitions_archived": self._archived,
+            "cold_lookups": self.cold_lookups,
+        }
+
+booking_partitions = BookingPartitionManager()
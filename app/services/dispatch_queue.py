@@ -0,0 +1,379 @@
+import asyncio
+import heapq
+import json
+import os
+import time
+from collections import namedtuple
+
+from app.database.async_db import async_db_pool
+from app.database.notify import pg_listener
+from app.services.booking_partitions import BOOKING_HOT_DAYS
+from app.services.lookup_cache import lookup_cache, ride_key, rider_key
+from app.services.ride_events import RIDE_STATUS_CHANNEL, publish_ride_update
+from app.services.rider_registry import rider_registry
+from app.services.spatial_index import rider_index
+from app.utils.geo import KM_PER_DEGREE_LAT
+
+# Queued rides still unassigned after this long are canceled, so nobody waits forever.
+DISPATCH_MAX_WAIT_SECONDS = float(os.getenv("DISPATCH_MAX_WAIT_SECONDS", "300"))
+# Head start in the queue, in seconds of waiting, per 1000 of fare.
+DISPATCH_FARE_PRIORITY = float(os.getenv("DISPATCH_FARE_PRIORITY", "0.2"))
+# Rings of spatial-index cells around a freed rider whose queued rides it can take (1 = 3x3 cells).
+DISPATCH_NEIGHBOURHOOD_RINGS = int(os.getenv("DISPATCH_NEIGHBOURHOOD_RINGS", "2"))
+DISPATCH_SWEEP_MS = float(os.getenv("DISPATCH_SWEEP_MS", "1000"))
+# Queued rides / nearby riders tried per dispatch before giving up until the next event.
+DISPATCH_CANDIDATES = 5
+# Queued rides a sweep retries at most; cells with no free rider nearby cost a few dict lookups and no retry.
+DISPATCH_SWEEP_BATCH = 100
+
+BOOKING_RETURNING = "RETURNING id, user_id, rider_id, status, distance, fare, pickup_latitude, pickup_longitude"
+
+QueuedRide = namedtuple("QueuedRide", ["priority", "cell", "latitude", "longitude", "queued_at"])
+
+class DispatchQueue:
+    """Rides booked while no rider was free, matched as soon as one frees up.
+
+    Such a booking is stored Pending with no rider and the client gets it back
+    right away; the assignment later reaches it over the ride status stream.
+    Every worker keeps the queue in per-cell heaps of the spatial grid, fed by
+    the ``ride_status`` notifications bookings already send, so whichever
+    worker frees a rider (a completed or canceled ride, or a rider switching
+    back to Available) hands it straight to the best queued ride nearby. The
+    priority is the time queued minus a head start proportional to the fare.
+    A periodic sweep retries queued rides against riders that became
+    available some other way and cancels the ones that waited too long.
+    Postgres row locks decide every assignment, so workers racing for the same
+    ride or rider cannot double-assign either.
+    """
+
+    def __init__(self, index=rider_index, max_wait_seconds=DISPATCH_MAX_WAIT_SECONDS, fare_priority=DISPATCH_FARE_PRIORITY,
+                 rings=DISPATCH_NEIGHBOURHOOD_RINGS, sweep_ms=DISPATCH_SWEEP_MS):
+        self.index = index
+        self.max_wait = max_wait_seconds
+        self.fare_priority = fare_priority
+        self.rings = rings
+        self.interval = sweep_ms / 1000
+        # The sweep looks about as far as a freed rider's neighbourhood reaches.
+        self.max_pickup_km = (rings + 0.5) * index.cell_size_deg * KM_PER_DEGREE_LAT
+        self._queued = {}  # booking_id -> QueuedRide
+        self._heaps = {}  # cell -> heap of (priority, booking_id); entries of dequeued rides are skipped lazily
+        self._by_age = []  # heap of (queued_at, booking_id) for expiry, skipped lazily the same way
+        self._stale = 0
+        self._task = None
+
+        self._enqueued = 0
+        self._dispatched = 0
+        self._expired = 0
+        self._lost_races = 0
+        self._failures = 0
+
+    def add(self, booking_id, latitude, longitude, fare, queued_at=None):
+        if booking_id in self._queued or latitude is None or longitude is None:
+            return
+        queued_at = time.time() if queued_at is None else queued_at
+        priority = queued_at - self.fare_priority * fare / 1000
+        cell = self.index.cells_near(latitude, longitude, 0)[0]
+        self._queued[booking_id] = QueuedRide(priority, cell, latitude, longitude, queued_at)
+        heapq.heappush(self._heaps.setdefault(cell, []), (priority, booking_id))
+        heapq.heappush(self._by_age, (queued_at, booking_id))
+
+    def discard(self, booking_id):
+        if self._queued.pop(booking_id, None) is None:
+            return
+        self._stale += 1
+        if self._stale > len(self._queued) + 1024:
+            self._compact()
+
+    def _compact(self):
+        self._heaps = {}
+        for booking_id, ride in self._queued.items():
+            self._heaps.setdefault(ride.cell, []).append((ride.priority, booking_id))
+        for heap in self._heaps.values():
+            heapq.heapify(heap)
+        self._by_age = [(ride.queued_at, booking_id) for booking_id, ride in self._queued.items()]
+        heapq.heapify(self._by_age)
+        self._stale = 0
+
+    def _live(self, entry):
+        ride = self._queued.get(entry[1])
+        return ride is not None and ride.priority == entry[0]
+
+    def _live_entries(self, cell):
+        """The cell's heap with dead entries popped off its head, or None once it is empty."""
+        heap = self._heaps.get(cell)
+        if heap is None:
+            return None
+        while heap and not self._live(heap[0]):
+            heapq.heappop(heap)
+        if not heap:
+            del self._heaps[cell]
+            return None
+        return heap
+
+    def _best(self, cells, k):
+        """Up to ``k`` live ``(priority, booking_id)`` entries across the heaps of ``cells``, best first.
+
+        Each heap is walked as the binary tree its array already is, from the
+        head down, so a call touches about ``k`` entries per cell plus any dead
+        ones on the way rather than copying whole heaps.
+        """
+        frontier = []
+        for cell in cells:
+            heap = self._live_entries(cell)
+            if heap is not None:
+                frontier.append((heap[0], 0, cell))
+        heapq.heapify(frontier)
+        best = []
+        seen = set()
+        while frontier and len(best) < k:
+            entry, position, cell = heapq.heappop(frontier)
+            if entry[1] not in seen and self._live(entry):
+                seen.add(entry[1])
+                best.append(entry)
+            heap = self._heaps[cell]
+            for child in (2 * position + 1, 2 * position + 2):
+                if child < len(heap):
+                    heapq.heappush(frontier, (heap[child], child, cell))
+        return best
+
+    def candidates_near(self, latitude, longitude, k=DISPATCH_CANDIDATES):
+        """Ids of the ``k`` highest-priority queued rides around a point, best first."""
+        return [booking_id for _, booking_id in self._best(self.index.cells_near(latitude, longitude, self.rings), k)]
+
+    async def enqueue(self, conn, ride, fare):
+        """Stores a booking with no rider yet and returns its row; call inside the booking's transaction."""
+        booking = await conn.fetchrow(
+            f"""
+            INSERT INTO bookings (user_id, rider_id, status, distance, fare, pickup_latitude, pickup_longitude)
+            VALUES ($1, NULL, 'Pending', $2, $3, $4, $5)
+            {BOOKING_RETURNING}
+            """,
+            ride.user_id, ride.distance, fare, ride.pickup_latitude, ride.pickup_longitude,
+        )
+        await publish_ride_update(conn, booking)
+        self.add(booking["id"], ride.pickup_latitude, ride.pickup_longitude, fare)
+        self._enqueued += 1
+        return booking
+
+    async def _assign(self, conn, rider_ids, booking_ids):
+        """Gives the first claimable rider of ``rider_ids`` to the first still-queued ride of ``booking_ids``."""
+        async with conn.transaction():
+            booking_id = await conn.fetchval(
+                """
+                SELECT id FROM bookings
+                WHERE id = ANY($1::int[]) AND rider_id IS NULL AND status = 'Pending'
+                  AND created_at >= now() - make_interval(days => $2)
+                ORDER BY array_position($1::int[], id)
+                LIMIT 1
+                FOR UPDATE SKIP LOCKED
+                """,
+                booking_ids, BOOKING_HOT_DAYS,
+            )
+            if booking_id is None:
+                self._lost_races += 1
+                return None
+
+            rider_id = await conn.fetchval(
+                """
+                UPDATE riders SET status = 'Busy'
+                WHERE id = (
+                    SELECT id FROM riders
+                    WHERE id = ANY($1::int[]) AND status = 'Available'
+                    ORDER BY array_position($1::int[], id)
+                    LIMIT 1
+                    FOR UPDATE SKIP LOCKED
+                )
+                RETURNING id
+                """,
+                rider_ids,
+            )
+            if rider_id is None:
+                self._lost_races += 1
+                return None
+
+            booking = await conn.fetchrow(
+                f"""
+                UPDATE bookings SET rider_id = $1
+                WHERE id = $2 AND rider_id IS NULL AND status = 'Pending' AND created_at >= now() - make_interval(days => $3)
+                {BOOKING_RETURNING}
+                """,
+                rider_id, booking_id, BOOKING_HOT_DAYS,
+            )
+            if booking is None:
+                # The ride was canceled or moved under us; give the rider back within the same transaction.
+                await conn.execute("UPDATE riders SET status = 'Available' WHERE id = $1", rider_id)
+            else:
+                await rider_registry.publish(conn, rider_id, status="Busy")
+                await publish_ride_update(conn, booking)
+
+        self.discard(booking_id)
+        if booking is None:
+            self._lost_races += 1
+            return None
+        rider_registry.apply(rider_id, status="Busy")
+        await lookup_cache.invalidate(ride_key(booking_id), rider_key(rider_id))
+        self._dispatched += 1
+        return booking
+
+    async def offer_rider(self, conn, rider_id):
+        """Hands a rider that just became available to the best queued ride near it; returns that booking or None."""
+        if not self._queued:
+            return None
+        position = self.index.position(rider_id)
+        if position is None:
+            return None
+        booking_ids = self.candidates_near(*position)
+        if not booking_ids:
+            return None
+        try:
+            return await self._assign(conn, [rider_id], booking_ids)
+        except Exception as e:
+            # The rider stays Available; the next sweep retries.
+            self._failures += 1
+            print(f"❌ Error dispatching rider {rider_id}: {e}")
+            return None
+
+    async def _expire(self, conn, booking_ids):
+        async with conn.transaction():
+            rows = await conn.fetch(
+                f"""
+                UPDATE bookings SET status = 'Canceled'
+                WHERE id = ANY($1::int[]) AND rider_id IS NULL AND status = 'Pending'
+                {BOOKING_RETURNING}
+                """,
+                booking_ids,
+            )
+            for booking in rows:
+                await publish_ride_update(conn, booking)
+        # The rest were assigned, canceled or deleted meanwhile.
+        for booking_id in booking_ids:
+            self.discard(booking_id)
+        if rows:
+            await lookup_cache.invalidate(*(ride_key(booking["id"]) for booking in rows))
+        self._expired += len(rows)
+
+    def _pop_expired(self, now):
+        """Pops the rides queued longer than the maximum wait off the age heap, oldest first."""
+        expired = []
+        while self._by_age and self._by_age[0][0] < now - self.max_wait:
+            queued_at, booking_id = heapq.heappop(self._by_age)
+            ride = self._queued.get(booking_id)
+            if ride is not None and ride.queued_at == queued_at:
+                expired.append(booking_id)
+        return expired
+
+    def _retryable(self):
+        """``(booking_id, rider_ids)`` for queued rides with riders the index shows free nearby.
+
+        Walks the occupied cells rather than the rides, skipping any cell whose
+        neighbourhood has no free rider, so a long queue with no riders around
+        costs a few lookups per cell and no nearest-rider search.
+        """
+        retry = []
+        if not self.index.total_available():
+            return retry
+        for cell in list(self._heaps):
+            heap = self._live_entries(cell)
+            if heap is None:
+                continue
+            head = self._queued[heap[0][1]]
+            if not self.index.count_available(self.index.cells_near(head.latitude, head.longitude, self.rings)):
+                continue
+            for _, booking_id in self._best([cell], DISPATCH_CANDIDATES):
+                ride = self._queued[booking_id]
+                nearby = self.index.nearest(ride.latitude, ride.longitude, k=DISPATCH_CANDIDATES, max_radius_km=self.max_pickup_km)
+                if nearby:
+                    retry.append((booking_id, [rider_id for _, rider_id in nearby]))
+            if len(retry) >= DISPATCH_SWEEP_BATCH:
+                break
+        return retry
+
+    async def sweep(self):
+        """Cancels rides past the maximum wait and retries the best ones against riders the index shows free."""
+        if not self._queued:
+            return
+        expired = self._pop_expired(time.time())
+        retry = self._retryable()
+        if not expired and not retry:
+            return
+
+        try:
+            async with async_db_pool.connection() as conn:
+                if expired:
+                    try:
+                        await self._expire(conn, expired)
+                    except Exception as e:
+                        # Put them back so the next sweep cancels them.
+                        for booking_id in expired:
+                            ride = self._queued.get(booking_id)
+                            if ride is not None:
+                                heapq.heappush(self._by_age, (ride.queued_at, booking_id))
+                        self._failures += 1
+                        print(f"❌ Error expiring queued rides: {e}")
+                for booking_id, rider_ids in retry:
+                    if booking_id not in self._queued:
+                        continue
+                    try:
+                        await self._assign(conn, rider_ids, [booking_id])
+                    except Exception as e:
+                        # Like offer_rider: one failed assignment must not hold up the rest of the sweep.
+                        self._failures += 1
+                        print(f"❌ Error dispatching queued ride {booking_id}: {e}")
+        except Exception as e:
+            self._failures += 1
+            print(f"❌ Error sweeping dispatch queue: {e}")
+
+    async def rebuild(self, conn):
+        """Loads every ride still waiting for a rider, e.g. after a restart."""
+        rows = await conn.fetch(
+            """
+            SELECT id, fare, pickup_latitude, pickup_longitude, extract(epoch FROM created_at)::float8 AS queued_at
+            FROM bookings WHERE status = 'Pending' AND rider_id IS NULL
+            """
+        )
+        self._queued.clear()
+        self._heaps.clear()
+        self._by_age = []
+        self._stale = 0
+        for row in rows:
+            self.add(row["id"], row["pickup_latitude"], row["pickup_longitude"], row["fare"], row["queued_at"])
+        print(f"✅ Dispatch queue loaded with {len(self._queued)} waiting rides")
+
+    def handle_ride_update(self, payload):
+        booking = json.loads(payload)
+        if booking.get("status") == "Pending" and booking.get("rider_id") is None:
+            self.add(booking["id"], booking.get("pickup_latitude"), booking.get("pickup_longitude"), booking["fare"])
+        else:
+            self.discard(booking["id"])
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.sweep()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            task, self._task = self._task, None
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+    def stats(self):
+        now = time.time()
+        return {
+            "queued": len(self._queued),
+            "occupied_cells": len(self._heaps),
+            "longest_wait_seconds": round(max((now - ride.queued_at for ride in self._queued.values()), default=0.0), 1),
+            "enqueued": self._enqueued,
+            "dispatched": self._dispatched,
+            "expired": self._expired,
+            "lost_races": self._lost_races,
+            "failures": self._failures,
+        }
+
+dispatch_queue = DispatchQueue()
+pg_listener.add_handler(RIDE_STATUS_CHANNEL, dispatch_queue.handle_ride_update)
+pg_listener.add_resync(dispatch_queue.rebuild)
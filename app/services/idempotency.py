@@ -0,0 +1,186 @@
+import asyncio
+import hashlib
+import json
+import os
+
+from fastapi import HTTPException
+
+from app.database.async_db import async_db_connection, async_db_pool
+from app.utils.cache import TTLCache
+
+IDEMPOTENCY_TTL_SECONDS = float(os.getenv("IDEMPOTENCY_TTL_SECONDS", "86400"))
+IDEMPOTENCY_CACHE_SIZE = int(os.getenv("IDEMPOTENCY_CACHE_SIZE", "100000"))
+# A reservation still without a response after this long is taken to belong to a worker that
+# died (or could not store the response) and may be taken over; it must comfortably exceed the
+# slowest operation, or a slow first attempt could run concurrently with its retry.
+IDEMPOTENCY_LEASE_SECONDS = float(os.getenv("IDEMPOTENCY_LEASE_SECONDS", "30"))
+IDEMPOTENCY_PURGE_SECONDS = 600
+IDEMPOTENCY_STORE_ATTEMPTS = 3
+
+def request_fingerprint(body):
+    """Short digest of a request body, so a key reused for a different request can be told apart."""
+    return hashlib.sha256(body.encode()).hexdigest()[:32]
+
+class IdempotencyStore:
+    """Runs an operation at most once per ``(user, Idempotency-Key)`` and replays its result.
+
+    Postgres holds the authoritative record (``idempotency_keys``): the first
+    request reserves the key, runs the operation and stores the response, so
+    a retry that lands on any worker gets that response back without running
+    the operation again. Each worker also keeps recent responses in a bounded
+    TTL cache and shares in-flight executions, so a retry hitting the same
+    worker costs no database round trip at all. Keys are honoured for ``ttl``
+    seconds; a failed operation releases its key so the client can retry, and a
+    reservation left without a response (a crashed worker) lapses after
+    ``lease`` seconds instead of blocking the key for the whole ``ttl``.
+    """
+
+    def __init__(self, ttl=IDEMPOTENCY_TTL_SECONDS, maxsize=IDEMPOTENCY_CACHE_SIZE, lease=IDEMPOTENCY_LEASE_SECONDS):
+        self.ttl = ttl
+        self.lease = lease
+        self.cache = TTLCache(maxsize=maxsize, ttl=ttl)  # (user_id, key) -> (fingerprint, response)
+        self._inflight = {}  # (user_id, key) -> (fingerprint, future)
+        self._task = None
+
+        self._executions = 0
+        self._replays = 0
+        self._in_progress_conflicts = 0
+        self._mismatches = 0
+        self._takeovers = 0
+        self._store_failures = 0
+
+    def _check(self, stored_fingerprint, fingerprint):
+        if stored_fingerprint != fingerprint:
+            self._mismatches += 1
+            raise HTTPException(status_code=422, detail="Idempotency-Key was already used for a different request")
+
+    async def run(self, user_id, key, fingerprint, operation):
+        """Returns ``(response, replayed)``; ``operation()`` must return a JSON-able dict."""
+        scope = (user_id, key)
+        cached = self.cache.get(scope)
+        if cached is not None:
+            self._check(cached[0], fingerprint)
+            self._replays += 1
+            return cached[1], True
+
+        inflight = self._inflight.get(scope)
+        if inflight is not None:
+            self._check(inflight[0], fingerprint)
+            response = await asyncio.shield(inflight[1])
+            self._replays += 1
+            return response, True
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[scope] = (fingerprint, future)
+        try:
+            response, replayed = await self._run_once(user_id, key, fingerprint, operation)
+            self.cache.set(scope, (fingerprint, response))
+            future.set_result(response)
+            return response, replayed
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception()  # waiters re-raise it; don't warn about it going unretrieved
+            raise
+        finally:
+            del self._inflight[scope]
+
+    async def _run_once(self, user_id, key, fingerprint, operation):
+        async with async_db_connection() as conn:
+            # Reserve the key, or take it over if the previous record has expired or its
+            # reservation lapsed without a response. ``xmax <> 0`` marks a takeover.
+            reserved = await conn.fetchval(
+                """
+                INSERT INTO idempotency_keys (user_id, key, fingerprint) VALUES ($1, $2, $3)
+                ON CONFLICT (user_id, key) DO UPDATE
+                    SET fingerprint = EXCLUDED.fingerprint, response = NULL, created_at = now()
+                    WHERE idempotency_keys.created_at < now() - make_interval(secs => $4)
+                       OR (idempotency_keys.response IS NULL AND idempotency_keys.created_at < now() - make_interval(secs => $5))
+                RETURNING xmax <> 0
+                """,
+                user_id, key, fingerprint, self.ttl, self.lease,
+            )
+            if reserved is None:
+                existing = await conn.fetchrow("SELECT fingerprint, response FROM idempotency_keys WHERE user_id = $1 AND key = $2", user_id, key)
+
+        if reserved is None:
+            self._check(existing["fingerprint"], fingerprint)
+            if existing["response"] is None:
+                self._in_progress_conflicts += 1
+                raise HTTPException(status_code=409, detail="A request with this Idempotency-Key is still in progress")
+            self._replays += 1
+            return json.loads(existing["response"]), True
+        if reserved:
+            self._takeovers += 1
+
+        try:
+            response = await operation()
+        except BaseException:
+            await asyncio.shield(self._release(user_id, key))
+            raise
+
+        self._executions += 1
+        await asyncio.shield(self._store(user_id, key, json.dumps(response)))
+        return response, False
+
+    async def _store(self, user_id, key, response):
+        # The operation already succeeded, so keep trying: until the response is stored other
+        # workers answer 409, and once the lease lapses a retry would run the operation again.
+        for attempt in range(IDEMPOTENCY_STORE_ATTEMPTS):
+            try:
+                async with async_db_connection() as conn:
+                    await conn.execute(
+                        "UPDATE idempotency_keys SET response = $3::jsonb WHERE user_id = $1 AND key = $2",
+                        user_id, key, response,
+                    )
+                return
+            except Exception as e:
+                print(f"❌ Error storing idempotent response (attempt {attempt + 1}/{IDEMPOTENCY_STORE_ATTEMPTS}): {e}")
+                if attempt + 1 < IDEMPOTENCY_STORE_ATTEMPTS:
+                    await asyncio.sleep(0.1 * 2 ** attempt)
+        self._store_failures += 1
+
+    async def _release(self, user_id, key):
+        try:
+            async with async_db_connection() as conn:
+                await conn.execute("DELETE FROM idempotency_keys WHERE user_id = $1 AND key = $2 AND response IS NULL", user_id, key)
+        except Exception as e:
+            print(f"❌ Error releasing idempotency key: {e}")
+
+    async def purge(self):
+        """Deletes expired keys so the table stays proportional to the last ``ttl`` of traffic."""
+        try:
+            async with async_db_pool.connection() as conn:
+                await conn.execute("DELETE FROM idempotency_keys WHERE created_at < now() - make_interval(secs => $1)", self.ttl)
+        except Exception as e:
+            print(f"❌ Error purging idempotency keys: {e}")
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(IDEMPOTENCY_PURGE_SECONDS)
+            await self.purge()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            task, self._task = self._task, None
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+    def stats(self):
+        return {
+            "ttl_seconds": self.ttl,
+            "lease_seconds": self.lease,
+            "in_flight": len(self._inflight),
+            "executions": self._executions,
+            "replays": self._replays,
+            "in_progress_conflicts": self._in_progress_conflicts,
+            "fingerprint_mismatches": self._mismatches,
+            "lapsed_reservations_taken_over": self._takeovers,
+            "response_store_failures": self._store_failures,
+            "cache": self.cache.stats(),
+        }
+
+idempotency_store = IdempotencyStore()
@@ -0,0 +1,177 @@
+import asyncio
+import math
+import os
+import time
+
+import asyncpg
+
+from app.database.async_db import async_db_pool
+from app.services.lookup_cache import lookup_cache, rider_key
+from app.services.rider_registry import rider_registry
+
+LOCATION_FLUSH_MS = float(os.getenv("LOCATION_FLUSH_MS", "250"))
+# Pings stamped further from the server clock than this are rejected: a far-future stamp
+# would shadow every later ping from that rider, and a non-finite one cannot be stored.
+LOCATION_MAX_CLOCK_SKEW_SECONDS = float(os.getenv("LOCATION_MAX_CLOCK_SKEW_SECONDS", "60"))
+LOCATION_MAX_PING_AGE_SECONDS = float(os.getenv("LOCATION_MAX_PING_AGE_SECONDS", "3600"))
+
+# A stored stamp in the future (from before pings were checked) is overwritten, not obeyed.
+LOCATION_UPDATE = """
+    UPDATE riders AS r
+    SET latitude = u.latitude, longitude = u.longitude, location_updated_at = to_timestamp(u.ts)
+    FROM unnest($1::int[], $2::float8[], $3::float8[], $4::float8[]) AS u(id, latitude, longitude, ts)
+    WHERE r.id = u.id
+      AND (r.location_updated_at IS NULL OR r.location_updated_at < to_timestamp(u.ts) OR r.location_updated_at > now())
+    RETURNING r.id, r.latitude, r.longitude
+"""
+
+class LocationIngestor:
+    """Coalesces rider GPS pings in memory and writes them to Postgres in batches.
+
+    Only the newest ping per rider is kept between flushes, so the write load
+    is bounded by the number of moving riders rather than by the ping rate.
+    Every flush is a single ``UPDATE ... FROM unnest(...)`` plus one batched
+    NOTIFY, and the local registry sees each ping as soon as it arrives.
+    """
+
+    def __init__(self, flush_ms=LOCATION_FLUSH_MS, registry=rider_registry,
+                 max_skew=LOCATION_MAX_CLOCK_SKEW_SECONDS, max_age=LOCATION_MAX_PING_AGE_SECONDS):
+        self.interval = flush_ms / 1000
+        self.registry = registry
+        self.max_skew = max_skew
+        self.max_age = max_age
+        self._pending = {}  # rider_id -> (timestamp, latitude, longitude)
+        self._latest = {}  # rider_id -> newest timestamp seen, so late pings are dropped
+        self._task = None
+
+        self._accepted = 0
+        self._rejected = 0
+        self._flushes = 0
+        self._rows_written = 0
+        self._flush_seconds_total = 0.0
+        self._failed_flushes = 0
+        self._dropped_rows = 0
+
+    def _valid(self, rider_id, latitude, longitude, timestamp, now, owner_id):
+        if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+            return False
+        # NaN fails both comparisons, and inf is outside the window.
+        if not (now - self.max_age <= timestamp <= now + self.max_skew):
+            return False
+        if owner_id is not None:
+            return self.registry.is_owned_by(rider_id, owner_id)
+        return self.registry.get(rider_id) is not None
+
+    def add(self, pings, owner_id=None):
+        """Buffers ``(rider_id, latitude, longitude, timestamp)`` pings; returns ``(accepted, rejected)``.
+
+        With ``owner_id`` set, only pings for riders registered to that user are taken.
+        """
+        accepted = rejected = 0
+        now = time.time()
+        for rider_id, latitude, longitude, timestamp in pings:
+            if not self._valid(rider_id, latitude, longitude, timestamp, now, owner_id):
+                rejected += 1
+                continue
+            accepted += 1
+            if timestamp <= self._latest.get(rider_id, float("-inf")):
+                continue  # superseded by a ping we already have
+            self._latest[rider_id] = timestamp
+            self._pending[rider_id] = (timestamp, latitude, longitude)
+            self.registry.apply(rider_id, latitude=latitude, longitude=longitude)
+
+        self._accepted += accepted
+        self._rejected += rejected
+        return accepted, rejected
+
+    @property
+    def pending(self):
+        return len(self._pending)
+
+    async def flush(self):
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, {}
+        started = time.monotonic()
+
+        try:
+            async with async_db_pool.connection() as conn:
+                try:
+                    written = await self._write(conn, batch)
+                except asyncpg.DataError as e:
+                    # One unstorable row fails the whole statement; requeuing it would fail every
+                    # flush from now on, so write the rows one by one and drop the bad ones.
+                    print(f"❌ Rider location batch rejected ({e}), retrying row by row")
+                    written = await self._write_each(conn, batch)
+        except asyncio.CancelledError:
+            self._requeue(batch)
+            raise
+        except Exception as e:
+            self._requeue(batch)
+            self._failed_flushes += 1
+            print(f"❌ Error flushing rider locations: {e}")
+            return
+
+        if written:
+            await lookup_cache.invalidate(*(rider_key(row["id"]) for row in written))
+
+        self._flushes += 1
+        self._rows_written += len(written)
+        self._flush_seconds_total += time.monotonic() - started
+
+    async def _write(self, conn, batch):
+        rider_ids = list(batch)
+        timestamps, latitudes, longitudes = zip(*batch.values())
+        async with conn.transaction():
+            written = await conn.fetch(LOCATION_UPDATE, rider_ids, list(latitudes), list(longitudes), list(timestamps))
+            if written:
+                await self.registry.publish_locations(conn, [[row["id"], row["latitude"], row["longitude"]] for row in written])
+        return written
+
+    async def _write_each(self, conn, batch):
+        written = []
+        for rider_id, entry in batch.items():
+            try:
+                written.extend(await self._write(conn, {rider_id: entry}))
+            except asyncpg.DataError as e:
+                self._dropped_rows += 1
+                print(f"❌ Dropped location ping for rider {rider_id}: {e}")
+        return written
+
+    def _requeue(self, batch):
+        # Put the batch back unless newer pings arrived for the same riders meanwhile.
+        for rider_id, entry in batch.items():
+            self._pending.setdefault(rider_id, entry)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.flush()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        """Stops the flush loop and writes whatever is still buffered."""
+        if self._task is not None:
+            task, self._task = self._task, None
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+        await self.flush()
+
+    def stats(self):
+        return {
+            "flush_ms": self.interval * 1000,
+            "pending_riders": len(self._pending),
+            "accepted": self._accepted,
+            "rejected": self._rejected,
+            "flushes": self._flushes,
+            "failed_flushes": self._failed_flushes,
+            "dropped_rows": self._dropped_rows,
+            "rows_written": self._rows_written,
+            "avg_rows_per_flush": round(self._rows_written / self._flushes, 2) if self._flushes else 0.0,
+            "avg_flush_ms": round(1000 * self._flush_seconds_total / self._flushes, 3) if self._flushes else 0.0,
+        }
+
+location_ingestor = LocationIngestor()
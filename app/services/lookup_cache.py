@@ -0,0 +1,232 @@
+import asyncio
+import json
+import os
+
+import orjson
+
+from app.database.notify import pg_listener
+from app.services.ride_events import RIDE_STATUS_CHANNEL
+from app.services.rider_registry import RIDER_CHANGES_CHANNEL
+from app.utils.cache import TTLCache
+from app.utils.resp import RespClient
+
+LOOKUP_CACHE_BACKEND = os.getenv("LOOKUP_CACHE_BACKEND", "memory")  # memory | redis | none
+LOOKUP_CACHE_TTL = float(os.getenv("LOOKUP_CACHE_TTL", "30"))
+LOOKUP_CACHE_SIZE = int(os.getenv("LOOKUP_CACHE_SIZE", "50000"))
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+# A Redis command slower than this counts as a miss (or a failed delete); the cache must never stall lookups.
+LOOKUP_CACHE_TIMEOUT_MS = float(os.getenv("LOOKUP_CACHE_TIMEOUT_MS", "100"))
+
+def rider_key(rider_id):
+    return f"rider:{rider_id}"
+
+def ride_key(booking_id):
+    return f"ride:{booking_id}"
+
+class MemoryBackend:
+    """Per-worker LRU+TTL store; other workers' writes reach it through NOTIFY invalidations."""
+    name = "memory"
+    shared = False
+
+    def __init__(self, maxsize=LOOKUP_CACHE_SIZE, ttl=LOOKUP_CACHE_TTL):
+        self.cache = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    async def get(self, key):
+        return self.cache.get(key)
+
+    async def set(self, key, value, ttl):
+        self.cache.set(key, value, ttl=ttl)
+
+    async def delete(self, keys):
+        self.drop_local(keys)
+
+    def drop_local(self, keys):
+        for key in keys:
+            self.cache.pop(key)
+
+    def clear_local(self):
+        self.cache.clear()
+
+    async def close(self):
+        self.cache.clear()
+
+    def stats(self):
+        return self.cache.stats()
+
+class RedisBackend:
+    """Store shared by every worker over the Redis protocol; the writer's DEL is seen by all of them."""
+    name = "redis"
+    shared = True
+
+    def __init__(self, url=REDIS_URL, prefix="ridesharing:", timeout_ms=LOOKUP_CACHE_TIMEOUT_MS):
+        self.url = url
+        self.client = RespClient.from_url(url)
+        self.prefix = prefix
+        self.timeout = timeout_ms / 1000
+
+    async def get(self, key):
+        raw = await self.client.command("GET", self.prefix + key, timeout=self.timeout)
+        return None if raw is None else orjson.loads(raw)
+
+    async def set(self, key, value, ttl):
+        await self.client.command("SET", self.prefix + key, orjson.dumps(value), "PX", int(ttl * 1000), timeout=self.timeout)
+
+    async def delete(self, keys):
+        if keys:
+            await self.client.command("DEL", *(self.prefix + key for key in keys), timeout=self.timeout)
+
+    def drop_local(self, keys):
+        pass  # nothing held locally
+
+    def clear_local(self):
+        pass
+
+    async def close(self):
+        await self.client.close()
+
+    def stats(self):
+        return {"url": self.url}
+
+class LookupCache:
+    """Read-through cache of response dicts for rider and booking lookups.
+
+    Misses load from Postgres and are stored for ``ttl`` seconds; concurrent
+    misses on one key share a single load. Writers call ``invalidate`` after
+    committing, and the ``rider_changes``/``ride_status`` notifications drop
+    the same keys from every other worker's in-process store (or, with Redis,
+    delete them from the shared store again). An invalidation
+    also detaches any load of the key in flight: its result may predate the
+    write, so it is handed to the callers already waiting but never stored,
+    and later misses start a fresh load. A backend failure or timeout is
+    treated as a miss, so the cache can only ever add latency savings, never
+    errors.
+    """
+
+    def __init__(self, backend, ttl=LOOKUP_CACHE_TTL):
+        self.backend = backend
+        self.ttl = ttl
+        self._loading = {}  # key -> future of the load in flight
+        self._tasks = set()
+        self._hits = 0
+        self._misses = 0
+        self._invalidations = 0
+        self._stale_loads = 0
+        self._errors = 0
+
+    async def _backend_call(self, method, *args):
+        try:
+            return await getattr(self.backend, method)(*args)
+        except Exception as e:
+            self._errors += 1
+            if self._errors == 1 or self._errors % 1000 == 0:
+                print(f"❌ Lookup cache {method} failed ({self._errors} errors so far): {e}")
+            return None
+
+    async def get_or_load(self, key, loader):
+        """Returns the cached value for ``key`` or ``await loader()`` (None results are not cached)."""
+        value = await self._backend_call("get", key)
+        if value is not None:
+            self._hits += 1
+            return value
+
+        self._misses += 1
+        loading = self._loading.get(key)
+        if loading is not None:
+            return await asyncio.shield(loading)
+
+        loading = self._loading[key] = asyncio.get_running_loop().create_future()
+        try:
+            value = await loader()
+            if value is not None and self._loading.get(key) is loading:
+                await self._backend_call("set", key, value, self.ttl)
+                if self._loading.get(key) is not loading:
+                    # Invalidated while the SET was on the wire, possibly after the writer's DEL.
+                    await self._backend_call("delete", [key])
+            loading.set_result(value)
+            return value
+        except BaseException as e:
+            loading.set_exception(e)
+            loading.exception()  # waiters re-raise it; don't warn about it going unretrieved
+            raise
+        finally:
+            if self._loading.get(key) is loading:
+                del self._loading[key]
+
+    def _detach_loads(self, keys):
+        for key in keys:
+            if self._loading.pop(key, None) is not None:
+                self._stale_loads += 1
+
+    async def invalidate(self, *keys):
+        self._invalidations += len(keys)
+        self._detach_loads(keys)
+        await self._backend_call("delete", list(keys))
+
+    def _apply_invalidation(self, keys):
+        self._detach_loads(keys)
+        self.backend.drop_local(keys)
+        if self.backend.shared:
+            # Another worker may have read the old row before the commit and SET it after the
+            # writer's DEL; deleting again once the notification arrives closes that window.
+            # Bulk imports have no app worker to invalidate for them at all, so this covers them too.
+            task = asyncio.ensure_future(self._backend_call("delete", keys))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    def handle_rider_change(self, payload):
+        change = json.loads(payload)
+        if "locations" in change:
+            rider_ids = [location[0] for location in change["locations"]]
+        elif "riders" in change:
+            rider_ids = [rider[0] for rider in change["riders"]]
+        else:
+            rider_ids = [change["id"]]
+        self._apply_invalidation([rider_key(rider_id) for rider_id in rider_ids])
+
+    def handle_ride_update(self, payload):
+        self._apply_invalidation([ride_key(json.loads(payload)["id"])])
+
+    async def resync(self, conn):
+        """Forgets everything held locally; invalidations sent while LISTEN was down never arrived."""
+        self._detach_loads(list(self._loading))
+        self.backend.clear_local()
+
+    async def close(self):
+        await self.backend.close()
+
+    def stats(self):
+        lookups = self._hits + self._misses
+        return {
+            "backend": self.backend.name,
+            "ttl_seconds": self.ttl,
+            "hits": self._hits,
+            "misses": self._misses,
+            "hit_rate": round(self._hits / lookups, 4) if lookups else 0.0,
+            "invalidations": self._invalidations,
+            "stale_loads_discarded": self._stale_loads,
+            "backend_errors": self._errors,
+            "store": self.backend.stats(),
+        }
+
+class NullCache:
+    """Stand-in when caching is disabled (``LOOKUP_CACHE_BACKEND=none``)."""
+
+    async def get_or_load(self, key, loader):
+        return await loader()
+
+    async def invalidate(self, *keys):
+        pass
+
+    async def close(self):
+        pass
+
+    def stats(self):
+        return {"backend": "none"}
+
+if LOOKUP_CACHE_BACKEND == "none":
+    lookup_cache = NullCache()
+else:
+    lookup_cache = LookupCache(RedisBackend() if LOOKUP_CACHE_BACKEND == "redis" else MemoryBackend())
+    pg_listener.add_handler(RIDER_CHANGES_CHANNEL, lookup_cache.handle_rider_change)
+    pg_listener.add_handler(RIDE_STATUS_CHANNEL, lookup_cache.handle_ride_update)
+    pg_listener.add_resync(lookup_cache.resync)
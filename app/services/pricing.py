@@ -0,0 +1,73 @@
+import math
+import os
+
+import numpy as np
+
+from app.services.road_graph import route_engine
+from app.utils.geo import haversine_km, haversine_km_array
+
+# Per-km rate by trip length: exactly 1 km, 2-4 km, everything else.
+SHORT_TRIP_RATE = 10000
+MID_TRIP_RATE = 15000
+LONG_TRIP_RATE = 12000
+# Bulk quotes route at most this many pairs by road; the rest are priced by straight-line distance.
+QUOTE_MAX_ROUTED_PAIRS = int(os.getenv("QUOTE_MAX_ROUTED_PAIRS", "200"))
+
+def calculate_fare(distance):
+    """Calculates ride fare based on distance-based pricing."""
+    if distance == 1:
+        return distance * SHORT_TRIP_RATE
+    elif 2 <= distance <= 4:
+        return distance * MID_TRIP_RATE
+    else:
+        return distance * LONG_TRIP_RATE
+
+def trip_distance(pickup_latitude, pickup_longitude, dropoff_latitude, dropoff_longitude):
+    """Billed whole kilometres for a trip and its driving time in seconds.
+
+    Uses the road route when the road graph covers both ends; otherwise the
+    straight-line distance, with no duration.
+    """
+    route = route_engine.route(pickup_latitude, pickup_longitude, dropoff_latitude, dropoff_longitude)
+    if route is None:
+        return max(math.ceil(haversine_km(pickup_latitude, pickup_longitude, dropoff_latitude, dropoff_longitude)), 1), None
+    return max(math.ceil(route.meters / 1000), 1), route.seconds
+
+def apply_surge(fare, surge_multiplier):
+    """Scales a base fare by a surge multiplier, rounded to a whole amount."""
+    return int(round(fare * surge_multiplier))
+
+def calculate_fares(distances) -> np.ndarray:
+    """Vectorised ``calculate_fare``: the same tiers applied as array masks."""
+    distances = np.asarray(distances, dtype=np.int64)
+    rates = np.select(
+        [distances == 1, (distances >= 2) & (distances <= 4)],
+        [SHORT_TRIP_RATE, MID_TRIP_RATE],
+        default=LONG_TRIP_RATE,
+    )
+    return distances * rates
+
+def quote_fares(pairs, surge_multiplier=1.0, max_routed=QUOTE_MAX_ROUTED_PAIRS):
+    """Distances, fares and a routed flag for an (N, 4) array of origin/destination lat-lon pairs.
+
+    Pairs the road graph covers (up to ``max_routed`` of them) are priced by
+    road route, like ``trip_distance``; the rest by straight-line distance.
+    Either is billed in whole kilometres, rounded up, with a 1 km minimum so
+    it lines up with the integer distances bookings store.
+    """
+    pairs = np.asarray(pairs, dtype=float).reshape(-1, 4)
+    distances_km = haversine_km_array(pairs[:, 0], pairs[:, 1], pairs[:, 2], pairs[:, 3])
+    routed = np.zeros(len(pairs), dtype=bool)
+    graph = route_engine.graph
+    if graph is not None and len(pairs) and max_routed > 0:
+        # One snap for every endpoint picks out the pairs worth a route search.
+        _, snap_meters = graph.snap(np.concatenate([pairs[:, 0], pairs[:, 2]]), np.concatenate([pairs[:, 1], pairs[:, 3]]))
+        covered = np.maximum(snap_meters[:len(pairs)], snap_meters[len(pairs):]) <= route_engine.max_snap_m
+        for i in np.flatnonzero(covered)[:max_routed]:
+            route = route_engine.route(*pairs[i])
+            if route is not None:
+                distances_km[i] = route.meters / 1000
+                routed[i] = True
+    billed_km = np.maximum(np.ceil(distances_km), 1).astype(np.int64)
+    fares = np.rint(calculate_fares(billed_km) * surge_multiplier).astype(np.int64)
+    return distances_km, billed_km, fares, routed
@@ -0,0 +1,63 @@
+import asyncio
+import json
+from contextlib import contextmanager
+
+from app.database.notify import notify, pg_listener
+
+RIDE_STATUS_CHANNEL = "ride_status"
+FINAL_STATUSES = ("Completed", "Canceled")
+
+class RideEventHub:
+    """In-process fan-out of booking updates to the streams watching each booking.
+
+    Every worker LISTENs on ``ride_status``; whichever worker commits a change
+    sends one NOTIFY and each worker pushes it to its own local subscribers,
+    so a client gets the update no matter which worker holds its stream.
+    """
+
+    def __init__(self, queue_size=16):
+        self.queue_size = queue_size
+        self._subscribers = {}  # booking_id -> set of asyncio.Queue
+        self._published = 0
+        self._dropped = 0
+
+    @contextmanager
+    def subscribe(self, booking_id):
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self._subscribers.setdefault(booking_id, set()).add(queue)
+        try:
+            yield queue
+        finally:
+            queues = self._subscribers.get(booking_id)
+            if queues is not None:
+                queues.discard(queue)
+                if not queues:
+                    del self._subscribers[booking_id]
+
+    def publish_local(self, booking):
+        self._published += 1
+        for queue in self._subscribers.get(booking["id"], ()):
+            if queue.full():
+                # A slow consumer only needs the latest state, not every intermediate one.
+                queue.get_nowait()
+                self._dropped += 1
+            queue.put_nowait(booking)
+
+    def handle_notification(self, payload):
+        self.publish_local(json.loads(payload))
+
+    def stats(self):
+        return {
+            "watched_bookings": len(self._subscribers),
+            "subscribers": sum(len(queues) for queues in self._subscribers.values()),
+            "published": self._published,
+            "dropped": self._dropped,
+            "listening": pg_listener.listening,
+        }
+
+ride_events = RideEventHub()
+pg_listener.add_handler(RIDE_STATUS_CHANNEL, ride_events.handle_notification)
+
+async def publish_ride_update(conn, booking):
+    """Announces a booking change; call inside the transaction that makes it."""
+    await notify(conn, RIDE_STATUS_CHANNEL, json.dumps(dict(booking), default=str))
@@ -0,0 +1,204 @@
+import asyncio
+import json
+import sys
+import threading
+
+from app.database.async_db import async_db_pool
+from app.database.notify import notify, pg_listener
+from app.services.spatial_index import rider_index
+
+RIDER_CHANGES_CHANNEL = "rider_changes"
+# Postgres rejects NOTIFY payloads of 8000 bytes or more.
+NOTIFY_PAYLOAD_MAX_BYTES = 7900
+
+def chunked_payloads(key, items, max_bytes=NOTIFY_PAYLOAD_MAX_BYTES):
+    """Packs JSON-able ``items`` into as few ``{key: [...]}`` payloads as fit under the NOTIFY limit."""
+    payloads = []
+    chunk = []
+    size = len(key) + 8
+    for item in items:
+        encoded = json.dumps(item)
+        if chunk and size + len(encoded) + 1 > max_bytes:
+            payloads.append(f'{{"{key}": [{",".join(chunk)}]}}')
+            chunk = []
+            size = len(key) + 8
+        chunk.append(encoded)
+        size += len(encoded) + 1
+    if chunk:
+        payloads.append(f'{{"{key}": [{",".join(chunk)}]}}')
+    return payloads
+
+class RiderState:
+    """Compact per-rider record; ``__slots__`` keeps it to a few dozen bytes per driver."""
+    __slots__ = ("status", "vehicle_type", "latitude", "longitude", "user_id")
+
+    def __init__(self, status, vehicle_type, latitude=None, longitude=None, user_id=None):
+        self.status = status
+        self.vehicle_type = vehicle_type
+        self.latitude = latitude
+        self.longitude = longitude
+        self.user_id = user_id
+
+class RiderRegistry:
+    """Process-local view of every rider's status, vehicle type and last location.
+
+    Matching reads availability from here (and from the spatial index this
+    keeps in step) instead of scanning the riders table. Postgres stays the
+    source of truth: writers change the row and announce it on the
+    ``rider_changes`` channel in the same transaction, and every worker applies
+    the announcement to its own copy once it commits. Claims still re-check the
+    row under lock, so a briefly stale copy costs a retry, never a double booking.
+    """
+
+    def __init__(self, index=rider_index):
+        self.index = index
+        self._riders = {}  # rider_id -> RiderState
+        self._lock = threading.Lock()
+        self._notifications = 0
+        self._loading = set()  # rider ids being fetched because a change named a rider we never saw
+        self._tasks = set()
+
+    async def rebuild(self, conn):
+        """Reloads every rider from Postgres (run on boot)."""
+        rows = await conn.fetch("SELECT id, status, vehicle_type, latitude, longitude, user_id FROM riders")
+        with self._lock:
+            self._riders = {
+                row["id"]: RiderState(sys.intern(row["status"]), sys.intern(row["vehicle_type"]), row["latitude"], row["longitude"], row["user_id"])
+                for row in rows
+            }
+        self.index.clear()
+        for rider_id, state in self._riders.items():
+            self.index.upsert(rider_id, state.latitude, state.longitude, state.status == "Available")
+        print(f"✅ Rider registry loaded with {len(rows)} riders")
+
+    def get(self, rider_id):
+        return self._riders.get(rider_id)
+
+    def is_available(self, rider_id):
+        state = self._riders.get(rider_id)
+        return state is not None and state.status == "Available"
+
+    def is_owned_by(self, rider_id, user_id):
+        state = self._riders.get(rider_id)
+        return state is not None and state.user_id == user_id
+
+    def apply(self, rider_id, status=None, vehicle_type=None, latitude=None, longitude=None, user_id=None):
+        """Updates the local copy (fields left as None are unchanged) and the spatial index."""
+        with self._lock:
+            state = self._riders.get(rider_id)
+            if state is None:
+                if status is None or vehicle_type is None:
+                    # Part of a rider this worker has never seen, e.g. registered while LISTEN was
+                    # down. Defaulting the rest could put a phantom rider up for matching, so the
+                    # row is loaded instead.
+                    self._schedule_load(rider_id)
+                    return
+                state = self._riders[rider_id] = RiderState(sys.intern(status), sys.intern(vehicle_type))
+            if status is not None:
+                state.status = sys.intern(status)
+            if vehicle_type is not None:
+                state.vehicle_type = sys.intern(vehicle_type)
+            if latitude is not None and longitude is not None:
+                state.latitude = latitude
+                state.longitude = longitude
+            if user_id is not None:
+                state.user_id = user_id
+            snapshot = (state.status, state.latitude, state.longitude)
+
+        status, latitude, longitude = snapshot
+        self.index.upsert(rider_id, latitude, longitude, status == "Available")
+
+    def _schedule_load(self, rider_id):
+        if rider_id in self._loading:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return  # no event loop (scripts, benchmarks): nothing to load with
+        self._loading.add(rider_id)
+        task = loop.create_task(self._load(rider_id))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _load(self, rider_id):
+        try:
+            async with async_db_pool.connection() as conn:
+                row = await conn.fetchrow("SELECT id, status, vehicle_type, latitude, longitude, user_id FROM riders WHERE id = $1", rider_id)
+            if row is not None:
+                self.apply_row(row)
+        except Exception as e:
+            print(f"❌ Error loading rider {rider_id} into the registry: {e}")
+        finally:
+            self._loading.discard(rider_id)
+
+    def apply_row(self, row):
+        self.apply(row["id"], row["status"], row["vehicle_type"], row["latitude"], row["longitude"], row["user_id"])
+
+    def apply_locations(self, locations):
+        """Applies ``(rider_id, latitude, longitude)`` triples."""
+        for rider_id, latitude, longitude in locations:
+            self.apply(rider_id, latitude=latitude, longitude=longitude)
+
+    @staticmethod
+    def change_payload(rider_id, status=None, vehicle_type=None, latitude=None, longitude=None, user_id=None):
+        change = {"id": rider_id, "status": status, "vehicle_type": vehicle_type, "latitude": latitude, "longitude": longitude, "user_id": user_id}
+        return json.dumps({key: value for key, value in change.items() if value is not None})
+
+    async def publish(self, conn, rider_id, **fields):
+        """Announces a rider change to every worker; call inside the transaction that makes it."""
+        await notify(conn, RIDER_CHANGES_CHANNEL, self.change_payload(rider_id, **fields))
+
+    async def publish_locations(self, conn, locations):
+        """Announces a batch of position changes, chunked into as few NOTIFYs as fit."""
+        payloads = chunked_payloads("locations", locations)
+        await conn.execute("SELECT pg_notify($1, payload) FROM unnest($2::text[]) AS payload", RIDER_CHANGES_CHANNEL, payloads)
+
+    def handle_notification(self, payload):
+        self._notifications += 1
+        change = json.loads(payload)
+        if "locations" in change:
+            self.apply_locations(change["locations"])
+        elif "riders" in change:
+            for rider_id, status, vehicle_type, latitude, longitude, user_id in change["riders"]:
+                self.apply(rider_id, status, vehicle_type, latitude, longitude, user_id)
+        else:
+            self.apply(change.pop("id"), **change)
+
+    async def set_status(self, conn, rider_id, status):
+        """Write-through status change; returns the updated row or None if the rider does not exist."""
+        async with conn.transaction():
+            row = await conn.fetchrow("UPDATE riders SET status = $1 WHERE id = $2 RETURNING *", status, rider_id)
+            if row is not None:
+                await self.publish(conn, rider_id, status=status)
+        if row is not None:
+            self.apply_row(row)
+        return row
+
+    async def set_location(self, conn, rider_id, latitude, longitude):
+        """Write-through location change; returns the updated row or None if the rider does not exist."""
+        async with conn.transaction():
+            row = await conn.fetchrow(
+                "UPDATE riders SET latitude = $1, longitude = $2, location_updated_at = now() WHERE id = $3 RETURNING *",
+                latitude, longitude, rider_id,
+            )
+            if row is not None:
+                await self.publish(conn, rider_id, latitude=latitude, longitude=longitude)
+        if row is not None:
+            self.apply_row(row)
+        return row
+
+    def stats(self):
+        with self._lock:
+            by_status = {}
+            for state in self._riders.values():
+                by_status[state.status] = by_status.get(state.status, 0) + 1
+        return {
+            "riders": len(self._riders),
+            "by_status": by_status,
+            "notifications_applied": self._notifications,
+            "index": self.index.stats(),
+        }
+
+rider_registry = RiderRegistry()
+pg_listener.add_handler(RIDER_CHANGES_CHANNEL, rider_registry.handle_notification)
+pg_listener.add_resync(rider_registry.rebuild)
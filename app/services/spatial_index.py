@@ -0,0 +1,167 @@
+import math
+import os
+import threading
+
+from app.utils.geo import KM_PER_DEGREE_LAT, haversine_km
+
+CELL_SIZE_DEG = float(os.getenv("SPATIAL_INDEX_CELL_DEG", "0.01"))  # ~1.1 km at the equator
+# Service radius: riders further than this from a pickup are never matched to it. It also
+# bounds the rings a nearest query scans, which would otherwise grow with the distance to
+# the closest rider anywhere.
+MATCH_MAX_PICKUP_KM = float(os.getenv("MATCH_MAX_PICKUP_KM", "15"))
+
+class GridIndex:
+    """Uniform lat/lon grid of *available* riders for k-nearest lookups.
+
+    Positions are remembered for every rider the index has seen, but only
+    available riders are bucketed into cells, so flipping a rider between
+    Available and Busy never needs a DB read. A nearest query scans rings of
+    cells outward from the pickup and stops as soon as no unscanned cell can
+    beat the k-th best distance found so far, which keeps the cost
+    proportional to local density rather than to the whole fleet.
+    """
+
+    def __init__(self, cell_size_deg=CELL_SIZE_DEG):
+        self.cell_size_deg = cell_size_deg
+        self._lock = threading.Lock()
+        self._positions = {}  # rider_id -> (lat, lon)
+        self._available = {}  # rider_id -> cell
+        self._cells = {}  # cell -> set of rider_ids
+
+    def _cell(self, lat, lon):
+        return (math.floor(lat / self.cell_size_deg), math.floor(lon / self.cell_size_deg))
+
+    def _bucket(self, rider_id, lat, lon):
+        cell = self._cell(lat, lon)
+        previous = self._available.get(rider_id)
+        if previous == cell:
+            return
+        if previous is not None:
+            self._unbucket(rider_id)
+        self._cells.setdefault(cell, set()).add(rider_id)
+        self._available[rider_id] = cell
+
+    def _unbucket(self, rider_id):
+        cell = self._available.pop(rider_id, None)
+        if cell is None:
+            return
+        members = self._cells[cell]
+        members.discard(rider_id)
+        if not members:
+            del self._cells[cell]
+
+    def upsert(self, rider_id, lat, lon, available):
+        """Records a rider's position and whether it may be matched."""
+        with self._lock:
+            if lat is None or lon is None:
+                self._positions.pop(rider_id, None)
+                self._unbucket(rider_id)
+                return
+            self._positions[rider_id] = (lat, lon)
+            if available:
+                self._bucket(rider_id, lat, lon)
+            else:
+                self._unbucket(rider_id)
+
+    def set_available(self, rider_id, available):
+        """Flips availability using the last known position (no-op if the rider has none)."""
+        with self._lock:
+            position = self._positions.get(rider_id)
+            if available and position is not None:
+                self._bucket(rider_id, *position)
+            else:
+                self._unbucket(rider_id)
+
+    def move(self, rider_id, lat, lon):
+        """Updates a rider's position without changing availability."""
+        with self._lock:
+            self._positions[rider_id] = (lat, lon)
+            if rider_id in self._available:
+                self._bucket(rider_id, lat, lon)
+
+    def remove(self, rider_id):
+        with self._lock:
+            self._positions.pop(rider_id, None)
+            self._unbucket(rider_id)
+
+    def position(self, rider_id):
+        return self._positions.get(rider_id)
+
+    def clear(self):
+        with self._lock:
+            self._positions.clear()
+            self._available.clear()
+            self._cells.clear()
+
+    def nearest(self, lat, lon, k=1, max_radius_km=None):
+        """Returns up to ``k`` ``(distance_km, rider_id)`` pairs of available riders, nearest first."""
+        with self._lock:
+            if not self._available:
+                return []
+
+            origin_row, origin_col = self._cell(lat, lon)
+            # Smallest cell dimension; every cell in ring r+1 lies at least r of these away.
+            cell_km = self.cell_size_deg * KM_PER_DEGREE_LAT * max(math.cos(math.radians(min(abs(lat) + self.cell_size_deg, 89.9))), 1e-6)
+            total = len(self._available)
+            best = []
+            seen = 0
+            ring = 0
+
+            while True:
+                for cell in self._ring_cells(origin_row, origin_col, ring):
+                    for rider_id in self._cells.get(cell, ()):
+                        seen += 1
+                        rider_lat, rider_lon = self._positions[rider_id]
+                        best.append((haversine_km(lat, lon, rider_lat, rider_lon), rider_id))
+                if best:
+                    best.sort()
+                    del best[k:]
+
+                frontier_km = ring * cell_km
+                if seen >= total:
+                    break
+                if len(best) >= k and best[-1][0] <= frontier_km:
+                    break
+                if max_radius_km is not None and frontier_km > max_radius_km:
+                    break
+                ring += 1
+
+            if max_radius_km is not None:
+                best = [entry for entry in best if entry[0] <= max_radius_km]
+            return best
+
+    def cells_near(self, lat, lon, rings=1):
+        """The cell containing the point plus ``rings`` rings of cells around it."""
+        row, col = self._cell(lat, lon)
+        return [cell for ring in range(rings + 1) for cell in self._ring_cells(row, col, ring)]
+
+    def total_available(self):
+        return len(self._available)
+
+    def count_available(self, cells):
+        """Available riders bucketed in ``cells``; a few dict lookups, no scan."""
+        with self._lock:
+            return sum(len(self._cells.get(cell, ())) for cell in cells)
+
+    @staticmethod
+    def _ring_cells(row, col, ring):
+        if ring == 0:
+            yield (row, col)
+            return
+        for dc in range(-ring, ring + 1):
+            yield (row - ring, col + dc)
+            yield (row + ring, col + dc)
+        for dr in range(-ring + 1, ring):
+            yield (row + dr, col - ring)
+            yield (row + dr, col + ring)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "riders_tracked": len(self._positions),
+                "riders_available": len(self._available),
+                "occupied_cells": len(self._cells),
+                "cell_size_deg": self.cell_size_deg,
+            }
+
+rider_index = GridIndex()
@@ -0,0 +1,192 @@
+import asyncio
+import json
+import math
+import os
+import threading
+import time
+
+from app.database.async_db import async_db_pool
+from app.database.notify import pg_listener
+from app.services.rider_registry import chunked_payloads
+from app.services.spatial_index import rider_index
+
+SURGE_DEMAND_CHANNEL = "surge_demand"
+SURGE_WINDOW_SECONDS = float(os.getenv("SURGE_WINDOW_SECONDS", "300"))
+SURGE_WINDOW_BUCKETS = 10
+# Rings of spatial-index cells around the pickup that count as its neighbourhood (1 = 3x3 cells).
+SURGE_NEIGHBOURHOOD_RINGS = int(os.getenv("SURGE_NEIGHBOURHOOD_RINGS", "1"))
+SURGE_SYNC_MS = float(os.getenv("SURGE_SYNC_MS", "1000"))
+# Requests per available rider in the window before prices start to rise.
+SURGE_THRESHOLD = float(os.getenv("SURGE_THRESHOLD", "1.0"))
+SURGE_SENSITIVITY = float(os.getenv("SURGE_SENSITIVITY", "0.5"))
+SURGE_MAX_MULTIPLIER = float(os.getenv("SURGE_MAX_MULTIPLIER", "3.0"))
+SURGE_STEP = 0.1
+
+class RollingCounts:
+    """Per-cell event counts over a sliding window of fixed-width time buckets.
+
+    Adding an event touches one bucket and one running total, and buckets
+    are retired lazily as time moves past them, so both ``add`` and ``total``
+    are O(1) amortised however busy the window is.
+    """
+
+    def __init__(self, window_seconds, buckets=SURGE_WINDOW_BUCKETS):
+        self.window_seconds = window_seconds
+        self.bucket_seconds = window_seconds / buckets
+        self._buckets = [{} for _ in range(buckets)]  # cell -> count, per time slice
+        self._totals = {}  # cell -> count across all buckets
+        self._current = None  # absolute number of the newest bucket
+
+    def advance(self, now):
+        current = int(now // self.bucket_seconds)
+        if self._current is None:
+            self._current = current
+            return
+        for step in range(1, min(current - self._current, len(self._buckets)) + 1):
+            bucket = self._buckets[(self._current + step) % len(self._buckets)]
+            for cell, count in bucket.items():
+                remaining = self._totals[cell] - count
+                if remaining:
+                    self._totals[cell] = remaining
+                else:
+                    del self._totals[cell]
+            bucket.clear()
+        self._current = max(self._current, current)
+
+    def add(self, cell, count, now):
+        self.advance(now)
+        bucket = self._buckets[self._current % len(self._buckets)]
+        bucket[cell] = bucket.get(cell, 0) + count
+        self._totals[cell] = self._totals.get(cell, 0) + count
+
+    def total(self, cells):
+        return sum(self._totals.get(cell, 0) for cell in cells)
+
+    def __len__(self):
+        return len(self._totals)
+
+class SurgeEngine:
+    """Surge multiplier per pickup neighbourhood from live demand and supply.
+
+    Supply is the number of available riders the spatial index already keeps
+    bucketed per cell, so it follows every status and location change without
+    extra bookkeeping. Demand is ride requests per cell over a rolling window.
+    Each worker counts its own requests and every ``sync_ms`` announces them
+    on the ``surge_demand`` channel, and every worker (the sender included)
+    adds the announced counts to its window, so all of them price from the
+    same fleet-wide picture. A quote is a handful of dict lookups and never
+    touches the database.
+    """
+
+    def __init__(self, index=rider_index, window_seconds=SURGE_WINDOW_SECONDS, rings=SURGE_NEIGHBOURHOOD_RINGS, sync_ms=SURGE_SYNC_MS,
+                 threshold=SURGE_THRESHOLD, sensitivity=SURGE_SENSITIVITY, max_multiplier=SURGE_MAX_MULTIPLIER):
+        self.index = index
+        self.rings = rings
+        self.interval = sync_ms / 1000
+        self.threshold = threshold
+        self.sensitivity = sensitivity
+        self.max_multiplier = max_multiplier
+        self.demand = RollingCounts(window_seconds)
+        self._lock = threading.Lock()
+        self._unsent = {}  # cell -> requests seen here since the last sync
+        self._task = None
+
+        self._requests = 0
+        self._quotes = 0
+        self._surged_quotes = 0
+        self._syncs = 0
+        self._failed_syncs = 0
+
+    def price(self, demand, supply):
+        """Multiplier for ``demand`` requests against ``supply`` riders, rounded down to ``SURGE_STEP``."""
+        pressure = demand / max(supply, 1)
+        multiplier = 1 + self.sensitivity * (pressure - self.threshold)
+        multiplier = min(max(multiplier, 1.0), self.max_multiplier)
+        return round(math.floor(round(multiplier / SURGE_STEP, 6)) * SURGE_STEP, 2)
+
+    def multiplier(self, latitude, longitude):
+        """Current surge multiplier at a pickup point."""
+        cells = self.index.cells_near(latitude, longitude, self.rings)
+        with self._lock:
+            self.demand.advance(time.monotonic())
+            demand = self.demand.total(cells)
+        multiplier = self.price(demand, self.index.count_available(cells))
+
+        self._quotes += 1
+        if multiplier > 1:
+            self._surged_quotes += 1
+        return multiplier
+
+    def record_request(self, latitude, longitude):
+        """Counts a ride request at its pickup cell; it enters the window on the next sync."""
+        cell = self.index.cells_near(latitude, longitude, 0)[0]
+        with self._lock:
+            self._unsent[cell] = self._unsent.get(cell, 0) + 1
+        self._requests += 1
+
+    def handle_notification(self, payload):
+        now = time.monotonic()
+        with self._lock:
+            for row, col, count in json.loads(payload)["cells"]:
+                self.demand.add((row, col), count, now)
+
+    async def sync(self):
+        with self._lock:
+            if not self._unsent:
+                return
+            batch, self._unsent = self._unsent, {}
+        payloads = chunked_payloads("cells", [[row, col, count] for (row, col), count in batch.items()])
+
+        try:
+            async with async_db_pool.connection() as conn:
+                await conn.execute("SELECT pg_notify($1, payload) FROM unnest($2::text[]) AS payload", SURGE_DEMAND_CHANNEL, payloads)
+        except asyncio.CancelledError:
+            self._requeue(batch)
+            raise
+        except Exception as e:
+            self._requeue(batch)
+            self._failed_syncs += 1
+            print(f"❌ Error announcing surge demand: {e}")
+            return
+        self._syncs += 1
+
+    def _requeue(self, batch):
+        with self._lock:
+            for cell, count in batch.items():
+                self._unsent[cell] = self._unsent.get(cell, 0) + count
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.sync()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        """Stops the sync loop and announces whatever demand is still unsent."""
+        if self._task is not None:
+            task, self._task = self._task, None
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+        await self.sync()
+
+    def stats(self):
+        with self._lock:
+            self.demand.advance(time.monotonic())
+            cells_with_demand = len(self.demand)
+            unsent = sum(self._unsent.values())
+        return {
+            "window_seconds": self.demand.window_seconds,
+            "cells_with_demand": cells_with_demand,
+            "unsent_requests": unsent,
+            "requests": self._requests,
+            "quotes": self._quotes,
+            "surged_quotes": self._surged_quotes,
+            "syncs": self._syncs,
+            "failed_syncs": self._failed_syncs,
+        }
+
+surge_engine = SurgeEngine()
+pg_listener.add_handler(SURGE_DEMAND_CHANNEL, surge_engine.handle_notification)
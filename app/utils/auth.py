@@ -1,10 +1,20 @@
+import asyncio
+import hashlib
+import json
+import multiprocessing
 import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 import bcrypt
 import jwt as pyjwt
 from datetime import datetime, timedelta
 from fastapi import HTTPException, Depends
 from fastapi.security import OAuth2PasswordBearer
 from dotenv import load_dotenv
+from app.database.notify import notify, pg_listener
+from app.utils.cache import TTLCache
 
 load_dotenv()
 
@@ -12,16 +22,97 @@ SECRET_KEY = os.getenv("SECRET_KEY")
 ALGORITHM = os.getenv("ALGORITHM")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES"))
 
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "10000"))
+
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(max(1, (os.cpu_count() or 2) // 2))))
+# Hash/verify calls allowed to queue for a worker before new ones are turned away with 503.
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "64"))
+
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="users/login")
 
+TOKEN_REVOCATIONS_CHANNEL = "token_revocations"
+# Expired revocations are swept out at most this often rather than on every revocation.
+REVOKED_PRUNE_INTERVAL_SECONDS = 60
+
+# Decoded claims keyed by token digest; entries expire at the token's own ``exp``.
+token_cache = TTLCache(maxsize=TOKEN_CACHE_SIZE)
+# Digest -> exp of logged-out tokens. Revocations must never be evicted early, so they live
+# in a plain dict pruned by expiry. The revoked_tokens table is the shared copy: every worker
+# loads it at startup and hears new revocations on ``token_revocations``.
+_revoked_tokens = {}
+_revoked_lock = threading.Lock()
+_revoked_pruned_at = 0.0
+
 def hash_password(password: str) -> str:
     """Hashes a password using bcrypt."""
-    return bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt()).decode("utf-8")
+    return bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt(rounds=BCRYPT_ROUNDS)).decode("utf-8")
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verifies a hashed password."""
     return bcrypt.checkpw(plain_password.encode("utf-8"), hashed_password.encode("utf-8"))
 
+_password_executor = None
+_password_pending = 0
+_password_rejected = 0
+_password_latencies = {"hash": deque(maxlen=1024), "verify": deque(maxlen=1024)}
+_password_counts = {"hash": 0, "verify": 0}
+
+def _get_password_executor():
+    global _password_executor
+    if _password_executor is None:
+        # spawn, not fork: the parent is running an event loop and DB pool threads.
+        _password_executor = ProcessPoolExecutor(
+            max_workers=PASSWORD_HASH_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _password_executor
+
+async def _run_password_op(op: str, func, *args):
+    """Runs a bcrypt call on the password worker pool, shedding load once the queue is full."""
+    global _password_pending, _password_rejected
+    if _password_pending >= PASSWORD_HASH_WORKERS + PASSWORD_HASH_MAX_PENDING:
+        _password_rejected += 1
+        raise HTTPException(status_code=503, detail="Authentication is busy, please retry", headers={"Retry-After": "1"})
+
+    _password_pending += 1
+    started = time.perf_counter()
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_get_password_executor(), func, *args)
+    finally:
+        _password_pending -= 1
+        _password_latencies[op].append(time.perf_counter() - started)
+        _password_counts[op] += 1
+
+async def hash_password_async(password: str) -> str:
+    """``hash_password`` on the password worker pool, keeping bcrypt off the request threads."""
+    return await _run_password_op("hash", hash_password, password)
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """``verify_password`` on the password worker pool."""
+    return await _run_password_op("verify", verify_password, plain_password, hashed_password)
+
+def password_pool_stats() -> dict:
+    stats = {
+        "workers": PASSWORD_HASH_WORKERS,
+        "bcrypt_rounds": BCRYPT_ROUNDS,
+        "pending": _password_pending,
+        "max_pending": PASSWORD_HASH_WORKERS + PASSWORD_HASH_MAX_PENDING,
+        "rejected": _password_rejected,
+    }
+    for op, latencies in _password_latencies.items():
+        recent = sorted(latencies)
+        stats[f"{op}_count"] = _password_counts[op]
+        stats[f"{op}_ms_p50"] = round(1000 * recent[len(recent) // 2], 3) if recent else 0.0
+        stats[f"{op}_ms_p99"] = round(1000 * recent[min(len(recent) - 1, int(len(recent) * 0.99))], 3) if recent else 0.0
+    return stats
+
+def shutdown_password_pool() -> None:
+    global _password_executor
+    if _password_executor is not None:
+        _password_executor.shutdown(wait=True, cancel_futures=True)
+        _password_executor = None
+
 def create_jwt_token(data: dict) -> str:
     """Creates a JWT token with expiration."""
     to_encode = data.copy()
@@ -29,12 +120,84 @@ def create_jwt_token(data: dict) -> str:
     to_encode.update({"exp": expire})
     return pyjwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
-def get_current_user(token: str = Depends(oauth2_scheme)) -> dict:
-    """Extracts the user data from the JWT token."""
+def _decode_token(token: str) -> dict:
     try:
-        payload = pyjwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        return {"user_id": payload["user_id"], "phone_number": payload["phone_number"], "is_admin": payload["is_admin"]}
+        return pyjwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
     except pyjwt.ExpiredSignatureError:
         raise HTTPException(status_code=401, detail="Token expired")
     except pyjwt.InvalidTokenError:
         raise HTTPException(status_code=401, detail="Invalid token")
+
+def _token_digest(token: str) -> str:
+    # Revocations are stored and broadcast by digest, never as usable tokens.
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+def _prune_revocations(now: float) -> None:
+    # Call with _revoked_lock held.
+    global _revoked_pruned_at
+    for expired in [t for t, exp in _revoked_tokens.items() if exp <= now]:
+        del _revoked_tokens[expired]
+    _revoked_pruned_at = now
+
+def _apply_revocation(digest: str, expires_at: float) -> None:
+    now = time.time()
+    with _revoked_lock:
+        if expires_at > now:
+            _revoked_tokens[digest] = expires_at
+        if now - _revoked_pruned_at >= REVOKED_PRUNE_INTERVAL_SECONDS:
+            _prune_revocations(now)
+    token_cache.pop(digest)
+
+async def revoke_token(conn, token: str) -> None:
+    """Rejects ``token`` on every worker from now until it would have expired anyway."""
+    payload = _decode_token(token)
+    digest = _token_digest(token)
+    async with conn.transaction():
+        await conn.execute(
+            "INSERT INTO revoked_tokens (token_hash, expires_at) VALUES ($1, to_timestamp($2)) ON CONFLICT (token_hash) DO NOTHING",
+            digest, payload["exp"],
+        )
+        await conn.execute("DELETE FROM revoked_tokens WHERE expires_at < now()")
+        await notify(conn, TOKEN_REVOCATIONS_CHANNEL, json.dumps({"token": digest, "exp": payload["exp"]}))
+    _apply_revocation(digest, payload["exp"])
+
+async def load_revoked_tokens(conn) -> None:
+    """Loads the revocations still in force (run on boot, once the listener is up)."""
+    rows = await conn.fetch("SELECT token_hash, extract(epoch FROM expires_at)::float8 AS exp FROM revoked_tokens WHERE expires_at > now()")
+    with _revoked_lock:
+        for row in rows:
+            _revoked_tokens[row["token_hash"]] = row["exp"]
+        _prune_revocations(time.time())
+    for row in rows:
+        token_cache.pop(row["token_hash"])
+    print(f"✅ Loaded {len(rows)} revoked tokens")
+
+def handle_revocation(payload: str) -> None:
+    revocation = json.loads(payload)
+    _apply_revocation(revocation["token"], revocation["exp"])
+
+def token_cache_stats() -> dict:
+    return {**token_cache.stats(), "revoked": len(_revoked_tokens)}
+
+async def get_current_user(token: str = Depends(oauth2_scheme)) -> dict:
+    """Extracts the user data from the JWT token.
+
+    Declared ``async`` so FastAPI runs it inline on the event loop instead of
+    borrowing a threadpool slot. Verified claims are cached per token until the
+    token's ``exp``, so repeat callers skip signature verification entirely.
+    """
+    digest = _token_digest(token)
+    if digest in _revoked_tokens:
+        raise HTTPException(status_code=401, detail="Token revoked")
+
+    current_user = token_cache.get(digest)
+    if current_user is not None:
+        return current_user
+
+    payload = _decode_token(token)
+    current_user = {"user_id": payload["user_id"], "phone_number": payload["phone_number"], "is_admin": payload["is_admin"]}
+    token_cache.set(digest, current_user, expires_at=payload["exp"])
+    return current_user
+
+pg_listener.add_handler(TOKEN_REVOCATIONS_CHANNEL, handle_revocation)
+pg_listener.add_resync(load_revoked_tokens)
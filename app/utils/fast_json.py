@@ -0,0 +1,24 @@
+"""JSON responses built straight from database rows.
+
+The hot read endpoints return these instead of Pydantic models. Rows fetched
+in a fixed column order already have the types the schema promises, so
+building a model from them and letting FastAPI validate it again against
+``response_model`` only burns CPU. Those routes keep ``response_model`` for
+the OpenAPI schema; FastAPI sends a returned ``Response`` untouched.
+"""
+import orjson
+from fastapi import Response
+
+class RowJSONResponse(Response):
+    """Encodes ``content`` with orjson as is: no validation and no ``jsonable_encoder`` pass."""
+    media_type = "application/json"
+
+    def render(self, content):
+        return orjson.dumps(content)
+
+def row_dict(columns, row):
+    """One row (a tuple or asyncpg record in ``columns`` order) as a dict."""
+    return dict(zip(columns, row))
+
+def rows_response(columns, rows, headers=None):
+    return RowJSONResponse([dict(zip(columns, row)) for row in rows], headers=headers)
@@ -0,0 +1,104 @@
+import asyncio
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+
+# Opt-in: requests slower than this many ms get their samples written out (0 disables profiling).
+PROFILE_SLOW_REQUEST_MS = float(os.getenv("PROFILE_SLOW_REQUEST_MS", "0"))
+PROFILE_SAMPLE_INTERVAL_MS = float(os.getenv("PROFILE_SAMPLE_INTERVAL_MS", "5"))
+PROFILE_OUTPUT_DIR = os.getenv("PROFILE_OUTPUT_DIR", "profiles")
+PROFILE_MAX_FILES = int(os.getenv("PROFILE_MAX_FILES", "200"))
+
+class SamplingProfiler:
+    """Statistical profiler that keeps a stack sample histogram per in-flight request.
+
+    A background thread wakes every ``interval`` and, if any request is in
+    flight, grabs the event-loop thread's current stack and credits it to the
+    request whose task is running at that moment. When a request turns out to
+    be slower than ``slow_ms`` its samples are written as folded stacks
+    (``frame;frame;frame count``), the input format of flamegraph.pl,
+    speedscope and inferno. Time a sync handler spends on a threadpool worker
+    shows up as request latency but not in the samples.
+    """
+
+    def __init__(self, slow_ms, interval_ms=5.0, output_dir="profiles", max_files=200):
+        self.slow_seconds = slow_ms / 1000
+        self.interval = interval_ms / 1000
+        self.output_dir = output_dir
+        self.max_files = max_files
+        self._active = {}  # task -> Counter of folded stacks
+        self._lock = threading.Lock()
+        self._loop = None
+        self._loop_thread_id = None
+        self._thread = None
+        self._samples = 0
+        self._written = 0
+
+    def begin(self):
+        """Starts collecting for the calling request's task; returns a handle for ``end``."""
+        if self._thread is None:
+            self._loop = asyncio.get_running_loop()
+            self._loop_thread_id = threading.get_ident()
+            self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+            self._thread.start()
+
+        task = asyncio.current_task()
+        samples = Counter()
+        with self._lock:
+            self._active[task] = samples
+        return task, samples
+
+    def end(self, handle, label, elapsed):
+        task, samples = handle
+        with self._lock:
+            self._active.pop(task, None)
+        if elapsed >= self.slow_seconds and samples and self._written < self.max_files:
+            self._write(label, elapsed, samples)
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                if not self._active:
+                    continue
+            task = asyncio.current_task(self._loop)
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if task is None or frame is None:
+                continue  # the loop is idle, waiting on I/O
+            with self._lock:
+                samples = self._active.get(task)
+                if samples is not None:
+                    samples[self._fold(frame)] += 1
+                    self._samples += 1
+
+    @staticmethod
+    def _fold(frame):
+        names = []
+        while frame is not None:
+            code = frame.f_code
+            names.append(f"{code.co_name} ({os.path.basename(code.co_filename)})".replace(";", ":"))
+            frame = frame.f_back
+        return ";".join(reversed(names))
+
+    def _write(self, label, elapsed, samples):
+        os.makedirs(self.output_dir, exist_ok=True)
+        slug = re.sub(r"[^A-Za-z0-9]+", "_", label).strip("_")
+        path = os.path.join(self.output_dir, f"{time.strftime('%Y%m%d-%H%M%S')}-{slug}-{1000 * elapsed:.0f}ms.folded")
+        with open(path, "w") as f:
+            f.writelines(f"{stack} {count}\n" for stack, count in samples.items())
+        self._written += 1
+        print(f"✅ Wrote profile of slow request {label} ({1000 * elapsed:.0f} ms) to {path}")
+
+    def stats(self):
+        return {
+            "slow_request_ms": self.slow_seconds * 1000,
+            "sample_interval_ms": self.interval * 1000,
+            "in_flight": len(self._active),
+            "samples": self._samples,
+            "profiles_written": self._written,
+        }
+
+profiler = SamplingProfiler(PROFILE_SLOW_REQUEST_MS, PROFILE_SAMPLE_INTERVAL_MS, PROFILE_OUTPUT_DIR, PROFILE_MAX_FILES) if PROFILE_SLOW_REQUEST_MS > 0 else None
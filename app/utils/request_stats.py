@@ -0,0 +1,118 @@
+import time
+from contextvars import ContextVar
+
+from app.utils.metrics import Counter, Histogram
+from app.utils.profiler import profiler
+
+REQUEST_COUNT = Counter("http_requests_total", "HTTP requests by route and status.", ("method", "route", "status"))
+REQUEST_SECONDS = Histogram("http_request_duration_seconds", "Time to the end of the response.", ("method", "route"))
+ACQUIRE_SECONDS = Histogram(
+    "db_connection_acquire_seconds", "Time spent waiting for database connections, per request.", ("route",),
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0),
+)
+QUERIES_PER_REQUEST = Histogram("db_queries_per_request", "Database statements issued per request.", ("route",), buckets=(0, 1, 2, 3, 5, 8, 13, 21, 50, 100))
+QUERY_SECONDS = Histogram(
+    "db_query_duration_seconds", "Duration of individual database statements.", ("route",),
+    buckets=(0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5, 1.0),
+)
+COMMIT_SECONDS = Histogram(
+    "db_commit_duration_seconds", "Duration of individual commits.", ("route",),
+    buckets=(0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5, 1.0),
+)
+
+# Statements run outside any request (batch flushes, location writes, startup) are filed under this route.
+BACKGROUND_ROUTE = "background"
+
+class RequestStats:
+    """Database time accumulated by one request; filled in by the connection wrappers in ``app.database``."""
+    __slots__ = ("acquire_seconds", "query_seconds", "commit_seconds")
+
+    def __init__(self):
+        self.acquire_seconds = 0.0
+        self.query_seconds = []
+        self.commit_seconds = []
+
+    def server_timing(self, total_seconds):
+        """``Server-Timing`` header value, so browser devtools and curl show the breakdown per response."""
+        return ", ".join([
+            f"db-acquire;dur={1000 * self.acquire_seconds:.2f}",
+            f'db-query;dur={1000 * sum(self.query_seconds):.2f};desc="{len(self.query_seconds)} queries"',
+            f'db-commit;dur={1000 * sum(self.commit_seconds):.2f};desc="{len(self.commit_seconds)} commits"',
+            f"total;dur={1000 * total_seconds:.2f}",
+        ])
+
+_current = ContextVar("request_stats", default=None)
+
+def current_request_stats():
+    return _current.get()
+
+def record_acquire(seconds):
+    stats = _current.get()
+    if stats is None:
+        ACQUIRE_SECONDS.observe(seconds, BACKGROUND_ROUTE)
+    else:
+        stats.acquire_seconds += seconds
+
+def record_query(seconds):
+    stats = _current.get()
+    if stats is None:
+        QUERY_SECONDS.observe(seconds, BACKGROUND_ROUTE)
+    else:
+        stats.query_seconds.append(seconds)
+
+def record_commit(seconds):
+    stats = _current.get()
+    if stats is None:
+        COMMIT_SECONDS.observe(seconds, BACKGROUND_ROUTE)
+    else:
+        stats.commit_seconds.append(seconds)
+
+class RequestMetricsMiddleware:
+    """ASGI middleware that times each request and files its database time under its route template.
+
+    Pure ASGI rather than ``BaseHTTPMiddleware`` so the handler runs in the
+    same task and context as the ``RequestStats`` it writes into, and
+    streaming responses are not buffered.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = _current.set(stats)
+        started = time.perf_counter()
+        status = 500
+        sampling = profiler.begin() if profiler is not None else None
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                timing = stats.server_timing(time.perf_counter() - started).encode("latin-1")
+                message = {**message, "headers": [*message.get("headers", ()), (b"server-timing", timing)]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            elapsed = time.perf_counter() - started
+            _current.reset(token)
+            route = getattr(scope.get("route"), "path", "unmatched")
+            method = scope["method"]
+
+            REQUEST_COUNT.inc(method, route, str(status))
+            REQUEST_SECONDS.observe(elapsed, method, route)
+            ACQUIRE_SECONDS.observe(stats.acquire_seconds, route)
+            QUERIES_PER_REQUEST.observe(len(stats.query_seconds), route)
+            for seconds in stats.query_seconds:
+                QUERY_SECONDS.observe(seconds, route)
+            for seconds in stats.commit_seconds:
+                COMMIT_SECONDS.observe(seconds, route)
+
+            if sampling is not None:
+                profiler.end(sampling, f"{method} {route}", elapsed)
@@ -0,0 +1,225 @@
+"""Minimal client (and local stand-in server) for the Redis wire protocol (RESP2).
+
+Only what the lookup cache needs: GET, SET with PX, DEL and PING. The
+stand-in lets several uvicorn workers share one cache in development
+without installing Redis::
+
+    python -m app.utils.resp --port 6379
+
+Anything that speaks RESP (Redis, Valkey, KeyDB, Dragonfly) works in its place.
+"""
+import argparse
+import asyncio
+import time
+from collections import deque
+from urllib.parse import urlparse
+
+class RespError(Exception):
+    """Error reply from the server, or a dropped connection."""
+
+def encode_command(*args):
+    parts = [f"*{len(args)}\r\n".encode()]
+    for arg in args:
+        data = arg if isinstance(arg, bytes) else str(arg).encode()
+        parts.append(b"$%d\r\n%s\r\n" % (len(data), data))
+    return b"".join(parts)
+
+async def read_reply(reader):
+    line = await reader.readline()
+    if not line:
+        raise ConnectionError("Connection closed")
+    kind, body = line[:1], line[1:-2]
+    if kind == b"+":
+        return body.decode()
+    if kind == b"-":
+        return RespError(body.decode())
+    if kind == b":":
+        return int(body)
+    if kind == b"$":
+        length = int(body)
+        if length < 0:
+            return None
+        data = await reader.readexactly(length + 2)
+        return data[:-2]
+    if kind == b"*":
+        count = int(body)
+        return None if count < 0 else [await read_reply(reader) for _ in range(count)]
+    raise RespError(f"Unexpected reply type {kind!r}")
+
+class RespClient:
+    """Single pipelined connection: commands are written in order and replies matched FIFO.
+
+    Reconnects lazily on the next command after the connection drops; the
+    commands in flight at that moment fail with ``RespError``.
+    """
+
+    def __init__(self, host="localhost", port=6379, db=0, password=None):
+        self.host = host
+        self.port = port
+        self.db = db
+        self.password = password
+        self._writer = None
+        self._pending = deque()  # futures awaiting replies, oldest first
+        self._reader_task = None
+        self._connecting = None
+
+    @classmethod
+    def from_url(cls, url):
+        parsed = urlparse(url)
+        db = int(parsed.path.lstrip("/") or 0)
+        return cls(parsed.hostname or "localhost", parsed.port or 6379, db, parsed.password)
+
+    async def _connect(self):
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        self._writer = writer
+        self._reader_task = asyncio.ensure_future(self._read_replies(reader))
+        if self.password:
+            await self.command("AUTH", self.password)
+        if self.db:
+            await self.command("SELECT", self.db)
+
+    async def _ensure_connected(self):
+        if self._writer is not None:
+            return
+        if self._connecting is None:
+            self._connecting = asyncio.ensure_future(self._connect())
+        try:
+            await asyncio.shield(self._connecting)
+        finally:
+            if self._connecting is not None and self._connecting.done():
+                self._connecting = None
+
+    async def _read_replies(self, reader):
+        try:
+            while True:
+                reply = await read_reply(reader)
+                future = self._pending.popleft()
+                if future.done():
+                    continue
+                if isinstance(reply, RespError):
+                    future.set_exception(reply)
+                else:
+                    future.set_result(reply)
+        except (ConnectionError, asyncio.IncompleteReadError, OSError) as e:
+            self._drop(RespError(f"Connection lost: {e}"))
+
+    def _drop(self, error):
+        if self._reader_task is not None:
+            self._reader_task.cancel()
+            self._reader_task = None
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        while self._pending:
+            future = self._pending.popleft()
+            if not future.done():
+                future.set_exception(error)
+
+    async def command(self, *args, timeout=None):
+        """Sends one command and waits for its reply.
+
+        With ``timeout`` set, a server that neither answers nor fails in time is
+        presumed stuck: the connection is dropped (failing every command in flight)
+        and the next command reconnects.
+        """
+        if timeout is None:
+            return await self._command(*args)
+        try:
+            return await asyncio.wait_for(self._command(*args), timeout)
+        except asyncio.TimeoutError:
+            self._drop(RespError("Timed out"))
+            raise RespError(f"{args[0]} timed out after {timeout}s") from None
+
+    async def _command(self, *args):
+        await self._ensure_connected()
+        future = asyncio.get_running_loop().create_future()
+        # Appending and writing without an await in between keeps replies in command order.
+        self._pending.append(future)
+        self._writer.write(encode_command(*args))
+        return await future
+
+    async def close(self):
+        self._drop(RespError("Client closed"))
+
+class RespServer:
+    """In-memory stand-in speaking enough RESP for the cache (GET/SET/DEL/EXISTS/PING/FLUSHDB)."""
+
+    def __init__(self):
+        self._data = {}  # key -> (value, expires_at or None)
+
+    def _get(self, key):
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at is not None and expires_at <= time.monotonic():
+            del self._data[key]
+            return None
+        return value
+
+    def execute(self, args):
+        name = args[0].upper()
+        if name == b"PING":
+            return "+PONG"
+        if name in (b"SELECT", b"AUTH"):
+            return "+OK"
+        if name == b"GET":
+            return self._get(args[1])
+        if name == b"SET":
+            expires_at = None
+            options = [arg.upper() for arg in args[3:]]
+            if b"PX" in options:
+                expires_at = time.monotonic() + int(args[3 + options.index(b"PX") + 1]) / 1000
+            elif b"EX" in options:
+                expires_at = time.monotonic() + int(args[3 + options.index(b"EX") + 1])
+            self._data[args[1]] = (args[2], expires_at)
+            return "+OK"
+        if name == b"DEL":
+            return sum(self._data.pop(key, None) is not None for key in args[1:])
+        if name == b"EXISTS":
+            return sum(self._get(key) is not None for key in args[1:])
+        if name == b"FLUSHDB":
+            self._data.clear()
+            return "+OK"
+        return RespError(f"ERR unknown command '{name.decode()}'")
+
+    @staticmethod
+    def encode_reply(reply):
+        if reply is None:
+            return b"$-1\r\n"
+        if isinstance(reply, RespError):
+            return f"-{reply}\r\n".encode()
+        if isinstance(reply, int):
+            return b":%d\r\n" % reply
+        if isinstance(reply, str):
+            return f"{reply}\r\n".encode()
+        return b"$%d\r\n%s\r\n" % (len(reply), reply)
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                request = await read_reply(reader)
+                if not isinstance(request, list) or not request:
+                    break
+                writer.write(self.encode_reply(self.execute(request)))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+async def serve(host, port):
+    server = await asyncio.start_server(RespServer().handle, host, port)
+    print(f"✅ RESP stand-in listening on {host}:{port}")
+    async with server:
+        await server.serve_forever()
+
+def main():
+    parser = argparse.ArgumentParser(description="In-memory Redis-protocol stand-in for local development.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6379)
+    args = parser.parse_args()
+    asyncio.run(serve(args.host, args.port))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,19 @@
+from uvicorn_worker import UvicornWorker
+
+# Seconds of gunicorn's graceful_timeout kept back for the lifespan shutdown (buffer flushes, pool drain).
+SHUTDOWN_RESERVE_SECONDS = 5
+
+class DrainingUvicornWorker(UvicornWorker):
+    """Uvicorn worker for gunicorn that always gets to run the app's shutdown handlers.
+
+    On SIGTERM uvicorn stops accepting, waits for in-flight requests and
+    then runs the lifespan shutdown. The stock worker waits on open
+    connections without a limit, so a slow client could keep it busy until
+    gunicorn SIGKILLs it at ``graceful_timeout``, skipping the shutdown
+    entirely. This one gives up on connections ``SHUTDOWN_RESERVE_SECONDS``
+    earlier, leaving time to flush buffers and drain the pools.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.config.timeout_graceful_shutdown = max(self.cfg.graceful_timeout - SHUTDOWN_RESERVE_SECONDS, 1)
@@ -0,0 +1,147 @@
+"""Throughput of the async status endpoint vs. the previous sync handler.
+
+Starts a single uvicorn worker serving both variants of
+``GET /rides/{booking_id}/status`` and hammers each with the same number of
+concurrent clients::
+
+    python -m benchmarks.async_vs_sync --concurrency 1000 --requests 20000
+
+Needs a reachable Postgres (DB_* settings from .env) and ``httpx``.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import httpx
+from fastapi import Depends, FastAPI, HTTPException
+from psycopg2.extras import RealDictCursor
+
+from app.database.async_db import async_db_pool
+from app.database.db import db_pool, get_db, get_db_connection
+from app.models.booking import RideResponse
+from app.routes import ride_routes
+from app.utils.auth import create_jwt_token, get_current_user
+
+bench_app = FastAPI()
+bench_app.include_router(ride_routes.router, prefix="/async/rides")
+
+@bench_app.get("/sync/rides/{booking_id}/status", response_model=RideResponse)
+def get_ride_status_sync(booking_id: int, current_user: dict = Depends(get_current_user), conn=Depends(get_db)):
+    """The pre-async handler, kept here only as the baseline."""
+    cursor = conn.cursor(cursor_factory=RealDictCursor)
+    try:
+        cursor.execute("SELECT * FROM bookings WHERE id = %s", (booking_id,))
+        booking = cursor.fetchone()
+        if not booking:
+            raise HTTPException(status_code=404, detail="Booking not found")
+        return RideResponse(**booking)
+    finally:
+        cursor.close()
+
+@bench_app.on_event("startup")
+async def startup():
+    db_pool.open()
+    await async_db_pool.open()
+
+@bench_app.on_event("shutdown")
+async def shutdown():
+    await async_db_pool.close()
+    db_pool.closeall()
+
+def pick_booking_id():
+    conn = get_db_connection()
+    if not conn:
+        sys.exit("Database connection failed")
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT id FROM bookings ORDER BY id LIMIT 1")
+            row = cursor.fetchone()
+            if row:
+                return row[0]
+            cursor.execute("SELECT id, user_id FROM riders ORDER BY id LIMIT 1")
+            rider = cursor.fetchone()
+            if not rider:
+                sys.exit("No riders found; seed the database first (python -m app.database.init_db --seed)")
+            cursor.execute(
+                "INSERT INTO bookings (user_id, rider_id, status, distance, fare) VALUES (%s, %s, 'Completed', 1, 10000) RETURNING id",
+                (rider[1], rider[0]),
+            )
+            booking_id = cursor.fetchone()[0]
+        conn.commit()
+        return booking_id
+    finally:
+        conn.close()
+
+async def drive(base_url, path, token, concurrency, total):
+    latencies = []
+    errors = 0
+    remaining = iter(range(total))
+    headers = {"Authorization": f"Bearer {token}"}
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, headers=headers, limits=limits, timeout=60) as client:
+        async def worker():
+            nonlocal errors
+            for _ in remaining:
+                started = time.perf_counter()
+                response = await client.get(path)
+                latencies.append(time.perf_counter() - started)
+                if response.status_code != 200:
+                    errors += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "rps": total / elapsed,
+        "p50_ms": 1000 * statistics.median(latencies),
+        "p99_ms": 1000 * latencies[int(len(latencies) * 0.99) - 1],
+        "errors": errors,
+    }
+
+async def wait_until_up(base_url, timeout=30):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(base_url=base_url) as client:
+        while time.monotonic() < deadline:
+            try:
+                await client.get("/docs")
+                return
+            except httpx.TransportError:
+                await asyncio.sleep(0.2)
+    sys.exit("Benchmark server did not start")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--concurrency", type=int, default=500)
+    parser.add_argument("--requests", type=int, default=10000)
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    booking_id = pick_booking_id()
+    token = create_jwt_token({"user_id": 1, "phone_number": "bench", "is_admin": False})
+    base_url = f"http://127.0.0.1:{args.port}"
+
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "benchmarks.async_vs_sync:bench_app", "--port", str(args.port), "--log-level", "warning"],
+        env=os.environ.copy(),
+    )
+    try:
+        asyncio.run(wait_until_up(base_url))
+        print(f"{'handler':<8}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'errors':>8}")
+        for label in ("sync", "async"):
+            path = f"/{label}/rides/{booking_id}/status"
+            asyncio.run(drive(base_url, path, token, min(args.concurrency, 50), 500))  # warm-up
+            result = asyncio.run(drive(base_url, path, token, args.concurrency, args.requests))
+            print(f"{label:<8}{result['rps']:>10.0f}{result['p50_ms']:>10.1f}{result['p99_ms']:>10.1f}{result['errors']:>8}")
+    finally:
+        server.terminate()
+        server.wait()
+
+if __name__ == "__main__":
+    main()
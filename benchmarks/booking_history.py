@@ -0,0 +1,149 @@
+"""Booking lookup latency as the ride history grows.
+
+Grows a throw-away history of finished rides month by month (one partition
+each) and, after every step, times the status lookup and status update the
+ride endpoints run against a set of live bookings, next to the plain
+``WHERE id = $1`` lookup they used before partitioning and an admin listing
+page::
+
+    python -m benchmarks.booking_history --months 0,6,12,24 --rows-per-month 100000
+    python -m benchmarks.booking_history --json history.json
+    python -m benchmarks.booking_history --baseline history.json
+    python -m benchmarks.booking_history --archive   # then archive and time again
+
+``--archive`` runs the real archival, so any partition of this database past
+BOOKING_RETENTION_DAYS moves to bookings_archive, not just the benchmark's.
+The past partitions the benchmark creates stay behind empty and are archived
+by the next maintenance run. Needs Postgres with migrations applied.
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import sys
+import time
+
+import asyncpg
+
+from app.database.config import DATABASE_CONFIG
+from app.services.booking_partitions import BOOKING_RETENTION_DAYS, fetch_booking, set_booking_status
+from app.utils.auth import hash_password
+from benchmarks.results import compare, save
+
+PHONE_PREFIX = "HIST"
+UNPRUNED_LOOKUP = "SELECT * FROM bookings WHERE id = $1"
+ADMIN_PAGE = "SELECT id, user_id, rider_id, status, distance, fare FROM bookings WHERE status = $1 AND id > $2 ORDER BY id LIMIT 100"
+
+async def connect():
+    config = dict(DATABASE_CONFIG)
+    if config.get("port"):
+        config["port"] = int(config["port"])
+    return await asyncpg.connect(**config)
+
+async def setup(conn, live):
+    user_id = await conn.fetchval(
+        "INSERT INTO users (name, phone_number, password) VALUES ('History Bench', $1, $2) RETURNING id",
+        f"{PHONE_PREFIX}{random.randrange(10**8):08d}", hash_password("history-bench"),
+    )
+    rows = await conn.fetch(
+        """
+        INSERT INTO bookings (user_id, status, distance, fare)
+        SELECT $1, 'Pending', 5, 50000 FROM generate_series(1, $2)
+        RETURNING id
+        """,
+        user_id, live,
+    )
+    return user_id, [row["id"] for row in rows]
+
+async def grow_history(conn, user_id, from_month, to_month, rows_per_month):
+    """Adds ``rows_per_month`` finished rides to each month ``from_month``..``to_month - 1`` months ago."""
+    for months_back in range(from_month + 1, to_month + 1):
+        await conn.execute("SELECT ensure_booking_partitions(now() - make_interval(months => $1), 0)", months_back)
+        await conn.execute(
+            """
+            INSERT INTO bookings (user_id, status, distance, fare, created_at)
+            SELECT $1, CASE WHEN n % 10 = 0 THEN 'Canceled' ELSE 'Completed' END, 5, 50000,
+                   date_trunc('month', now() - make_interval(months => $2)) + (n % 27) * interval '1 day' + (n % 86400) * interval '1 second'
+            FROM generate_series(1, $3) AS n
+            """,
+            user_id, months_back, rows_per_month,
+        )
+    await conn.execute("ANALYZE bookings")
+
+async def time_queries(conn, operation, ids, repeat):
+    timings = []
+    for _ in range(repeat):
+        for booking_id in ids:
+            started = time.perf_counter()
+            await operation(booking_id)
+            timings.append(1000 * (time.perf_counter() - started))
+    timings.sort()
+    return {
+        "p50_ms": round(statistics.median(timings), 4),
+        "p95_ms": round(timings[int(0.95 * (len(timings) - 1))], 4),
+    }
+
+async def measure(conn, ids, repeat, label, results):
+    operations = {
+        "status_lookup": lambda booking_id: fetch_booking(conn, booking_id),
+        "status_update": lambda booking_id: set_booking_status(conn, booking_id, "Pending"),
+        "unpruned_lookup": lambda booking_id: conn.fetchrow(UNPRUNED_LOOKUP, booking_id),
+        "admin_page_pending": lambda booking_id: conn.fetch(ADMIN_PAGE, "Pending", 0),
+    }
+    partitions = await conn.fetchval("SELECT count(*) FROM pg_inherits WHERE inhparent = 'bookings'::regclass")
+    rows = await conn.fetchval("SELECT count(*) FROM bookings")
+    print(f"\n{label}: {rows} rows in {partitions} partitions")
+    for name, operation in operations.items():
+        await time_queries(conn, operation, ids[:10], 1)  # warm-up, and past asyncpg's custom-plan phase
+        result = results[f"{name}[{label}]"] = await time_queries(conn, operation, ids, repeat)
+        print(f"  {name:<20} p50 {result['p50_ms']:>8.3f} ms   p95 {result['p95_ms']:>8.3f} ms")
+
+async def cleanup(conn, user_id):
+    await conn.execute("DELETE FROM bookings WHERE user_id = $1", user_id)
+    await conn.execute("DELETE FROM bookings_archive WHERE user_id = $1", user_id)
+    await conn.execute("DELETE FROM users WHERE id = $1", user_id)
+
+async def run(args):
+    conn = await connect()
+    user_id, ids = await setup(conn, args.live)
+    results = {}
+    try:
+        grown = 0
+        for months in args.months:
+            await grow_history(conn, user_id, grown, months, args.rows_per_month)
+            grown = max(grown, months)
+            await measure(conn, ids, args.repeat, f"{grown}mo", results)
+
+        if args.archive:
+            archived = await conn.fetchval("SELECT archive_booking_partitions(make_interval(days => $1))", BOOKING_RETENTION_DAYS)
+            await conn.execute("ANALYZE bookings")
+            print(f"\nArchived {archived} partitions older than {BOOKING_RETENTION_DAYS} days")
+            await measure(conn, ids, args.repeat, f"{grown}mo_archived", results)
+    finally:
+        await cleanup(conn, user_id)
+        await conn.close()
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--months", default="0,6,12,24", help="Comma-separated history sizes to measure at, in months")
+    parser.add_argument("--rows-per-month", type=int, default=100000)
+    parser.add_argument("--live", type=int, default=200, help="Recent bookings the lookups target")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--archive", action="store_true", help="Archive old partitions at the end and measure again")
+    parser.add_argument("--json", help="Write results to this file")
+    parser.add_argument("--baseline", help="Compare against results saved earlier with --json")
+    args = parser.parse_args()
+    args.months = sorted(int(months) for months in args.months.split(","))
+
+    try:
+        results = asyncio.run(run(args))
+    except (OSError, asyncpg.PostgresError) as e:
+        sys.exit(f"❌ Database error: {e}")
+    if args.json:
+        save(args.json, results)
+    if args.baseline:
+        compare(results, args.baseline, "p50_ms")
+
+if __name__ == "__main__":
+    main()
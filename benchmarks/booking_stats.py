@@ -0,0 +1,197 @@
+"""Rider and user statistics: maintained rows against aggregating the bookings.
+
+Gives a throw-away user and a few riders a ride history, then times what the
+admin stats endpoints read (one ``rider_stats`` / ``user_stats`` row) next
+to the full aggregate over ``bookings`` dashboards used to run, and the
+status update the trigger adds its upserts to. Finally pushes a mixed
+workload of bookings, reassignments, completions and cancellations through
+and checks that the maintained totals still equal the aggregate::
+
+    python -m benchmarks.booking_stats --history 200000
+    python -m benchmarks.booking_stats --json stats.json
+    python -m benchmarks.booking_stats --baseline stats.json
+
+Exits non-zero if the totals drift. Needs Postgres with migrations applied.
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import sys
+import time
+
+import asyncpg
+
+from app.database.config import DATABASE_CONFIG
+from app.services.booking_partitions import set_booking_status
+from app.utils.auth import hash_password
+from benchmarks.results import compare, save
+
+PHONE_PREFIX = "STATS"
+PLATE_PREFIX = "STATS-"
+STATUSES = ["Pending", "In Progress", "Completed", "Completed", "Completed", "Canceled"]
+
+TOTALS = """
+    count(*) AS trips,
+    count(*) FILTER (WHERE status = 'Completed') AS completed_trips,
+    count(*) FILTER (WHERE status = 'Canceled') AS canceled_trips,
+    COALESCE(sum(fare) FILTER (WHERE status = 'Completed'), 0) AS total_fare,
+    COALESCE(sum(distance) FILTER (WHERE status = 'Completed'), 0) AS total_distance
+"""
+RIDER_AGGREGATE = f"""
+    SELECT {TOTALS} FROM (
+        SELECT status, fare, distance FROM bookings WHERE rider_id = $1
+        UNION ALL SELECT status, fare, distance FROM bookings_archive WHERE rider_id = $1
+    ) b
+"""
+USER_AGGREGATE = f"""
+    SELECT {TOTALS} FROM (
+        SELECT status, fare, distance FROM bookings WHERE user_id = $1
+        UNION ALL SELECT status, fare, distance FROM bookings_archive WHERE user_id = $1
+    ) b
+"""
+RIDER_STATS = "SELECT trips, completed_trips, canceled_trips, total_fare, total_distance FROM rider_stats WHERE rider_id = $1"
+USER_STATS = "SELECT trips, completed_trips, canceled_trips, total_fare, total_distance FROM user_stats WHERE user_id = $1"
+
+async def connect():
+    config = dict(DATABASE_CONFIG)
+    if config.get("port"):
+        config["port"] = int(config["port"])
+    return await asyncpg.connect(**config)
+
+async def setup(conn, riders, history):
+    user_id = await conn.fetchval(
+        "INSERT INTO users (name, phone_number, password) VALUES ('Stats Bench', $1, $2) RETURNING id",
+        f"{PHONE_PREFIX}{random.randrange(10**8):08d}", hash_password("stats-bench"),
+    )
+    rider_ids = [
+        await conn.fetchval(
+            "INSERT INTO riders (user_id, vehicle_type, license_plate, status) VALUES ($1, 'Bike', $2, 'Busy') RETURNING id",
+            user_id, f"{PLATE_PREFIX}{random.randrange(10**6):06d}-{i}",
+        )
+        for i in range(riders)
+    ]
+    # Finished rides only, so no rider ends up with two open bookings.
+    await conn.execute(
+        """
+        INSERT INTO bookings (user_id, rider_id, status, distance, fare)
+        SELECT $1, ($2::int[])[1 + n % array_length($2::int[], 1)],
+               CASE WHEN n % 5 = 0 THEN 'Canceled' ELSE 'Completed' END, 1 + n % 30, 15000 + (n % 100) * 1000
+        FROM generate_series(1, $3) AS n
+        """,
+        user_id, rider_ids, history,
+    )
+    await conn.execute("ANALYZE bookings")
+    return user_id, rider_ids
+
+async def time_queries(operation, keys, repeat):
+    timings = []
+    for _ in range(repeat):
+        for key in keys:
+            started = time.perf_counter()
+            await operation(key)
+            timings.append(1000 * (time.perf_counter() - started))
+    timings.sort()
+    return {
+        "p50_ms": round(statistics.median(timings), 4),
+        "p95_ms": round(timings[int(0.95 * (len(timings) - 1))], 4),
+    }
+
+async def churn(conn, user_id, rider_ids, operations):
+    """Random bookings and status changes, the way the ride endpoints and the dispatch queue make them."""
+    free = set(rider_ids)
+    open_rides = {}  # booking_id -> rider_id or None while queued
+    for _ in range(operations):
+        action = random.random()
+        if action < 0.4 or not open_rides:
+            rider_id = free.pop() if free and random.random() < 0.7 else None
+            booking_id = await conn.fetchval(
+                "INSERT INTO bookings (user_id, rider_id, status, distance, fare) VALUES ($1, $2, 'Pending', $3, $4) RETURNING id",
+                user_id, rider_id, random.randint(1, 30), random.randint(15, 300) * 1000,
+            )
+            open_rides[booking_id] = rider_id
+        elif action < 0.5:
+            queued = [booking_id for booking_id, rider_id in open_rides.items() if rider_id is None]
+            if queued and free:
+                booking_id, rider_id = random.choice(queued), free.pop()
+                await conn.execute("UPDATE bookings SET rider_id = $1 WHERE id = $2", rider_id, booking_id)
+                open_rides[booking_id] = rider_id
+        else:
+            booking_id = random.choice(list(open_rides))
+            status = random.choice(STATUSES)
+            await set_booking_status(conn, booking_id, status)
+            if status in ("Completed", "Canceled"):
+                rider_id = open_rides.pop(booking_id)
+                if rider_id is not None:
+                    free.add(rider_id)
+
+async def check(conn, user_id, rider_ids):
+    """Keys whose maintained totals differ from the aggregate."""
+    drifted = []
+    for key, aggregate, maintained in [(user_id, USER_AGGREGATE, USER_STATS)] + [(rider_id, RIDER_AGGREGATE, RIDER_STATS) for rider_id in rider_ids]:
+        expected = tuple(await conn.fetchrow(aggregate, key))
+        actual = await conn.fetchrow(maintained, key)
+        if tuple(actual or (0, 0, 0, 0, 0)) != expected:
+            drifted.append(key)
+    return drifted
+
+async def cleanup(conn, user_id):
+    await conn.execute("DELETE FROM bookings WHERE user_id = $1", user_id)
+    await conn.execute("DELETE FROM bookings_archive WHERE user_id = $1", user_id)
+    rider_ids = await conn.fetch("DELETE FROM riders WHERE license_plate LIKE $1 RETURNING id", PLATE_PREFIX + "%")
+    await conn.execute("DELETE FROM rider_stats WHERE rider_id = ANY($1::int[])", [row["id"] for row in rider_ids])
+    await conn.execute("DELETE FROM user_stats WHERE user_id = $1", user_id)
+    await conn.execute("DELETE FROM users WHERE id = $1", user_id)
+
+async def run(args):
+    conn = await connect()
+    user_id, rider_ids = await setup(conn, args.riders, args.history)
+    results = {}
+    try:
+        live_ids = [row["id"] for row in await conn.fetch("SELECT id FROM bookings WHERE user_id = $1 ORDER BY id DESC LIMIT 200", user_id)]
+        operations = {
+            "rider_aggregate": (lambda rider_id: conn.fetchrow(RIDER_AGGREGATE, rider_id), rider_ids),
+            "rider_stats_row": (lambda rider_id: conn.fetchrow(RIDER_STATS, rider_id), rider_ids),
+            "user_aggregate": (lambda _: conn.fetchrow(USER_AGGREGATE, user_id), rider_ids),
+            "user_stats_row": (lambda _: conn.fetchrow(USER_STATS, user_id), rider_ids),
+            # Flipping finished rides between Completed and Canceled moves the totals, so the trigger does real work.
+            "status_update": (lambda booking_id: set_booking_status(conn, booking_id, random.choice(["Completed", "Canceled"])), live_ids),
+        }
+        print(f"{args.history} finished rides over {args.riders} riders")
+        for name, (operation, keys) in operations.items():
+            await time_queries(operation, keys[:10], 1)  # warm-up, and past asyncpg's custom-plan phase
+            result = results[name] = await time_queries(operation, keys, args.repeat)
+            print(f"  {name:<18} p50 {result['p50_ms']:>9.3f} ms   p95 {result['p95_ms']:>9.3f} ms")
+
+        await churn(conn, user_id, rider_ids, args.churn)
+        drifted = await check(conn, user_id, rider_ids)
+    finally:
+        await cleanup(conn, user_id)
+        await conn.close()
+
+    if drifted:
+        sys.exit(f"FAIL: maintained totals differ from the aggregate for ids {drifted}")
+    print(f"OK: totals match the aggregate after {args.churn} random changes")
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--history", type=int, default=200000, help="Finished rides to start from")
+    parser.add_argument("--riders", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--churn", type=int, default=5000, help="Random changes to push through before checking the totals")
+    parser.add_argument("--json", help="Write results to this file")
+    parser.add_argument("--baseline", help="Compare against results saved earlier with --json")
+    args = parser.parse_args()
+
+    try:
+        results = asyncio.run(run(args))
+    except (OSError, asyncpg.PostgresError) as e:
+        sys.exit(f"❌ Database error: {e}")
+    if args.json:
+        save(args.json, results)
+    if args.baseline:
+        compare(results, args.baseline, "p50_ms")
+
+if __name__ == "__main__":
+    main()
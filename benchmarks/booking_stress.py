@@ -0,0 +1,160 @@
+"""Concurrency stress test for rider assignment in ``POST /rides/book``.
+
+Registers a batch of throw-away riders, fires many more simultaneous
+bookings than there are riders, then checks in Postgres that no rider ended
+up with more than one open booking and that every winner is marked Busy.
+Bookings beyond the free riders join the dispatch queue rather than fail,
+so they are reported as queued::
+
+    python -m benchmarks.booking_stress --riders 50 --bookings 1000
+
+The app from ``main.py`` is driven in-process, so every booking competes
+for rows through the real async pool and Postgres locks. Exits non-zero if
+a double assignment is found. Needs Postgres and ``httpx``.
+"""
+import argparse
+import asyncio
+import random
+import sys
+import time
+from collections import Counter
+
+import httpx
+
+from app.database.db import get_db_connection
+from app.utils.auth import create_jwt_token
+
+PLATE_PREFIX = "STRESS-"
+CENTER = (10.7769, 106.7009)
+
+def setup(rider_count):
+    conn = get_db_connection()
+    if not conn:
+        sys.exit("Database connection failed")
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                """
+                INSERT INTO users (name, phone_number, password)
+                VALUES ('Stress Test', '0000000000', 'x')
+                ON CONFLICT (phone_number) DO UPDATE SET name = EXCLUDED.name
+                RETURNING id
+                """
+            )
+            user_id = cursor.fetchone()[0]
+            for i in range(rider_count):
+                cursor.execute(
+                    """
+                    INSERT INTO riders (user_id, vehicle_type, license_plate, status, latitude, longitude)
+                    VALUES (%s, 'Stress', %s, 'Available', %s, %s)
+                    """,
+                    (user_id, f"{PLATE_PREFIX}{i}", CENTER[0] + random.uniform(-0.05, 0.05), CENTER[1] + random.uniform(-0.05, 0.05)),
+                )
+        conn.commit()
+        return user_id
+    finally:
+        conn.close()
+
+def verify(user_id):
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cursor:
+            # Any rider the stress bookings touched, including pre-existing riders near the centre.
+            cursor.execute(
+                """
+                SELECT rider_id, COUNT(*) FROM bookings
+                WHERE status IN ('Pending', 'In Progress')
+                  AND rider_id IN (SELECT rider_id FROM bookings WHERE user_id = %s)
+                GROUP BY rider_id HAVING COUNT(*) > 1
+                """,
+                (user_id,),
+            )
+            doubles = cursor.fetchall()
+            cursor.execute(
+                """
+                SELECT b.rider_id FROM bookings b JOIN riders r ON r.id = b.rider_id
+                WHERE b.user_id = %s AND b.status = 'Pending' AND r.status <> 'Busy'
+                """,
+                (user_id,),
+            )
+            not_busy = cursor.fetchall()
+            cursor.execute("SELECT COUNT(*), COUNT(*) FILTER (WHERE rider_id IS NULL) FROM bookings WHERE user_id = %s", (user_id,))
+            booked, queued = cursor.fetchone()
+        return doubles, not_busy, booked, queued
+    finally:
+        conn.close()
+
+def cleanup(user_id):
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                """
+                UPDATE riders SET status = 'Available'
+                WHERE id IN (SELECT rider_id FROM bookings WHERE user_id = %s AND status IN ('Pending', 'In Progress'))
+                """,
+                (user_id,),
+            )
+            cursor.execute("DELETE FROM bookings WHERE user_id = %s", (user_id,))
+            cursor.execute("DELETE FROM riders WHERE license_plate LIKE %s", (PLATE_PREFIX + "%",))
+            cursor.execute("DELETE FROM users WHERE id = %s", (user_id,))
+        conn.commit()
+    finally:
+        conn.close()
+
+async def fire(client, user_id, bookings):
+    statuses = Counter()
+
+    async def book():
+        payload = {
+            "user_id": user_id,
+            "distance": random.randint(1, 10),
+            "pickup_latitude": CENTER[0] + random.uniform(-0.05, 0.05),
+            "pickup_longitude": CENTER[1] + random.uniform(-0.05, 0.05),
+        }
+        response = await client.post("/rides/book", json=payload)
+        statuses[response.status_code] += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(book() for _ in range(bookings)))
+    return statuses, time.perf_counter() - started
+
+async def run(args, user_id):
+    token = create_jwt_token({"user_id": user_id, "phone_number": "0000000000", "is_admin": False})
+    headers = {"Authorization": f"Bearer {token}"}
+
+    import main
+
+    await main.startup()
+    try:
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://stress", headers=headers, timeout=60) as client:
+            return await fire(client, user_id, args.bookings)
+    finally:
+        await main.shutdown()
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--riders", type=int, default=50)
+    parser.add_argument("--bookings", type=int, default=1000)
+    parser.add_argument("--keep", action="store_true", help="Leave the test rows in place for inspection")
+    args = parser.parse_args()
+
+    user_id = setup(args.riders)
+    try:
+        statuses, elapsed = asyncio.run(run(args, user_id))
+        doubles, not_busy, booked, queued = verify(user_id)
+    finally:
+        if not args.keep:
+            cleanup(user_id)
+
+    print(f"{args.bookings} bookings against {args.riders} riders in {elapsed:.2f}s ({args.bookings / elapsed:.0f} req/s)")
+    print(f"responses: {dict(sorted(statuses.items()))}")
+    print(f"bookings made: {booked} ({queued} still queued), double-assigned: {len(doubles)}, booked but not Busy: {len(not_busy)}")
+
+    if doubles or not_busy:
+        sys.exit("FAIL: a rider was assigned more than once")
+    print("OK: no rider was double-assigned")
+
+if __name__ == "__main__":
+    main_cli()
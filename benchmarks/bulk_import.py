@@ -0,0 +1,106 @@
+"""Throughput of COPY-based bulk import vs. the per-row insert path.
+
+Generates synthetic users (each with one rider) and loads them twice: once
+the way ``register_user``/``register_rider`` do it (hash, INSERT, commit per
+row) and once through ``app.database.bulk_import``::
+
+    BCRYPT_ROUNDS=4 python -m benchmarks.bulk_import --rows 20000
+
+bcrypt dominates both paths at production cost, so lower ``BCRYPT_ROUNDS``
+to see the database side, or leave it at 12 to see the parallel hashing
+win. Test rows are deleted afterwards. Needs Postgres.
+"""
+import argparse
+import io
+import json
+import sys
+import time
+
+from app.database.bulk_import import IMPORT_HASH_WORKERS, run_import
+from app.database.db import get_db_connection
+from app.utils.auth import BCRYPT_ROUNDS, hash_password
+
+PHONE_PREFIX = "BULK"
+CENTER = (10.7769, 106.7009)
+
+def users_csv(rows, offset):
+    lines = ["name,phone_number,password"]
+    lines += [f"Bulk User {i},{PHONE_PREFIX}{i:012d},password{i}" for i in range(offset, offset + rows)]
+    return "\n".join(lines) + "\n"
+
+def riders_ndjson(rows, offset):
+    return "".join(
+        json.dumps({
+            "user_phone_number": f"{PHONE_PREFIX}{i:012d}",
+            "vehicle_type": "Bulk",
+            "license_plate": f"{PHONE_PREFIX}-{i}",
+            "latitude": CENTER[0] + (i % 1000) * 1e-4,
+            "longitude": CENTER[1] + (i // 1000 % 1000) * 1e-4,
+        }) + "\n"
+        for i in range(offset, offset + rows)
+    )
+
+def per_row(rows, offset):
+    """The existing path: one hash, one INSERT and one commit per row."""
+    conn = get_db_connection()
+    if not conn:
+        sys.exit("Database connection failed")
+    started = time.perf_counter()
+    try:
+        with conn.cursor() as cursor:
+            for i in range(offset, offset + rows):
+                cursor.execute(
+                    "INSERT INTO users (name, phone_number, password) VALUES (%s, %s, %s) RETURNING id",
+                    (f"Bulk User {i}", f"{PHONE_PREFIX}{i:012d}", hash_password(f"password{i}")),
+                )
+                user_id = cursor.fetchone()[0]
+                conn.commit()
+                cursor.execute(
+                    "INSERT INTO riders (user_id, vehicle_type, license_plate, status, latitude, longitude) VALUES (%s, 'Bulk', %s, 'Available', %s, %s)",
+                    (user_id, f"{PHONE_PREFIX}-{i}", CENTER[0] + (i % 1000) * 1e-4, CENTER[1] + (i // 1000 % 1000) * 1e-4),
+                )
+                conn.commit()
+    finally:
+        conn.close()
+    return time.perf_counter() - started
+
+def bulk(rows, offset, hash_workers):
+    started = time.perf_counter()
+    users = run_import("users", io.StringIO(users_csv(rows, offset)), "csv", hash_workers=hash_workers)
+    riders = run_import("riders", io.StringIO(riders_ndjson(rows, offset)), "ndjson")
+    return time.perf_counter() - started, users, riders
+
+def cleanup():
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("DELETE FROM riders WHERE license_plate LIKE %s", (PHONE_PREFIX + "-%",))
+            cursor.execute("DELETE FROM users WHERE phone_number LIKE %s", (PHONE_PREFIX + "%",))
+        conn.commit()
+    finally:
+        conn.close()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=20000, help="Users (and riders) loaded by the bulk path")
+    parser.add_argument("--per-row-rows", type=int, default=1000, help="Rows for the slower per-row baseline")
+    parser.add_argument("--hash-workers", type=int, default=IMPORT_HASH_WORKERS)
+    args = parser.parse_args()
+
+    print(f"bcrypt rounds: {BCRYPT_ROUNDS}, hash workers: {args.hash_workers}")
+    cleanup()
+    try:
+        baseline = per_row(args.per_row_rows, 0)
+        elapsed, users, riders = bulk(args.rows, args.per_row_rows, args.hash_workers)
+    finally:
+        cleanup()
+
+    baseline_rate = args.per_row_rows / baseline
+    bulk_rate = args.rows / elapsed
+    print(f"per-row: {args.per_row_rows} users+riders in {baseline:.2f}s ({baseline_rate:.0f} rows/s)")
+    print(f"bulk:    {args.rows} users+riders in {elapsed:.2f}s ({bulk_rate:.0f} rows/s), {bulk_rate / baseline_rate:.1f}x")
+    print(f"users:   {users['inserted']} inserted in {users['seconds']}s, {users['invalid']} invalid")
+    print(f"riders:  {riders['inserted']} inserted in {riders['seconds']}s, {riders['invalid']} invalid")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,340 @@
+"""Mixed-traffic load test for the booking hot path.
+
+Loads a throw-away fleet of users and riders, then runs a weighted mix of
+logins, ``POST /rides/book``, status polls, ride completions and rider
+status flips at a fixed concurrency for a fixed time::
+
+    python -m benchmarks.load_test --concurrency 200 --duration 30
+    python -m benchmarks.load_test --mix book=40,status=60 --json run.json
+    python -m benchmarks.load_test --baseline run.json
+
+Reports throughput, latency percentiles and status codes per endpoint. If
+the ``pg_stat_statements`` extension is available it also measures how
+many queries each endpoint issues (from a short sequential calibration
+pass) and which statements dominated the run. The app from ``main.py`` is
+driven in-process unless ``--url`` points at a running server using the
+same database. Needs Postgres (``docker compose up db`` is enough) and
+``httpx``; test rows are removed afterwards.
+"""
+import argparse
+import asyncio
+import io
+import json
+import random
+import sys
+import time
+from collections import Counter, deque
+
+import httpx
+
+from app.database.bulk_import import run_import
+from app.database.db import get_db_connection
+from app.utils.auth import create_jwt_token, hash_password
+from benchmarks.results import compare, save
+
+PHONE_PREFIX = "LOAD"
+PASSWORD = "load-test-password"
+CENTER = (10.7769, 106.7009)
+# Riders used for status flips sit in another city so bookings never pick them.
+FLIP_CENTER = (21.0285, 105.8542)
+DEFAULT_MIX = "login=5,book=15,status=55,complete=10,rider_flip=15"
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        if name not in OPERATIONS:
+            raise SystemExit(f"Unknown operation {name!r}; choose from {', '.join(OPERATIONS)}")
+        mix[name] = float(weight or 1)
+    return mix
+
+def setup(user_count, rider_count, flip_count):
+    password_hash = hash_password(PASSWORD)
+    users = "".join(
+        json.dumps({"name": f"Load User {i}", "phone_number": f"{PHONE_PREFIX}{i:08d}", "password_hash": password_hash}) + "\n"
+        for i in range(user_count)
+    )
+    riders = []
+    for i in range(rider_count + flip_count):
+        center = CENTER if i < rider_count else FLIP_CENTER
+        riders.append(json.dumps({
+            "user_phone_number": f"{PHONE_PREFIX}{i % user_count:08d}",
+            "vehicle_type": "Load",
+            "license_plate": f"{PHONE_PREFIX}-{i}",
+            "latitude": center[0] + random.uniform(-0.05, 0.05),
+            "longitude": center[1] + random.uniform(-0.05, 0.05),
+        }) + "\n")
+    run_import("users", io.StringIO(users), "ndjson", hash_workers=1)
+    run_import("riders", io.StringIO("".join(riders)), "ndjson")
+
+    conn = get_db_connection()
+    if not conn:
+        sys.exit("Database connection failed")
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT id, phone_number FROM users WHERE phone_number LIKE %s ORDER BY id", (PHONE_PREFIX + "%",))
+            users = cursor.fetchall()
+            cursor.execute(
+                "SELECT id FROM riders WHERE license_plate LIKE %s AND latitude > %s ORDER BY id",
+                (PHONE_PREFIX + "-%", (CENTER[0] + FLIP_CENTER[0]) / 2),
+            )
+            flip_riders = [row[0] for row in cursor.fetchall()]
+        return users, flip_riders
+    finally:
+        conn.close()
+
+def cleanup():
+    conn = get_db_connection()
+    if not conn:
+        sys.exit("Database connection failed")
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("DELETE FROM bookings WHERE user_id IN (SELECT id FROM users WHERE phone_number LIKE %s)", (PHONE_PREFIX + "%",))
+            cursor.execute("DELETE FROM riders WHERE license_plate LIKE %s", (PHONE_PREFIX + "-%",))
+            cursor.execute("DELETE FROM users WHERE phone_number LIKE %s", (PHONE_PREFIX + "%",))
+        conn.commit()
+    finally:
+        conn.close()
+
+class QueryCounter:
+    """Reads statement counts from ``pg_stat_statements`` for this database, if it is installed."""
+
+    def __init__(self):
+        self.conn = get_db_connection()
+        self.conn.autocommit = True
+        self.available = False
+        try:
+            with self.conn.cursor() as cursor:
+                cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_stat_statements")
+                cursor.execute("SELECT 1 FROM pg_stat_statements LIMIT 1")
+            self.available = True
+        except Exception as e:
+            print(f"❌ pg_stat_statements unavailable, query counts skipped ({str(e).strip()})")
+            print("   Start Postgres with -c shared_preload_libraries=pg_stat_statements to enable them.")
+
+    def snapshot(self):
+        """``{query: (calls, total_ms)}`` for statements run against the current database."""
+        with self.conn.cursor() as cursor:
+            cursor.execute("""
+                SELECT query, sum(calls), sum(total_exec_time) FROM pg_stat_statements
+                WHERE dbid = (SELECT oid FROM pg_database WHERE datname = current_database())
+                GROUP BY query
+            """)
+            return {query: (int(calls), float(total_ms)) for query, calls, total_ms in cursor.fetchall()}
+
+    @staticmethod
+    def diff(before, after):
+        delta = {}
+        for query, (calls, total_ms) in after.items():
+            previous_calls, previous_ms = before.get(query, (0, 0.0))
+            if calls > previous_calls and "pg_stat_statements" not in query:
+                delta[query] = (calls - previous_calls, total_ms - previous_ms)
+        return delta
+
+    def close(self):
+        self.conn.close()
+
+class LoadState:
+    def __init__(self, users, flip_riders):
+        self.users = users
+        self.tokens = {
+            user_id: create_jwt_token({"user_id": user_id, "phone_number": phone_number, "is_admin": False})
+            for user_id, phone_number in users
+        }
+        self.flip_status = {rider_id: "Available" for rider_id in flip_riders}
+        self.bookings = deque(maxlen=10000)  # recent bookings, for status polls
+        self.open_bookings = deque()  # oldest first, for completions
+
+    def user(self):
+        return random.choice(self.users)
+
+    def auth(self, user_id):
+        return {"Authorization": f"Bearer {self.tokens[user_id]}"}
+
+async def op_login(client, state):
+    _, phone_number = state.user()
+    return await client.post("/users/login", json={"phone_number": phone_number, "password": PASSWORD})
+
+async def op_book(client, state):
+    user_id, _ = state.user()
+    payload = {
+        "user_id": user_id,
+        "distance": random.randint(1, 10),
+        "pickup_latitude": CENTER[0] + random.uniform(-0.05, 0.05),
+        "pickup_longitude": CENTER[1] + random.uniform(-0.05, 0.05),
+    }
+    response = await client.post("/rides/book", json=payload, headers=state.auth(user_id))
+    if response.status_code == 200:
+        booking = response.json()
+        state.bookings.append((booking["id"], user_id))
+        state.open_bookings.append((booking["id"], user_id))
+    return response
+
+async def op_status(client, state):
+    if not state.bookings:
+        return await op_book(client, state)
+    booking_id, user_id = random.choice(state.bookings)
+    return await client.get(f"/rides/{booking_id}/status", headers=state.auth(user_id))
+
+async def op_complete(client, state):
+    if not state.open_bookings:
+        return await op_book(client, state)
+    booking_id, user_id = state.open_bookings.popleft()
+    return await client.patch(f"/rides/{booking_id}/status", json={"status": "Completed"}, headers=state.auth(user_id))
+
+async def op_rider_flip(client, state):
+    if not state.flip_status:
+        return await op_status(client, state)
+    rider_id = random.choice(list(state.flip_status))
+    status = "Busy" if state.flip_status[rider_id] == "Available" else "Available"
+    state.flip_status[rider_id] = status
+    return await client.patch(f"/riders/{rider_id}/status", json={"status": status})
+
+OPERATIONS = {
+    "login": op_login,
+    "book": op_book,
+    "status": op_status,
+    "complete": op_complete,
+    "rider_flip": op_rider_flip,
+}
+
+class Recorder:
+    def __init__(self):
+        self.latencies = {name: [] for name in OPERATIONS}
+        self.statuses = {name: Counter() for name in OPERATIONS}
+
+    async def call(self, name, client, state):
+        started = time.perf_counter()
+        try:
+            response = await OPERATIONS[name](client, state)
+            status = response.status_code
+        except httpx.HTTPError as e:
+            status = type(e).__name__
+        self.latencies[name].append(time.perf_counter() - started)
+        self.statuses[name][status] += 1
+
+def percentile(sorted_values, fraction):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+async def calibrate(client, state, mix, counter, requests):
+    """Runs each operation alone, sequentially, and divides the statement count by the request count."""
+    per_request = {}
+    recorder = Recorder()
+    # OPERATIONS order puts book before complete, so completions have rides to finish.
+    for name in [name for name in OPERATIONS if name in mix]:
+        before = counter.snapshot()
+        for _ in range(requests):
+            await recorder.call(name, client, state)
+        delta = QueryCounter.diff(before, counter.snapshot())
+        per_request[name] = round(sum(calls for calls, _ in delta.values()) / requests, 2)
+    return per_request
+
+async def drive(client, state, mix, concurrency, duration):
+    recorder = Recorder()
+    names, weights = list(mix), list(mix.values())
+    deadline = time.perf_counter() + duration
+
+    async def worker():
+        while time.perf_counter() < deadline:
+            await recorder.call(random.choices(names, weights)[0], client, state)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return recorder, time.perf_counter() - started
+
+async def run(args, state, mix, counter):
+    app_main = None
+    if args.url:
+        transport = None
+        base_url = args.url
+    else:
+        import main as app_main
+
+        await app_main.startup()
+        transport = httpx.ASGITransport(app=app_main.app)
+        base_url = "http://load"
+
+    try:
+        limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+        async with httpx.AsyncClient(transport=transport, base_url=base_url, timeout=60, limits=limits) as client:
+            queries_per_request = await calibrate(client, state, mix, counter, args.calibrate) if counter.available else {}
+            before = counter.snapshot() if counter.available else {}
+            recorder, elapsed = await drive(client, state, mix, args.concurrency, args.duration)
+            statements = QueryCounter.diff(before, counter.snapshot()) if counter.available else {}
+        return recorder, elapsed, queries_per_request, statements
+    finally:
+        if app_main is not None:
+            await app_main.shutdown()
+
+def summarize(recorder, elapsed, queries_per_request):
+    results = {}
+    print(f"\n{'endpoint':<12} {'requests':>9} {'req/s':>9} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'max ms':>9} {'queries':>8}  statuses")
+    for name, latencies in recorder.latencies.items():
+        if not latencies:
+            continue
+        ordered = sorted(latencies)
+        result = {
+            "requests": len(ordered),
+            "requests_per_second": round(len(ordered) / elapsed, 1),
+            "p50_ms": round(1000 * percentile(ordered, 0.50), 3),
+            "p90_ms": round(1000 * percentile(ordered, 0.90), 3),
+            "p99_ms": round(1000 * percentile(ordered, 0.99), 3),
+            "max_ms": round(1000 * ordered[-1], 3),
+            "queries_per_request": queries_per_request.get(name),
+            "statuses": {str(status): count for status, count in sorted(recorder.statuses[name].items(), key=str)},
+        }
+        results[name] = result
+        queries = "-" if result["queries_per_request"] is None else f"{result['queries_per_request']:.2f}"
+        print(f"{name:<12} {result['requests']:>9} {result['requests_per_second']:>9.1f} {result['p50_ms']:>9.2f} "
+              f"{result['p90_ms']:>9.2f} {result['p99_ms']:>9.2f} {result['max_ms']:>9.2f} {queries:>8}  {result['statuses']}")
+
+    total = sum(result["requests"] for result in results.values())
+    print(f"\n{total} requests in {elapsed:.2f}s ({total / elapsed:.0f} req/s overall)")
+    return results
+
+def print_statements(statements, limit=10):
+    if not statements:
+        return
+    print(f"\nTop statements during the run (of {sum(calls for calls, _ in statements.values())} executed):")
+    for query, (calls, total_ms) in sorted(statements.items(), key=lambda item: -item[1][0])[:limit]:
+        text = " ".join(query.split())
+        print(f"  {calls:>8} calls {total_ms / calls:>8.3f} ms avg  {text[:100]}")
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--duration", type=float, default=20, help="Seconds of mixed traffic")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"Operation weights (default {DEFAULT_MIX})")
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--riders", type=int, default=300)
+    parser.add_argument("--flip-riders", type=int, default=50)
+    parser.add_argument("--calibrate", type=int, default=20, help="Sequential requests per endpoint when counting queries")
+    parser.add_argument("--url", help="Load a running server instead of the in-process app")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", help="Write results to this file")
+    parser.add_argument("--baseline", help="Compare against results saved earlier with --json")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    mix = parse_mix(args.mix)
+
+    cleanup()
+    users, flip_riders = setup(args.users, args.riders, args.flip_riders)
+    state = LoadState(users, flip_riders)
+    counter = QueryCounter()
+    try:
+        recorder, elapsed, queries_per_request, statements = asyncio.run(run(args, state, mix, counter))
+    finally:
+        counter.close()
+        cleanup()
+
+    results = summarize(recorder, elapsed, queries_per_request)
+    print_statements(statements)
+    if args.json:
+        save(args.json, results)
+    if args.baseline:
+        compare(results, args.baseline, "p50_ms")
+        compare(results, args.baseline, "requests_per_second", lower_is_better=False)
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,106 @@
+"""Microbenchmarks for the code on the booking hot path.
+
+Times fare calculation, surge quotes, nearest-rider lookup in the spatial index and the
+auth helpers in-process, with no database::
+
+    python -m benchmarks.micro
+    python -m benchmarks.micro --json micro.json
+    python -m benchmarks.micro --baseline micro.json   # flag >10% regressions
+
+Each benchmark reports the best of several repeats in microseconds per call.
+"""
+import argparse
+import asyncio
+import json
+import random
+import timeit
+
+from app.routes.ride_routes import find_nearest_available_riders
+from app.services.pricing import calculate_fare, calculate_fares, quote_fares
+from app.services.spatial_index import rider_index
+from app.services.surge import surge_engine
+from app.utils import auth
+from benchmarks.results import compare, save
+
+CENTER = (10.7769, 106.7009)
+
+def bench(name, func, number, repeat=5, batch=1):
+    """``batch`` is how many operations one call of ``func`` performs."""
+    best = min(timeit.repeat(func, number=number, repeat=repeat)) / (number * batch)
+    result = {"us_per_call": round(best * 1e6, 3), "calls_per_second": round(1 / best, 1)}
+    print(f"{name:<45} {result['us_per_call']:>12.3f} us/call {result['calls_per_second']:>14.0f} calls/s")
+    return result
+
+def populate_riders(count, available_share=0.7):
+    rider_index.clear()
+    for rider_id in range(1, count + 1):
+        rider_index.upsert(
+            rider_id,
+            CENTER[0] + random.uniform(-0.2, 0.2),
+            CENTER[1] + random.uniform(-0.2, 0.2),
+            available=random.random() < available_share,
+        )
+
+def run(args):
+    random.seed(42)
+    results = {}
+
+    distances = [random.randint(1, 30) for _ in range(10000)]
+    results["calculate_fare"] = bench("calculate_fare", lambda: calculate_fare(7), 200000)
+    results["calculate_fares[10k]"] = bench("calculate_fares (10k distances)", lambda: calculate_fares(distances), 200)
+    pairs = [(CENTER[0], CENTER[1], CENTER[0] + random.uniform(-0.1, 0.1), CENTER[1] + random.uniform(-0.1, 0.1)) for _ in range(10000)]
+    results["quote_fares[10k]"] = bench("quote_fares (10k pairs)", lambda: quote_fares(pairs), 100)
+
+    for count in args.riders:
+        populate_riders(count)
+        pickups = [(CENTER[0] + random.uniform(-0.2, 0.2), CENTER[1] + random.uniform(-0.2, 0.2)) for _ in range(1000)]
+        cycle = iter(pickups * 1000)
+        results[f"find_nearest_available_riders[{count}]"] = bench(
+            f"find_nearest_available_riders ({count} riders)",
+            lambda: find_nearest_available_riders(*next(cycle)),
+            5000,
+        )
+        demand = [[*rider_index.cells_near(lat, lon, 0)[0], 3] for lat, lon in pickups]
+        surge_engine.handle_notification(json.dumps({"cells": demand}))
+        results[f"surge_multiplier[{count}]"] = bench(
+            f"surge_engine.multiplier ({count} riders)",
+            lambda: surge_engine.multiplier(*next(cycle)),
+            20000,
+        )
+    rider_index.clear()
+
+    token = auth.create_jwt_token({"user_id": 1, "phone_number": "0000000000", "is_admin": False})
+    results["create_jwt_token"] = bench("create_jwt_token", lambda: auth.create_jwt_token({"user_id": 1, "phone_number": "0000000000", "is_admin": False}), 5000)
+    results["decode_token"] = bench("decode_token (uncached)", lambda: auth._decode_token(token), 5000)
+
+    async def cached_lookups(n):
+        for _ in range(n):
+            await auth.get_current_user(token)
+
+    loop = asyncio.new_event_loop()
+    try:
+        results["get_current_user[cached]"] = bench("get_current_user (cached)", lambda: loop.run_until_complete(cached_lookups(1000)), 20, batch=1000)
+    finally:
+        loop.close()
+
+    hashed = auth.hash_password("password123")
+    results[f"hash_password[rounds={auth.BCRYPT_ROUNDS}]"] = bench(f"hash_password (rounds={auth.BCRYPT_ROUNDS})", lambda: auth.hash_password("password123"), args.bcrypt_calls, repeat=3)
+    results[f"verify_password[rounds={auth.BCRYPT_ROUNDS}]"] = bench(f"verify_password (rounds={auth.BCRYPT_ROUNDS})", lambda: auth.verify_password("password123", hashed), args.bcrypt_calls, repeat=3)
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--riders", type=int, nargs="+", default=[1000, 10000, 100000], help="Fleet sizes for the nearest-rider lookup")
+    parser.add_argument("--bcrypt-calls", type=int, default=5)
+    parser.add_argument("--json", help="Write results to this file")
+    parser.add_argument("--baseline", help="Compare against results saved earlier with --json")
+    args = parser.parse_args()
+
+    results = run(args)
+    if args.json:
+        save(args.json, results)
+    if args.baseline:
+        compare(results, args.baseline, "us_per_call")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,25 @@
+"""Saving benchmark results and comparing them with an earlier run."""
+import json
+
+def save(path, results):
+    with open(path, "w") as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+    print(f"✅ Results written to {path}")
+
+def compare(results, baseline_path, metric, lower_is_better=True):
+    """Prints how ``metric`` moved per benchmark since ``baseline_path``, flagging changes over 10%."""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+
+    print(f"\nChange in {metric} vs {baseline_path}:")
+    for name, current in results.items():
+        before = baseline.get(name, {}).get(metric)
+        now = current.get(metric)
+        if not before or now is None:
+            print(f"  {name:<40} (no baseline)")
+            continue
+        change = (now - before) / before * 100
+        worse = change > 10 if lower_is_better else change < -10
+        better = change < -10 if lower_is_better else change > 10
+        flag = "  REGRESSION" if worse else "  improved" if better else ""
+        print(f"  {name:<40} {before:>12.3f} -> {now:>12.3f} ({change:+.1f}%){flag}")
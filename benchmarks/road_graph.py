@@ -0,0 +1,119 @@
+"""Query latency of the road-graph ETA engine.
+
+Builds a synthetic street grid (or loads a graph file) and times
+point-to-point routes (local rides and cross-city trips) with and without
+the ALT landmark tables against a full Dijkstra, one-to-many
+pickup ETAs, and both again once the per-node caches are warm::
+
+    python -m benchmarks.road_graph --grid 300x300
+    python -m benchmarks.road_graph --graph data/roads.npz --json roads.json
+    python -m benchmarks.road_graph --baseline roads.json
+
+Routes are checked against a plain scipy Dijkstra so a speedup never hides
+a wrong answer. No database needed.
+"""
+import argparse
+import random
+import statistics
+import time
+
+from scipy.sparse.csgraph import dijkstra
+
+from app.services.road_graph import RoadGraph, RouteEngine, synthetic_grid
+from app.utils.geo import haversine_km
+from benchmarks.results import compare, save
+
+def timed(func, *args):
+    started = time.perf_counter()
+    result = func(*args)
+    return result, 1000 * (time.perf_counter() - started)
+
+def summarize(name, timings_ms):
+    ordered = sorted(timings_ms)
+    result = {
+        "p50_ms": round(statistics.median(ordered), 3),
+        "p95_ms": round(ordered[int(0.95 * (len(ordered) - 1))], 3),
+        "max_ms": round(ordered[-1], 3),
+    }
+    print(f"{name:<36} p50 {result['p50_ms']:>9.3f} ms   p95 {result['p95_ms']:>9.3f} ms   max {result['max_ms']:>9.3f} ms")
+    return result
+
+def run(args):
+    rng = random.Random(42)
+    if args.graph:
+        graph = RoadGraph.load(args.graph)
+    else:
+        rows, cols = (int(part) for part in args.grid.lower().split("x"))
+        graph = synthetic_grid(rows, cols)
+        graph.build_landmarks(args.landmarks)
+    print(f"Graph: {graph.node_count} nodes, {graph.edge_count} edges, {0 if graph.from_landmarks is None else len(graph.from_landmarks)} landmarks\n")
+
+    pairs = [(rng.randrange(graph.node_count), rng.randrange(graph.node_count)) for _ in range(args.queries)]
+    # Typical rides: destinations within --local-km of the pickup.
+    local_pairs = []
+    while len(local_pairs) < args.queries:
+        source, target = rng.randrange(graph.node_count), rng.randrange(graph.node_count)
+        if haversine_km(graph.latitude[source], graph.longitude[source], graph.latitude[target], graph.longitude[target]) <= args.local_km:
+            local_pairs.append((source, target))
+    results = {}
+
+    for label, sample in (("local", local_pairs), ("cross_city", pairs)):
+        routed, plain, reference = [], [], []
+        landmarks = (graph.from_landmarks, graph.to_landmarks)
+        for source, target in sample:
+            route, ms = timed(graph.shortest_path, source, target)
+            routed.append(ms)
+            expected, ms = timed(lambda: dijkstra(graph.csgraph(), indices=source)[target])
+            reference.append(ms)
+            if route is None or abs(route.seconds - expected) > 1e-3 * max(expected, 1):
+                raise AssertionError(f"Route {source}->{target} took {route} but Dijkstra says {expected:.3f}s")
+        graph.from_landmarks = graph.to_landmarks = None
+        for source, target in sample[: max(len(sample) // 4, 1)]:
+            plain.append(timed(graph.shortest_path, source, target)[1])
+        graph.from_landmarks, graph.to_landmarks = landmarks
+
+        results[f"route_{label}"] = summarize(f"route {label}, landmarks", routed)
+        results[f"route_{label}_no_landmarks"] = summarize(f"route {label}, no landmarks", plain)
+        results[f"route_{label}_full_dijkstra"] = summarize(f"route {label}, full scipy Dijkstra", reference)
+
+    engine = RouteEngine(path="", cache_size=args.queries * 2, pickup_cache_size=args.hot_pickups)
+    engine.load(graph)
+    points = [(graph.latitude[node], graph.longitude[node]) for node in range(graph.node_count)]
+    hot = [points[rng.randrange(graph.node_count)] for _ in range(args.hot_pickups)]
+    cold, warm = [], []
+    for i in range(args.queries):
+        pickup = hot[i % len(hot)]
+        riders = [points[rng.randrange(graph.node_count)] for _ in range(args.riders_per_pickup)]
+        _, ms = timed(engine.pickup_etas, pickup[0], pickup[1], riders)
+        (cold if i < len(hot) else warm).append(ms)
+    results["pickup_etas_cold"] = summarize(f"pickup ETAs x{args.riders_per_pickup}, cold", cold)
+    results["pickup_etas_cached"] = summarize(f"pickup ETAs x{args.riders_per_pickup}, cached", warm)
+
+    warm = []
+    for source, target in pairs:
+        engine.route(*points[source], *points[target])
+        warm.append(timed(engine.route, *points[source], *points[target])[1])
+    results["route_cached"] = summarize("route, cached", warm)
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--grid", default="300x300", help="Synthetic grid size as ROWSxCOLS")
+    parser.add_argument("--graph", help="Load this .npz instead of building a grid")
+    parser.add_argument("--landmarks", type=int, default=8)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--local-km", type=float, default=5.0)
+    parser.add_argument("--hot-pickups", type=int, default=20)
+    parser.add_argument("--riders-per-pickup", type=int, default=24)
+    parser.add_argument("--json", help="Write results to this file")
+    parser.add_argument("--baseline", help="Compare against results saved earlier with --json")
+    args = parser.parse_args()
+
+    results = run(args)
+    if args.json:
+        save(args.json, results)
+    if args.baseline:
+        compare(results, args.baseline, "p50_ms")
+
+if __name__ == "__main__":
+    main()
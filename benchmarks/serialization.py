@@ -0,0 +1,194 @@
+"""Requests per second per core of the hot read endpoints, before and after the orjson row path.
+
+Serves the real ``GET /rides/{id}/status``, ``GET /riders/{id}`` and
+``GET /admin/rides`` routes next to copies of their previous handlers (row
+dicts -> Pydantic model -> ``response_model`` validation -> stdlib JSON) and
+calls both through the ASGI interface in-process, one request at a time::
+
+    python -m benchmarks.serialization
+    python -m benchmarks.serialization --page-size 1000 --json serialization.json
+    python -m benchmarks.serialization --baseline serialization.json
+
+Throughput is requests per CPU-second of this single process, i.e. per core.
+Status and rider lookups are served from a warmed lookup cache, as most are
+in production; admin pages get a canned connection from the pool in place of a real one,
+so the numbers cover everything but the query itself. No database needed.
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from fastapi import Depends, FastAPI, HTTPException, Query, Response
+from psycopg2.extras import RealDictCursor
+
+from app.database.db import db_pool, get_db
+from app.models.admin import RideResponse as AdminRideResponse
+from app.models.booking import RideResponse
+from app.models.rider import RiderResponse
+from app.routes import admin_routes, ride_routes, rider_routes
+from app.routes.admin_routes import RIDE_COLUMNS, admin_required
+from app.services.lookup_cache import lookup_cache, ride_key, rider_key
+from app.utils.auth import create_jwt_token, get_current_user
+from benchmarks.results import compare, save
+
+CENTER = (10.7769, 106.7009)
+
+bench_app = FastAPI()
+bench_app.include_router(ride_routes.router, prefix="/rides")
+bench_app.include_router(rider_routes.router, prefix="/riders")
+bench_app.include_router(admin_routes.router, prefix="/admin")
+
+# The previous handlers, kept here only as the baseline.
+@bench_app.get("/before/rides/{booking_id}/status", response_model=RideResponse)
+async def get_ride_status_before(booking_id: int, current_user: dict = Depends(get_current_user)):
+    booking = await lookup_cache.get_or_load(ride_key(booking_id), lambda: None)
+    if not booking:
+        raise HTTPException(status_code=404, detail="Booking not found")
+    return RideResponse(**booking)
+
+@bench_app.get("/before/riders/{rider_id}", response_model=RiderResponse)
+async def get_rider_before(rider_id: int):
+    rider = await lookup_cache.get_or_load(rider_key(rider_id), lambda: None)
+    if not rider:
+        raise HTTPException(status_code=404, detail="Rider not found")
+    return RiderResponse(**rider)
+
+@bench_app.get("/before/admin/rides", response_model=list[AdminRideResponse])
+def get_rides_before(
+    response: Response,
+    after_id: int = 0,
+    limit: int = Query(default=100, ge=1, le=1000),
+    current_user: dict = Depends(admin_required),
+    conn=Depends(get_db),
+):
+    cursor = conn.cursor(cursor_factory=RealDictCursor)
+    cursor.execute(*admin_routes._keyset_query("bookings", RIDE_COLUMNS, {}, after_id, limit))
+    rows = cursor.fetchall()
+    if len(rows) == limit:
+        response.headers["X-Next-After-Id"] = str(rows[-1]["id"])
+    return rows
+
+class CannedCursor:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def execute(self, query, params=None):
+        pass
+
+    def fetchall(self):
+        return self.rows
+
+    def close(self):
+        pass
+
+class CannedConnection:
+    """Hands out the same page of rides, as dicts to RealDictCursor callers and as tuples to the rest."""
+
+    def __init__(self, rows):
+        self.tuples = rows
+        self.dicts = [dict(zip(RIDE_COLUMNS, row)) for row in rows]
+
+    def cursor(self, cursor_factory=None):
+        return CannedCursor(self.dicts if cursor_factory is RealDictCursor else self.tuples)
+
+def ride_row(booking_id):
+    return (
+        booking_id, random.randint(1, 10**6), random.randint(1, 10**5), random.choice(["Pending", "In Progress", "Completed"]),
+        random.randint(1, 30), random.randint(15, 300) * 1000,
+        CENTER[0] + random.uniform(-0.1, 0.1), CENTER[1] + random.uniform(-0.1, 0.1),
+    )
+
+async def warm_cache(count):
+    for i in range(1, count + 1):
+        await lookup_cache.backend.set(ride_key(i), dict(zip(RIDE_COLUMNS, ride_row(i))), 3600)
+        await lookup_cache.backend.set(rider_key(i), {
+            "id": i, "user_id": i, "vehicle_type": "Bike", "license_plate": f"59A1-{i:05d}", "status": "Available",
+            "latitude": CENTER[0] + random.uniform(-0.1, 0.1), "longitude": CENTER[1] + random.uniform(-0.1, 0.1),
+        }, 3600)
+
+async def asgi_get(target, headers):
+    """One GET through the ASGI interface; returns the status code."""
+    path, _, query = target.partition("?")
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET", "scheme": "http",
+        "path": path, "raw_path": path.encode(), "query_string": query.encode(), "root_path": "",
+        "headers": headers, "client": ("127.0.0.1", 50000), "server": ("127.0.0.1", 8000),
+    }
+    status = None
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+
+    await bench_app(scope, receive, send)
+    return status
+
+async def throughput(targets, headers, seconds):
+    for target in targets[:50]:  # warm-up
+        status = await asgi_get(target, headers)
+        if status != 200:
+            raise SystemExit(f"GET {target} returned {status}")
+
+    requests = 0
+    started_wall = time.perf_counter()
+    started_cpu = time.process_time()
+    while time.perf_counter() - started_wall < seconds:
+        for target in targets:
+            await asgi_get(target, headers)
+        requests += len(targets)
+    cpu = time.process_time() - started_cpu
+    return {"rps_per_core": round(requests / cpu, 1), "us_per_request": round(1e6 * cpu / requests, 1)}
+
+async def run(args):
+    random.seed(42)
+    if not hasattr(lookup_cache, "backend"):
+        raise SystemExit("Set LOOKUP_CACHE_BACKEND=memory (or redis) to benchmark cached lookups")
+    await warm_cache(args.keys)
+    # Swapped in on the pool itself: FastAPI re-resolves every dependency per request once any override is set.
+    canned = CannedConnection([ride_row(i) for i in range(1, args.page_size + 1)])
+    db_pool.getconn = lambda: canned
+    db_pool.putconn = lambda conn: None
+
+    token = create_jwt_token({"user_id": 1, "phone_number": "bench", "is_admin": True})
+    headers = [(b"authorization", f"Bearer {token}".encode())]
+    ids = [random.randint(1, args.keys) for _ in range(1000)]
+    endpoints = {
+        "ride_status": ("/rides/{}/status", "/before/rides/{}/status"),
+        "rider": ("/riders/{}", "/before/riders/{}"),
+        f"admin_rides[{args.page_size}]": (f"/admin/rides?limit={args.page_size}", f"/before/admin/rides?limit={args.page_size}"),
+    }
+
+    results = {}
+    print(f"{'endpoint':<24}{'before req/s':>14}{'after req/s':>14}{'speedup':>10}")
+    for name, (after, before) in endpoints.items():
+        measured = {}
+        for label, template in (("before", before), ("after", after)):
+            targets = [template.format(key) for key in ids[:100]]
+            measured[label] = await throughput(targets, headers, args.seconds)
+            results[f"{name}_{label}"] = measured[label]
+        speedup = measured["after"]["rps_per_core"] / measured["before"]["rps_per_core"]
+        print(f"{name:<24}{measured['before']['rps_per_core']:>14.0f}{measured['after']['rps_per_core']:>14.0f}{speedup:>9.2f}x")
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seconds", type=float, default=3.0, help="Measuring time per endpoint and variant")
+    parser.add_argument("--keys", type=int, default=10000, help="Cached rides and riders to spread lookups over")
+    parser.add_argument("--page-size", type=int, default=100)
+    parser.add_argument("--json", help="Write results to this file")
+    parser.add_argument("--baseline", help="Compare against results saved earlier with --json")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    if args.json:
+        save(args.json, results)
+    if args.baseline:
+        compare(results, args.baseline, "rps_per_core", lower_is_better=False)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""Cold-start time, per-worker memory and shutdown time of the gunicorn profile.
+
+Measures how long ``import main`` takes in a fresh interpreter, then boots
+``gunicorn -c gunicorn.conf.py`` with and without ``preload_app`` and
+reports time until the first request succeeds, the memory of each worker
+and how long a SIGTERM takes to drain::
+
+    python -m benchmarks.startup --workers 4
+    python -m benchmarks.startup --json startup.json
+    python -m benchmarks.startup --baseline startup.json
+
+Memory comes from /proc/<pid>/smaps_rollup (Linux): RSS counts pages shared
+with the master in full, PSS splits them between the processes sharing them
+and USS is what a worker alone holds. PSS and USS are where preloading shows
+up. Needs Postgres, since workers connect on startup.
+"""
+import argparse
+import os
+import signal
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+
+from benchmarks.results import compare, save
+
+IMPORT_SNIPPET = "import time; started = time.perf_counter(); import main; print(time.perf_counter() - started)"
+
+def import_seconds(runs):
+    timings = []
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, "-c", IMPORT_SNIPPET], capture_output=True, text=True, check=True).stdout
+        timings.append(float(output.strip().splitlines()[-1]))
+    return timings
+
+def memory_mb(pid):
+    """``{"rss": ..., "pss": ..., "uss": ...}`` in MB for one process."""
+    fields = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) >= 2 and parts[1].isdigit():
+                fields[parts[0].rstrip(":")] = int(parts[1])
+    uss = fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0)
+    return {"rss": fields.get("Rss", 0) / 1024, "pss": fields.get("Pss", 0) / 1024, "uss": uss / 1024}
+
+def children(pid):
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            return [int(child) for child in f.read().split()]
+    except FileNotFoundError:
+        return []
+
+def wait_until_serving(url, workers, master_pid, timeout):
+    """Seconds until the first 200 from ``url`` with every worker forked, or None if the server died first."""
+    started = time.perf_counter()
+    while time.perf_counter() - started < timeout:
+        if not os.path.exists(f"/proc/{master_pid}"):
+            return None
+        try:
+            with urllib.request.urlopen(url, timeout=1) as response:
+                if response.status == 200 and len(children(master_pid)) >= workers:
+                    return time.perf_counter() - started
+        except OSError:
+            pass
+        time.sleep(0.02)
+    return None
+
+def measure_server(preload, workers, port, settle, timeout):
+    env = {**os.environ, "GUNICORN_PRELOAD": "true" if preload else "false", "WEB_CONCURRENCY": str(workers), "PORT": str(port)}
+    process = subprocess.Popen([sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "main:app"], env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    try:
+        ready = wait_until_serving(f"http://127.0.0.1:{port}/", workers, process.pid, timeout)
+        if ready is None:
+            process.kill()
+            raise RuntimeError(f"gunicorn did not start:\n{process.communicate()[1][-2000:]}")
+
+        time.sleep(settle)  # let the remaining workers finish their startup handlers
+        master = memory_mb(process.pid)
+        worker_memory = [memory_mb(pid) for pid in children(process.pid)]
+
+        stopping = time.perf_counter()
+        process.send_signal(signal.SIGTERM)
+        process.wait(timeout=timeout)
+        shutdown = time.perf_counter() - stopping
+    finally:
+        if process.poll() is None:
+            process.kill()
+
+    def mean(key):
+        return round(statistics.mean(memory[key] for memory in worker_memory), 2)
+
+    return {
+        "ready_seconds": round(ready, 3),
+        "shutdown_seconds": round(shutdown, 3),
+        "workers": len(worker_memory),
+        "master_rss_mb": round(master["rss"], 2),
+        "worker_rss_mb": mean("rss"),
+        "worker_pss_mb": mean("pss"),
+        "worker_uss_mb": mean("uss"),
+        "total_pss_mb": round(master["pss"] + sum(memory["pss"] for memory in worker_memory), 2),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--import-runs", type=int, default=5)
+    parser.add_argument("--settle", type=float, default=2.0, help="Seconds to wait after the first response before reading memory")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--skip-server", action="store_true", help="Only time the import (no Postgres needed)")
+    parser.add_argument("--json", help="Write results to this file")
+    parser.add_argument("--baseline", help="Compare against results saved earlier with --json")
+    args = parser.parse_args()
+
+    results = {}
+    timings = import_seconds(args.import_runs)
+    results["import_main"] = {"seconds": round(statistics.median(timings), 4), "min_seconds": round(min(timings), 4)}
+    print(f"{'import main':<20} median {results['import_main']['seconds']:.3f} s, best {results['import_main']['min_seconds']:.3f} s")
+
+    if not args.skip_server:
+        for preload in (True, False):
+            name = "gunicorn_preload" if preload else "gunicorn_no_preload"
+            result = results[name] = measure_server(preload, args.workers, args.port, args.settle, args.timeout)
+            print(
+                f"{name:<20} ready {result['ready_seconds']:.2f} s, shutdown {result['shutdown_seconds']:.2f} s, "
+                f"per worker RSS {result['worker_rss_mb']:.1f} MB / PSS {result['worker_pss_mb']:.1f} MB / USS {result['worker_uss_mb']:.1f} MB, "
+                f"total PSS {result['total_pss_mb']:.1f} MB"
+            )
+
+    if args.json:
+        save(args.json, results)
+    if args.baseline:
+        compare({"import_main": results["import_main"]}, args.baseline, "seconds")
+        for metric in ("ready_seconds", "worker_pss_mb", "shutdown_seconds"):
+            compare({name: result for name, result in results.items() if name != "import_main"}, args.baseline, metric)
+
+if __name__ == "__main__":
+    main()
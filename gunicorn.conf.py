@@ -0,0 +1,43 @@
+"""Production server profile: gunicorn preforking uvicorn workers.
+
+    gunicorn -c gunicorn.conf.py main:app
+
+The master applies migrations (and the sample data with SEED_DATABASE=true)
+once, imports the app, then forks the workers, which share the imported code
+copy-on-write and skip migrating on startup. Each worker still opens its own
+pools and rebuilds its own rider registry. Every worker holds up to
+DB_POOL_MAX_SIZE connections in each of its two pools plus one LISTEN
+connection, so keep WEB_CONCURRENCY * (2 * DB_POOL_MAX_SIZE + 1) under the
+server's max_connections.
+"""
+import multiprocessing
+import os
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+worker_class = "app.utils.worker.DrainingUvicornWorker"
+preload_app = os.getenv("GUNICORN_PRELOAD", "true").lower() == "true"
+
+# Seconds a worker gets after SIGTERM to finish requests and run its shutdown handlers.
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "60"))
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", "5"))
+# Recycle workers now and then so slow leaks cannot accumulate; jitter keeps them from restarting together.
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", "0"))
+max_requests_jitter = max_requests // 10
+
+raw_env = ["RUN_MIGRATIONS_ON_STARTUP=false"]
+accesslog = os.getenv("GUNICORN_ACCESS_LOG")  # e.g. "-" for stdout; off by default
+errorlog = "-"
+
+def on_starting(server):
+    from app.database.init_db import initialize
+
+    initialize(seed=os.getenv("SEED_DATABASE", "false").lower() == "true")
+
+def when_ready(server):
+    print(f"✅ Serving on {bind} with {server.num_workers} workers (preload={preload_app})")
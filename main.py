@@ -1,17 +1,66 @@
+import os
 from fastapi import FastAPI
-from app.routes import user_routes, rider_routes, ride_routes, admin_routes
-from app.database.init_db import create_tables
+from fastapi.concurrency import run_in_threadpool
+from app.routes import user_routes, rider_routes, ride_routes, admin_routes, metrics_routes
+from app.database.migrations import run_migrations
+from app.database.db import db_pool
+from app.database.async_db import async_db_pool
+from app.database.notify import pg_listener
+from app.services.booking_partitions import booking_partitions
+from app.services.dispatch_queue import dispatch_queue
+from app.services.idempotency import idempotency_store
+from app.services.location_ingest import location_ingestor
+from app.services.lookup_cache import lookup_cache
+from app.services.rider_registry import rider_registry
+from app.services.road_graph import route_engine
+from app.services.surge import surge_engine
+from app.utils.auth import load_revoked_tokens, shutdown_password_pool
+from app.utils.request_stats import RequestMetricsMiddleware
+
+# The gunicorn profile migrates once in the master process and turns this off for its workers.
+RUN_MIGRATIONS_ON_STARTUP = os.getenv("RUN_MIGRATIONS_ON_STARTUP", "true").lower() == "true"
 
 app = FastAPI()
+app.add_middleware(RequestMetricsMiddleware)
 
 @app.on_event("startup")
-def startup():
-    create_tables()
+async def startup():
+    if RUN_MIGRATIONS_ON_STARTUP:
+        await run_in_threadpool(run_migrations)
+    await run_in_threadpool(db_pool.open)
+    await async_db_pool.open()
+    async with async_db_pool.connection() as conn:
+        await rider_registry.rebuild(conn)
+        await dispatch_queue.rebuild(conn)
+    await run_in_threadpool(route_engine.load)
+    await pg_listener.start()
+    # After LISTEN is up, so a logout between the load and the first notification is not missed.
+    async with async_db_pool.connection() as conn:
+        await load_revoked_tokens(conn)
+    location_ingestor.start()
+    surge_engine.start()
+    idempotency_store.start()
+    booking_partitions.start()
+    dispatch_queue.start()
+
+@app.on_event("shutdown")
+async def shutdown():
+    await location_ingestor.stop()
+    await surge_engine.stop()
+    await idempotency_store.stop()
+    await booking_partitions.stop()
+    await dispatch_queue.stop()
+    await pg_listener.stop()
+    await lookup_cache.close()
+    await async_db_pool.close()
+    db_pool.closeall()
+    shutdown_password_pool()
 
 app.include_router(user_routes.router, prefix="/users", tags=["Users"])
 app.include_router(rider_routes.router, prefix="/riders", tags=["Riders"])
 app.include_router(ride_routes.router, prefix="/rides", tags=["Rides"])
 app.include_router(admin_routes.router, prefix="/admin", tags=["Admin"])
+app.include_router(metrics_routes.router, tags=["Metrics"])
 
 @app.get("/")
 def home():
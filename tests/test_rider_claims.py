@@ -0,0 +1,155 @@
+"""Rider claims under concurrency, against a real Postgres.
+
+Many bookings race for a handful of riders through the same claim path
+``POST /rides/book`` uses, and the test asserts that no rider ever ends up
+with more than one open booking, including across monthly partitions.
+Uses the database from ``.env`` (migrations are applied first) and is
+skipped when it cannot be reached::
+
+    python -m pytest tests
+"""
+import asyncio
+import random
+
+import asyncpg
+import pytest
+
+from app.database.config import DATABASE_CONFIG
+from app.models.booking import RideRequest
+from app.routes.ride_routes import book_with_nearest_rider
+from app.services.rider_registry import rider_registry
+
+PHONE_PREFIX = "CLAIMTEST"
+PLATE_PREFIX = "CLAIMTEST-"
+CENTER = (10.7769, 106.7009)
+
+def connect_kwargs():
+    config = dict(DATABASE_CONFIG)
+    if config.get("port"):
+        config["port"] = int(config["port"])
+    return config
+
+async def connect():
+    return await asyncpg.connect(**connect_kwargs())
+
+async def _ping():
+    conn = await connect()
+    await conn.close()
+
+@pytest.fixture(scope="module", autouse=True)
+def database():
+    try:
+        asyncio.run(_ping())
+    except (OSError, asyncpg.PostgresError, asyncpg.InterfaceError) as e:
+        pytest.skip(f"Postgres not reachable: {e}")
+
+    from app.database.migrations import run_migrations
+
+    run_migrations()
+
+async def setup(conn, riders):
+    user_id = await conn.fetchval(
+        "INSERT INTO users (name, phone_number, password) VALUES ('Claim Test', $1, 'x') RETURNING id",
+        f"{PHONE_PREFIX}{random.randrange(10**8):08d}",
+    )
+    rider_ids = [
+        await conn.fetchval(
+            """
+            INSERT INTO riders (user_id, vehicle_type, license_plate, status, latitude, longitude)
+            VALUES ($1, 'Bike', $2, 'Available', $3, $4) RETURNING id
+            """,
+            user_id, f"{PLATE_PREFIX}{random.randrange(10**6):06d}-{i}",
+            CENTER[0] + random.uniform(-0.01, 0.01), CENTER[1] + random.uniform(-0.01, 0.01),
+        )
+        for i in range(riders)
+    ]
+    return user_id, rider_ids
+
+async def cleanup(conn, user_id, rider_ids):
+    await conn.execute("DELETE FROM bookings WHERE user_id = $1", user_id)
+    await conn.execute("DELETE FROM riders WHERE id = ANY($1::int[])", rider_ids)
+    await conn.execute("DELETE FROM rider_stats WHERE rider_id = ANY($1::int[])", rider_ids)
+    await conn.execute("DELETE FROM user_stats WHERE user_id = $1", user_id)
+    await conn.execute("DELETE FROM users WHERE id = $1", user_id)
+
+async def doubly_assigned(conn, rider_ids):
+    rows = await conn.fetch(
+        """
+        SELECT rider_id FROM bookings
+        WHERE rider_id = ANY($1::int[]) AND status IN ('Pending', 'In Progress')
+        GROUP BY rider_id HAVING count(*) > 1
+        """,
+        rider_ids,
+    )
+    return [row["rider_id"] for row in rows]
+
+def test_concurrent_bookings_never_double_assign_a_rider():
+    async def run():
+        conn = await connect()
+        pool = await asyncpg.create_pool(min_size=10, max_size=40, **connect_kwargs())
+        user_id, rider_ids = await setup(conn, 10)
+        try:
+            await rider_registry.rebuild(conn)
+
+            async def book():
+                ride = RideRequest(
+                    user_id=user_id, distance=5,
+                    pickup_latitude=CENTER[0] + random.uniform(-0.01, 0.01),
+                    pickup_longitude=CENTER[1] + random.uniform(-0.01, 0.01),
+                )
+                async with pool.acquire() as booking_conn:
+                    try:
+                        return await book_with_nearest_rider(booking_conn, ride, 50000)
+                    except asyncpg.UniqueViolationError:
+                        return None  # the endpoint answers 409; never a second open booking
+
+            bookings = await asyncio.gather(*(book() for _ in range(200)))
+
+            assigned = [booking["rider_id"] for booking in bookings if booking is not None and booking["rider_id"] is not None]
+            assert len(assigned) == len(set(assigned)) <= len(rider_ids)
+            assert await doubly_assigned(conn, rider_ids) == []
+            not_busy = await conn.fetchval(
+                "SELECT count(*) FROM riders WHERE id = ANY($1::int[]) AND status <> 'Busy'", assigned,
+            )
+            assert not_busy == 0
+        finally:
+            await cleanup(conn, user_id, rider_ids)
+            await pool.close()
+            await conn.close()
+
+    asyncio.run(run())
+
+def test_open_booking_rule_holds_across_partitions():
+    async def run():
+        first, second = await connect(), await connect()
+        user_id, (rider_id,) = await setup(first, 1)
+        insert = """
+            INSERT INTO bookings (user_id, rider_id, status, distance, fare, created_at)
+            VALUES ($1, $2, 'Pending', 5, 50000, $3::timestamptz) RETURNING id
+        """
+        try:
+            await first.execute("SELECT ensure_booking_partitions(now() - interval '1 month', 2)")
+            this_month = await first.fetchval("SELECT now()")
+            last_month = await first.fetchval("SELECT now() - interval '1 month'")
+
+            # Two open bookings for one rider in different monthly partitions, racing each other.
+            transaction = first.transaction()
+            await transaction.start()
+            await first.fetchval(insert, user_id, rider_id, this_month)
+            racing = asyncio.ensure_future(second.fetchval(insert, user_id, rider_id, last_month))
+            await asyncio.sleep(0.2)
+            assert not racing.done()  # waits on the rider row the first claim holds
+            await transaction.commit()
+            with pytest.raises(asyncpg.UniqueViolationError):
+                await racing
+
+            # Closing the open booking frees the rider for the next one.
+            await first.execute("UPDATE bookings SET status = 'Completed' WHERE rider_id = $1", rider_id)
+            await second.fetchval(insert, user_id, rider_id, last_month)
+            assert await doubly_assigned(first, [rider_id]) == []
+        finally:
+            await cleanup(first, user_id, [rider_id])
+            await first.close()
+            await second.close()
+
+    asyncio.run(run())